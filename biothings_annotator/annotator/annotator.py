@@ -2,17 +2,22 @@
 Translator Node Annotator Service Handler
 """
 
-from collections import OrderedDict
 from typing import Dict, Iterable, List, Optional, Tuple, Union
+import asyncio
+import itertools
 import logging
 import os
+import time
 
 import biothings_client
 
+from biothings_annotator.annotator import transformer
 from biothings_annotator.annotator.exceptions import InvalidCurieError, InvalidQueryBackendError, TRAPIInputError
+from biothings_annotator.annotator.instrumentation import count_event, current_stage_timings, record_plan, stage
+from biothings_annotator.annotator.metrics import BACKEND_REQUEST_DURATION, BACKEND_REQUEST_ERRORS, BACKEND_REQUEST_SIZE
 from biothings_annotator.annotator.settings import (
+    ANNOTATION_PLAN_LOG_COST,
     ANNOTATOR_CLIENTS,
-    BIOLINK_PREFIX_to_BioThings,
     ELASTICSEARCH_CONNECTION,
     QUERY_BACKEND,
     QUERY_BACKEND_ALIASES,
@@ -20,19 +25,45 @@ from biothings_annotator.annotator.settings import (
     SERVICE_PROVIDER_API_HOST,
     SUPPORTED_QUERY_BACKENDS,
 )
+from biothings_annotator.annotator.planner import AnnotationPlan, QueryBatch, build_annotation_plan
+from biothings_annotator.annotator.projection import ALL_FIELDS, project_extra_fields, project_fields
+from biothings_annotator.annotator.resolver import CurieResolver, get_resolver
+from biothings_annotator.annotator.scheduler import SchedulerFlow, get_scheduler
+from biothings_annotator.annotator.trapi import TRAPI_ATTRIBUTE_TYPE_ID, TRAPI_NODES
 from biothings_annotator.annotator.transformer import ResponseTransformer, load_atc_cache
 from biothings_annotator.annotator.utils import (
     batched,
     get_client,
-    get_dotfield_value,
     get_query_client,
     group_by_subfield,
-    parse_curie,
 )
 
 logger = logging.getLogger(__name__)
 
 
+def _limit_nodes(node_d: Dict, limit: int, limited_node_d: Dict) -> Iterable[str]:
+    """
+    Yields the ids of the first limit nodes of node_d, copying the nodes into
+    limited_node_d as they are consumed
+    """
+    for node_id, node in itertools.islice(node_d.items(), max(limit, 0)):
+        limited_node_d[node_id] = node
+        yield node_id
+
+
+async def _gather_or_cancel(*awaitables) -> List:
+    """
+    asyncio.gather that cancels the remaining awaitables once one of them fails
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
 class Annotator:
     def __init__(self, query_backend: Optional[str] = None):
         self.api_host = os.environ.get("SERVICE_PROVIDER_API_HOST", SERVICE_PROVIDER_API_HOST)
@@ -45,6 +76,7 @@ class Annotator:
             except InvalidQueryBackendError:
                 self.query_backend = deployment_backend
         self.elasticsearch_connection = os.environ.get("ELASTICSEARCH_CONNECTION", ELASTICSEARCH_CONNECTION).strip()
+        self.scheduler_flow = SchedulerFlow()
 
     @staticmethod
     def _normalize_query_backend(query_backend: str) -> str:
@@ -64,21 +96,82 @@ class Annotator:
             return f"{self.query_backend}:{self.elasticsearch_connection}"
         return f"{self.query_backend}:{self.api_host}"
 
+    @property
+    def resolver(self) -> CurieResolver:
+        return get_resolver(self.query_backend)
+
     def _default_scopes(self, node_type: str) -> Union[str, List[str]]:
         """Return the backend-appropriate default query scopes for a node type."""
-        client_settings = ANNOTATOR_CLIENTS[node_type]
-        if self.query_backend == "elasticsearch":
-            return client_settings.get("elasticsearch_scopes", client_settings["scopes"])
-        return client_settings["scopes"]
+        return self.resolver.default_scopes(node_type)
 
     def _scopes_for_prefix(self, node_type: str, prefix: str) -> Union[str, List[str]]:
         """Return prefix-specific scopes using exact ES fields when configured."""
-        prefix_settings = BIOLINK_PREFIX_to_BioThings.get(prefix, {})
-        if self.query_backend == "elasticsearch":
-            elasticsearch_scopes = prefix_settings.get("elasticsearch_scopes")
-            if elasticsearch_scopes:
-                return elasticsearch_scopes
-        return prefix_settings.get("scopes") or self._default_scopes(node_type)
+        return self.resolver.scopes_for_prefix(node_type, prefix)
+
+    async def _scheduled_chunks(self, query_method, query_list: List[str], node_type: str, **query_kwargs) -> List:
+        """
+        Run query_method through the worker's fair query scheduler. Large
+        query lists are split into chunks that compete for backend slots with
+        the chunks of concurrent requests. Returns the response of every chunk,
+        in the order of query_list
+
+        The duration and size of every backend call are recorded in the backend
+        metrics of node_type, and every call runs as a backend_call stage
+        """
+        scheduler = get_scheduler()
+        metric_labels = {"query_backend": self.query_backend, "node_type": node_type}
+
+        async def _query_chunk(query_chunk: List[str]):
+            async with scheduler.slot(self.scheduler_flow, scheduler.chunk_cost(query_chunk)):
+                BACKEND_REQUEST_SIZE.observe(len(query_chunk), **metric_labels)
+                started = time.perf_counter()
+                try:
+                    with stage("backend_call", node_type=node_type, size=len(query_chunk)):
+                        return await query_method(query_chunk, **query_kwargs)
+                except Exception:
+                    BACKEND_REQUEST_ERRORS.inc(**metric_labels)
+                    raise
+                finally:
+                    BACKEND_REQUEST_DURATION.observe(time.perf_counter() - started, **metric_labels)
+
+        query_chunks = scheduler.chunk(query_list)
+        if len(query_chunks) == 1:
+            return [await _query_chunk(query_chunks[0])]
+        return await _gather_or_cancel(*(_query_chunk(query_chunk) for query_chunk in query_chunks))
+
+    async def _scheduled_querymany(self, client, query_list: List[str], node_type: str, **query_kwargs) -> List[Dict]:
+        """
+        Run client.querymany through the query scheduler, see _scheduled_chunks.
+        The flattened hits keep the order of query_list
+        """
+        chunk_responses = await self._scheduled_chunks(client.querymany, query_list, node_type, **query_kwargs)
+        if len(chunk_responses) == 1:
+            return chunk_responses[0]
+        return list(itertools.chain.from_iterable(chunk_responses))
+
+    async def _scheduled_querymany_grouped(self, client, query_list: List[str], node_type: str, **query_kwargs) -> Dict:
+        """
+        Run a querymany through the query scheduler and return the hits grouped
+        by query id. Clients providing querymany_grouped (the Elasticsearch
+        adapter) group the hits while parsing the backend response, the hits of
+        the BioThings client are grouped with group_by_subfield
+        """
+        querymany_grouped = getattr(client, "querymany_grouped", None)
+        if querymany_grouped is None:
+
+            async def querymany_grouped(query_chunk: List[str], **chunk_kwargs) -> Dict:
+                return group_by_subfield(await client.querymany(query_chunk, **chunk_kwargs), search_key="query")
+
+        chunk_responses = await self._scheduled_chunks(querymany_grouped, query_list, node_type, **query_kwargs)
+        grouped_response = chunk_responses[0]
+        for chunk_response in chunk_responses[1:]:
+            for query_id, hits in chunk_response.items():
+                query_hits = grouped_response.get(query_id, None)
+                if query_hits is None:
+                    grouped_response[query_id] = hits
+                else:
+                    query_hits.extend(hits)
+        return grouped_response
 
     async def query_biothings(
         self, node_type: str, query_list: List[str], fields: Optional[Union[str, List[str]]] = None
@@ -127,11 +220,42 @@ class Annotator:
         fields = fields or ANNOTATOR_CLIENTS[node_type].get("fields", "all")
         scopes = scopes or self._default_scopes(node_type)
         logger.info("Querying %s annotations for %s %ss...", self.query_backend, len(query_list), node_type)
-        res = await client.querymany(query_list, scopes=scopes, fields=fields)
-        logger.info("Done. %s %s annotation objects returned.", len(res), self.query_backend)
-        grouped_response = group_by_subfield(collection=res, search_key="query")
+        if not query_list:
+            return {}
+        with stage("query", node_type=node_type, query_backend=self.query_backend, batch_size=len(query_list)) as span:
+            grouped_response = await self._scheduled_querymany_grouped(
+                client, query_list, node_type, scopes=scopes, fields=fields
+            )
+            if span.is_recording():
+                span.set_attribute("groups", len(grouped_response))
+                span.set_attribute("hits", sum(len(hits) for hits in grouped_response.values()))
+        logger.info("Done. %s annotation groups returned by %s.", len(grouped_response), self.query_backend)
         return grouped_response
 
+    async def _load_atc_mapping(self) -> Dict:
+        """
+        Returns the WHO ATC code-to-name mapping of the query backend, loading it
+        on first use. An empty mapping is returned when it cannot be loaded
+        """
+        try:
+            atc_client = get_query_client(
+                node_type="extra",
+                query_backend=self.query_backend,
+                api_host=self.api_host,
+                elasticsearch_connection=self.elasticsearch_connection,
+            )
+            if atc_client is None or not hasattr(atc_client, "query"):
+                logger.warning("Failed to get the extra annotation query client. ATC enrichment is skipped.")
+                return {}
+            cache_key = self.atc_cache_key
+            cache_hit = cache_key in transformer.atc_cache
+            count_event("atc_cache_hits" if cache_hit else "atc_cache_misses")
+            with stage("atc_mapping", cache_hit=cache_hit):
+                return await load_atc_cache(self.api_host, atc_client=atc_client, cache_key=cache_key)
+        except Exception as exc:
+            logger.warning("Unable to load WHO ATC code-to-name mapping; skipping ATC enrichment: %r", exc)
+            return {}
+
     async def transform(self, res_by_id: Dict, node_type: str):
         """
         perform any transformation on the annotation object, but in-place also returned object
@@ -140,36 +264,28 @@ class Annotator:
         logger.info("Transforming output annotations for %s %ss...", len(res_by_id), node_type)
         atc_cache = {}
         if node_type == "chem":
-            try:
-                atc_client = get_query_client(
-                    node_type="extra",
-                    query_backend=self.query_backend,
-                    api_host=self.api_host,
-                    elasticsearch_connection=self.elasticsearch_connection,
-                )
-                if atc_client is None or not hasattr(atc_client, "query"):
-                    logger.warning("Failed to get the extra annotation query client. ATC enrichment is skipped.")
-                else:
-                    atc_cache = await load_atc_cache(self.api_host, atc_client=atc_client, cache_key=self.atc_cache_key)
-            except Exception as exc:
-                logger.warning("Unable to load WHO ATC code-to-name mapping; skipping ATC enrichment: %r", exc)
-        transformer = ResponseTransformer(res_by_id, node_type, self.api_host, atc_cache)
-        transformer.transform()
+            atc_cache = await self._load_atc_mapping()
+        with stage("transform", node_type=node_type, groups=len(res_by_id)):
+            ResponseTransformer(res_by_id, node_type, self.api_host, atc_cache).transform()
         logger.info("Done.")
         return res_by_id
 
     async def append_extra_annotations(
-        self, node_d: Dict, node_id_subset: Optional[List[str]] = None, batch_n: int = 1000
+        self,
+        node_d: Dict,
+        node_id_subset: Optional[List[str]] = None,
+        batch_n: int = 1000,
+        fields: Union[str, List[str]] = ALL_FIELDS,
     ):
         """
-        Append extra annotations to the existing node_d
+        Append extra annotations to the existing node_d, fetching only the given
+        fields of the extra annotation documents
         """
         node_id_list = list(node_d.keys() if node_id_subset is None else node_id_subset)
         if not node_id_list:
             logger.info("No extra annotations requested.")
             return
 
-        cnt = 0
         logger.info("Retrieving extra annotations...")
         try:
             extra_api = get_query_client(
@@ -185,12 +301,27 @@ class Annotator:
             logger.warning("Failed to get the extra annotation query client. Extra annotations are skipped.")
             return
 
+        with stage("extra", query_backend=self.query_backend, batch_size=len(node_id_list)) as span:
+            cnt = await self._merge_extra_annotations(extra_api, node_d, node_id_list, batch_n, fields)
+            span.set_attribute("hits", cnt)
+        logger.info("Done. %s extra annotations appended.", cnt)
+
+    async def _merge_extra_annotations(
+        self, extra_api, node_d: Dict, node_id_list: List[str], batch_n: int, fields: Union[str, List[str]]
+    ) -> int:
+        """
+        Query the extra annotations of node_id_list by batch and merge them into
+        node_d, returns the number of merged extra annotations
+        """
+        cnt = 0
         for node_id_batch in batched(node_id_list, batch_n):
             try:
-                extra_res = await extra_api.querymany(node_id_batch, scopes="_id", fields="all")
+                extra_res = await self._scheduled_querymany(
+                    extra_api, list(node_id_batch), "extra", scopes="_id", fields=fields
+                )
             except Exception as exc:
                 logger.warning("Unable to retrieve extra annotations. Extra annotations are skipped: %r", exc)
-                return
+                return cnt
             for hit in extra_res:
                 if hit.get("notfound", False):
                     continue
@@ -199,18 +330,18 @@ class Annotator:
                     if node_id and node_id in node_d:
                         hit.pop("_id", None)
                         hit.pop("_score", None)
+                        # node ids sharing a query id share their annotation objects (see execute_plan),
+                        # merge into copies so the extra annotations of one node id don't leak to its aliases
                         _res = node_d[node_id]
                         if isinstance(_res, dict):
-                            _res.update(hit)
+                            node_d[node_id] = {**_res, **hit}
                         elif isinstance(_res, list):
-                            for _r in _res:
-                                if isinstance(_r, dict):
-                                    _r.update(hit)
+                            node_d[node_id] = [{**_r, **hit} if isinstance(_r, dict) else _r for _r in _res]
                         else:
                             # should not happen
                             logger.error("Invalid node_d entry: %s (type: %s)", _res, type(_res))
                         cnt += 1
-        logger.info("Done. %s extra annotations appended.", cnt)
+        return cnt
 
     async def annotate_curie(
         self, curie: str, raw: bool = False, fields: Optional[Union[str, List[str]]] = None, include_extra: bool = True
@@ -218,74 +349,107 @@ class Annotator:
         """
         Annotate a single curie id
         """
-        node_type, _id = parse_curie(curie)
-        if not node_type:
+        resolved = self.resolver.resolve(curie)
+        if resolved.scope_key is None:
             raise InvalidCurieError(curie)
 
-        prefix = curie.split(":", 1)[0]
-        scopes = self._scopes_for_prefix(node_type, prefix)
-        res = await self.query_annotations(node_type, [_id], fields=fields, scopes=scopes)
+        node_type, _id = resolved.node_type, resolved.query_id
+        scopes = self.resolver.scopes(resolved.scope_key)
+        projection = project_fields(node_type, fields, raw=raw)
+        res = await self.query_annotations(node_type, [_id], fields=projection.source_fields, scopes=scopes)
 
         if not raw:
-            res = await self.transform(res, node_type)
+            res = projection.prune(await self.transform(res, node_type))
 
         if res and include_extra and node_type == "chem":
-            await self.append_extra_annotations(res)
+            await self.append_extra_annotations(res, fields=project_extra_fields(fields))
 
         curie_annotation = {curie: res.get(_id, {})}
         return curie_annotation
 
-    def _group_curies_by_scopes(
-        self, node_type: str, node_list: List[str]
-    ) -> List[Tuple[Union[str, List[str]], List[str]]]:
-        """
-        Group curies of the same node_type by their backend-appropriate querymany
-        scopes. Prefix-specific groups prevent incompatible identifiers from being
-        queried against fields such as the numeric Elasticsearch "retired" field.
-        """
-        groups: "OrderedDict[Union[str, Tuple[str, ...]], List[str]]" = OrderedDict()
-        scopes_by_key: Dict[Union[str, Tuple[str, ...]], Union[str, List[str]]] = {}
-        for curie in node_list:
-            prefix = curie.split(":", 1)[0]
-            scopes = self._scopes_for_prefix(node_type, prefix)
-            key = tuple(scopes) if isinstance(scopes, list) else scopes
-            groups.setdefault(key, []).append(curie)
-            scopes_by_key[key] = scopes
-        return [(scopes_by_key[key], curies) for key, curies in groups.items()]
-
-    async def _annotate_node_list_by_type(
-        self, node_list_by_type: Dict, raw: bool = False, fields: Optional[Union[str, List[str]]] = None
-    ) -> Iterable[tuple]:
-        """
-        This is a helper method re-used in both annotate_curie_list and annotate_trapi methods
-        It returns a generator of tuples of (original_node_id, annotation_object) for each node_id,
-        passed via node_list_by_type.
-        """
-        for node_type, node_list in node_list_by_type.items():
-            if node_type not in ANNOTATOR_CLIENTS or not node_list_by_type[node_type]:
-                # skip for now
-                continue
-
-            # this is the list of original node ids like NCBIGene:1017, should be a unique list
-            node_list = node_list_by_type[node_type]
-
-            for scopes, scoped_node_list in self._group_curies_by_scopes(node_type, node_list):
-                # this is the list of query ids like 1017
-                query_list = [parse_curie(_id, return_type=False, return_id=True) for _id in scoped_node_list]
-
-                # query_id to original id mapping
-                node_id_d = dict(zip(query_list, scoped_node_list))
-                res_by_id = await self.query_annotations(node_type, query_list, fields=fields, scopes=scopes)
-                if not raw:
-                    res_by_id = await self.transform(res_by_id, node_type)
-
-                # map back to original node ids
-                # NOTE: we don't want to use `for node_id in res_by_id:` here, since we will mofiify res_by_id in the loop
-                for node_id in list(res_by_id.keys()):
-                    orig_node_id = node_id_d[node_id]
-                    if node_id != orig_node_id:
-                        res_by_id[orig_node_id] = res_by_id.pop(node_id)
-                    yield (orig_node_id, res_by_id[orig_node_id])
+    def plan_annotation(
+        self,
+        node_list: Iterable[str],
+        raw: bool = False,
+        fields: Optional[Union[str, List[str]]] = None,
+        include_extra: bool = True,
+    ) -> AnnotationPlan:
+        """
+        This is the planning stage shared by annotate_curie_list and annotate_trapi.
+        The unique curies are partitioned by node type and scope group into backend
+        batches, so incompatible identifiers are never queried against fields such
+        as the numeric Elasticsearch "retired" field. Unsupported curies are logged
+        and skipped, expensive plans are logged with their summary
+        """
+        resolver = self.resolver
+        collecting = current_stage_timings() is not None
+        with stage("plan", query_backend=self.query_backend) as span:
+            recording = span.is_recording()
+            resolve_hits = resolver.resolve.cache_info().hits if recording or collecting else 0
+            plan = build_annotation_plan(resolver, node_list, raw=raw, fields=fields, include_extra=include_extra)
+            if recording or collecting:
+                curie_cache_hits = resolver.resolve.cache_info().hits - resolve_hits
+            if recording:
+                span.set_attribute(
+                    "curies", sum(len(batch.scope_group) for batch in plan.batches) + len(plan.unsupported)
+                )
+                span.set_attribute("batches", len(plan.batches))
+                span.set_attribute("unsupported", len(plan.unsupported))
+                span.set_attribute("estimated_cost", plan.estimated_cost)
+                span.set_attribute("curie_cache_hits", curie_cache_hits)
+        if collecting:
+            record_plan(plan, curie_cache_hits)
+        for node_id in plan.unsupported:
+            logger.warning("Unsupported Curie prefix: %s. Skipped!", node_id)
+        if plan.estimated_cost >= ANNOTATION_PLAN_LOG_COST:
+            logger.info("Expensive annotation plan: %s", plan.explain())
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Annotation plan: %s", plan.explain())
+        return plan
+
+    async def _query_batch(self, batch: QueryBatch) -> Dict:
+        query_list = batch.query_ids
+        if batch.scope_group.aliases:
+            logger.debug(
+                "Collapsed %s %s curies into %s unique query ids.",
+                len(batch.scope_group),
+                batch.node_type,
+                len(query_list),
+            )
+        return await self.query_annotations(
+            batch.node_type, query_list, fields=batch.projection.source_fields, scopes=batch.scopes
+        )
+
+    async def execute_plan(self, plan: AnnotationPlan) -> Dict:
+        """
+        Run the backend batches of an annotation plan and return the annotation
+        objects by original node id, for the node ids with at least one hit.
+
+        The batches are queried concurrently, bounded by the worker's query
+        scheduler, while the WHO ATC mapping needed to transform chem hits is
+        loaded alongside them. Extra annotations are left to the caller
+        (see AnnotationPlan.extra_node_ids) as they are appended in place
+        """
+        batch_queries = [self._query_batch(batch) for batch in plan.batches]
+        if plan.transform and "chem" in plan.node_types:
+            *batch_responses, _ = await _gather_or_cancel(*batch_queries, self._load_atc_mapping())
+        else:
+            batch_responses = await _gather_or_cancel(*batch_queries)
+
+        node_d = {}
+        for batch, res_by_id in zip(plan.batches, batch_responses):
+            if plan.transform:
+                res_by_id = batch.projection.prune(await self.transform(res_by_id, batch.node_type))
+
+            # fan the annotations back out to the original node ids like NCBIGene:1017. Node ids
+            # sharing a query id share the same annotation object, the extra annotations are
+            # merged into copies per node id (see _merge_extra_annotations)
+            scope_group = batch.scope_group
+            for query_id, res in res_by_id.items():
+                node_d[scope_group.node_ids[query_id]] = res
+                for orig_node_id in scope_group.aliases_of(query_id):
+                    node_d[orig_node_id] = res
+        return node_d
 
     async def annotate_curie_list(
         self,
@@ -297,92 +461,93 @@ class Annotator:
         """
         Annotate a list of curie ids
         """
-        node_list_by_type = {}
-        node_d = OrderedDict()  # a dictionary to hold all annotations by each curie id
-        for node_id in curie_list:
-            node_d[node_id] = {}  # create a placeholder for each curie id
-            node_type = parse_curie(node_id, return_type=True, return_id=False)
-            if node_type:
-                if node_type not in node_list_by_type:
-                    node_list_by_type[node_type] = [node_id]
-                else:
-                    node_list_by_type[node_type].append(node_id)
-            else:
-                logger.warning("Unsupported Curie prefix: %s. Skipped!", node_id)
-
-        async for node_id, res in self._annotate_node_list_by_type(node_list_by_type, raw=raw, fields=fields):
-            node_d[node_id] = res
-
-        if include_extra:
-            # currently, we only need to append extra annotations for chem nodes
-            await self.append_extra_annotations(node_d, node_id_subset=node_list_by_type.get("chem", []))
+        # a dictionary to hold all annotations by each curie id, repeated curies are annotated once
+        node_d = dict.fromkeys(curie_list)
+        plan = self.plan_annotation(node_d, raw=raw, fields=fields, include_extra=include_extra)
+        node_d.update(await self.execute_plan(plan))
+
+        # curies without any annotation get an empty placeholder
+        for node_id, res in node_d.items():
+            if res is None:
+                node_d[node_id] = {}
+
+        if plan.include_extra:
+            await self.append_extra_annotations(node_d, node_id_subset=plan.extra_node_ids, fields=plan.extra_fields)
         return node_d
 
-    async def annotate_trapi(
+    async def annotate_trapi_nodes(
         self,
         trapi_input: Dict,
-        append: bool = False,
         raw: bool = False,
         fields: Optional[Union[str, List[str]]] = None,
         limit: Optional[int] = None,
         include_extra: bool = True,
-    ) -> Dict:
+    ) -> Tuple[Dict, Dict]:
         """
-        Annotate a TRAPI input message with node annotator annotations
+        Annotate the nodes of a TRAPI input message without placing the annotations.
+        Returns the annotated nodes (the first limit nodes if limit is set) and the
+        annotations by node id, see place_trapi_annotations
         """
         try:
-            node_d = get_dotfield_value("message.knowledge_graph.nodes", trapi_input)
+            node_d = TRAPI_NODES.get(trapi_input)
             assert isinstance(node_d, dict)
         except (KeyError, ValueError, AssertionError) as access_error:
             raise TRAPIInputError(trapi_input) from access_error
 
-        # if limit is set, we truncate the node_d to that size
+        # if limit is set, only the first limit nodes are annotated and returned. The truncated
+        # node_d is filled while the plan consumes the node ids, in the same pass
+        node_ids = node_d
         if limit:
-            _node_d = {}
-            i = 0
-            for node_id in node_d:
-                i += 1
-                if i > limit:
-                    break
-                _node_d[node_id] = node_d[node_id]
-            node_d = _node_d
-            del i, _node_d
-
-        node_list_by_type = {}
-        for node_id in node_d:
-            node_type = parse_curie(node_id, return_type=True, return_id=False)
-            if node_type:
-                if node_type not in node_list_by_type:
-                    node_list_by_type[node_type] = [node_id]
-                else:
-                    node_list_by_type[node_type].append(node_id)
-            else:
-                logger.warning("Unsupported Curie prefix: %s. Skipped!", node_id)
+            limited_node_d = {}
+            node_ids = _limit_nodes(node_d, limit, limited_node_d)
+            node_d = limited_node_d
+
+        plan = self.plan_annotation(node_ids, raw=raw, fields=fields, include_extra=include_extra)
+        _node_d = await self.execute_plan(plan)
 
-        _node_d = {}
-        async for node_id, res in self._annotate_node_list_by_type(node_list_by_type, raw=raw, fields=fields):
-            _node_d[node_id] = res
+        if plan.include_extra:
+            await self.append_extra_annotations(_node_d, node_id_subset=plan.extra_node_ids, fields=plan.extra_fields)
+        return node_d, _node_d
 
-        if include_extra:
-            # currently, we only need to append extra annotations for chem nodes
-            await self.append_extra_annotations(_node_d, node_id_subset=node_list_by_type.get("chem", []))
+    @staticmethod
+    def place_trapi_annotations(node_d: Dict, annotations: Dict, append: bool = False) -> Dict:
+        """
+        Place the annotation objects back to the original node_d as TRAPI attributes
+        """
+        with stage("trapi_attributes", nodes=len(annotations), append=bool(append)):
+            Annotator._place_trapi_attributes(node_d, annotations, append)
+        return node_d
 
-        # place the annotation objects back to the original node_d as TRAPI attributes
-        for node_id, res in _node_d.items():
+    @staticmethod
+    def _place_trapi_attributes(node_d: Dict, annotations: Dict, append: bool) -> None:
+        for node_id, res in annotations.items():
             res = {
-                "attribute_type_id": "biothings_annotations",
+                "attribute_type_id": TRAPI_ATTRIBUTE_TYPE_ID,
                 "value": res,
             }
 
-            node_attributes = node_d[node_id].get("attributes", None)
-            if node_attributes is None:
-                node_d[node_id]["attributes"] = []
-
-            if append:
+            node = node_d[node_id]
+            node_attributes = node.get("attributes", None)
+            if append and node_attributes is not None:
                 # append annotations to existing "attributes" field
-                node_d[node_id]["attributes"].append(res)
+                node_attributes.append(res)
             else:
                 # return annotations only
-                node_d[node_id]["attributes"] = [res]
+                node["attributes"] = [res]
 
-        return node_d
+    async def annotate_trapi(
+        self,
+        trapi_input: Dict,
+        append: bool = False,
+        raw: bool = False,
+        fields: Optional[Union[str, List[str]]] = None,
+        limit: Optional[int] = None,
+        include_extra: bool = True,
+    ) -> Dict:
+        """
+        Annotate a TRAPI input message with node annotator annotations
+        """
+        node_d, annotations = await self.annotate_trapi_nodes(
+            trapi_input, raw=raw, fields=fields, limit=limit, include_extra=include_extra
+        )
+        return self.place_trapi_annotations(node_d, annotations, append=append)
@@ -16,6 +16,7 @@ class ElasticsearchAnnotatorClient:
     subset the annotator calls today:
 
     * querymany(query_list, scopes, fields=None, size=None)
+    * querymany_grouped(query_list, scopes, fields=None, size=None)
     * query(query, fields=None, fetch_all=False, size=None, skip=0)
 
     Unsupported BioThings conveniences like species, facets, as_dataframe,
@@ -66,7 +67,46 @@ class ElasticsearchAnnotatorClient:
         query_size = self.query_size if size is None else size
         results = []
         for query_batch in self._iter_batches(query_list, self.query_batch_size):
-            results.extend(await self._querymany_batch(query_batch, scopes=scopes, fields=fields, size=query_size))
+            batch_hits = await self._querymany_batch(query_batch, scopes=scopes, fields=fields, size=query_size)
+            for query_id, hits in zip(query_batch, batch_hits):
+                if hits:
+                    results.extend(hits)
+                else:
+                    results.append({"query": query_id, "notfound": True})
+
+        return results
+
+    async def querymany_grouped(
+        self,
+        query_list: Iterable[str],
+        scopes: Union[str, List[str]],
+        fields: Optional[Union[str, List[str]]] = None,
+        size: Optional[int] = None,
+    ) -> Dict[str, List[Dict]]:
+        """
+        querymany with the hits grouped by query id, as group_by_subfield(querymany(...), "query")
+        would group them.
+
+        Every msearch sub-response belongs to one known query id, so the hits are
+        appended to their group as they are formatted instead of being flattened
+        and regrouped afterwards.
+        """
+        query_list = list(query_list)
+        if not query_list:
+            return {}
+
+        query_size = self.query_size if size is None else size
+        results: Dict[str, List[Dict]] = {}
+        for query_batch in self._iter_batches(query_list, self.query_batch_size):
+            batch_hits = await self._querymany_batch(query_batch, scopes=scopes, fields=fields, size=query_size)
+            for query_id, hits in zip(query_batch, batch_hits):
+                if not hits:
+                    hits = [{"query": query_id, "notfound": True}]
+                query_hits = results.get(query_id, None)
+                if query_hits is None:
+                    results[query_id] = hits
+                else:
+                    query_hits.extend(hits)
 
         return results
 
@@ -76,7 +116,11 @@ class ElasticsearchAnnotatorClient:
         scopes: Union[str, List[str]],
         fields: Optional[Union[str, List[str]]] = None,
         size: Optional[int] = None,
-    ) -> List[Dict]:
+    ) -> List[List[Dict]]:
+        """
+        Run one msearch for query_list and return the formatted hits of every
+        query id, in query_list order. Query ids without any hit get an empty list
+        """
         lines = []
         query_size = self.query_size if size is None else size
         for query_id in query_list:
@@ -97,20 +141,15 @@ class ElasticsearchAnnotatorClient:
                 f"Elasticsearch msearch returned {len(responses)} responses for {len(query_list)} queries"
             )
 
-        results = []
+        batch_hits = []
         for query_id, query_response in zip(query_list, responses):
             if "error" in query_response:
                 raise RuntimeError(f"Elasticsearch query failed for {query_id}: {query_response['error']}")
 
             hits = query_response.get("hits", {}).get("hits", [])
-            if not hits:
-                results.append({"query": query_id, "notfound": True})
-                continue
+            batch_hits.append([self._format_hit(hit, query=query_id) for hit in hits])
 
-            for hit in hits:
-                results.append(self._format_hit(hit, query=query_id))
-
-        return results
+        return batch_hits
 
     async def query(
         self,
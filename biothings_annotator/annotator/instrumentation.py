@@ -0,0 +1,134 @@
+"""
+Per-stage instrumentation of the annotations
+
+Every stage of an annotation (planning, backend queries, transformation, extra
+annotations, TRAPI attribute writing, ...) runs within stage(), which opens an
+OpenTelemetry span named annotator.<stage> as a child of the request span. The
+spans are non-recording until application/telemetry.py installs a tracer
+provider, so attributes that are costly to compute are only set when
+span.is_recording() is True.
+
+The durations of the stages run within collect_stage_timings() are also summed
+by stage. The collector is held by a context variable, so the stages of one
+request are collected apart from the others, including those run in the tasks
+the request spawns. Stages running concurrently (the backend batches of one
+plan) are summed, their total can exceed the wall clock time of the request
+"""
+
+import contextlib
+import contextvars
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from opentelemetry import trace
+
+from biothings_annotator.annotator.planner import AnnotationPlan
+
+STAGE_SPAN_PREFIX = "annotator"
+
+_tracer = trace.get_tracer(__name__)
+_stage_timings: contextvars.ContextVar[Optional["StageTimings"]] = contextvars.ContextVar(
+    "annotator_stage_timings", default=None
+)
+
+
+class StageTimings:
+    """
+    Number of runs and total duration in seconds of every stage, along with the
+    annotation plans and event counts of the request. The plans are only
+    summarized on demand, see plan_summaries
+    """
+
+    __slots__ = ("counts", "durations", "plans", "events")
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.durations: Dict[str, float] = {}
+        self.plans: List[Tuple[AnnotationPlan, int]] = []
+        self.events: Dict[str, int] = {}
+
+    def add(self, stage_name: str, duration: float) -> None:
+        self.counts[stage_name] = self.counts.get(stage_name, 0) + 1
+        self.durations[stage_name] = self.durations.get(stage_name, 0.0) + duration
+
+    def count(self, event_name: str, amount: int = 1) -> None:
+        self.events[event_name] = self.events.get(event_name, 0) + amount
+
+    def plan_summaries(self) -> List[Dict]:
+        return [{**plan.explain(), "curie_cache_hits": curie_cache_hits} for plan, curie_cache_hits in self.plans]
+
+    def as_dict(self) -> Dict[str, Dict]:
+        return {
+            stage_name: {"count": self.counts[stage_name], "duration": duration}
+            for stage_name, duration in self.durations.items()
+        }
+
+    def __repr__(self) -> str:
+        return f"StageTimings({self.as_dict()!r})"
+
+
+def start_stage_timings() -> Tuple[StageTimings, contextvars.Token]:
+    """
+    Collect the timings of the stages run from now on in the current context,
+    until stop_stage_timings is called with the returned token
+    """
+    timings = StageTimings()
+    return timings, _stage_timings.set(timings)
+
+
+def stop_stage_timings(token: contextvars.Token) -> None:
+    _stage_timings.reset(token)
+
+
+@contextlib.contextmanager
+def collect_stage_timings() -> Iterator[StageTimings]:
+    """
+    Collect the timings of the stages run within the block
+    """
+    timings, token = start_stage_timings()
+    try:
+        yield timings
+    finally:
+        stop_stage_timings(token)
+
+
+def current_stage_timings() -> Optional[StageTimings]:
+    return _stage_timings.get()
+
+
+def record_plan(plan: AnnotationPlan, curie_cache_hits: int) -> None:
+    """
+    Keep an annotation plan and its CURIE cache hits when the stage timings are collected
+    """
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings.plans.append((plan, curie_cache_hits))
+
+
+def count_event(event_name: str, amount: int = 1) -> None:
+    """
+    Count an event, such as a cache hit, when the stage timings are collected
+    """
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings.count(event_name, amount)
+
+
+@contextlib.contextmanager
+def stage(stage_name: str, **attributes) -> Iterator[trace.Span]:
+    """
+    Run a block as an annotation stage, see the module docstring. The attributes
+    set on the span must be OpenTelemetry attribute values, None values are left out
+    """
+    span_attributes = {key: value for key, value in attributes.items() if value is not None}
+    timings = _stage_timings.get()
+    with _tracer.start_as_current_span(f"{STAGE_SPAN_PREFIX}.{stage_name}", attributes=span_attributes) as span:
+        if timings is None:
+            yield span
+            return
+
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            timings.add(stage_name, time.perf_counter() - start)
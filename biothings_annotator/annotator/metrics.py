@@ -0,0 +1,257 @@
+"""
+Process-local metrics of the annotator in the Prometheus data model
+
+Every worker process records its counters, gauges and histograms in the
+module-level REGISTRY. The registry is exported as a JSON-serializable
+snapshot, so the snapshots of all the sanic workers can be merged into one set
+of metrics (see biothings_annotator.application.metrics) and rendered in the
+Prometheus text exposition format by render_prometheus.
+
+When merging, the samples of counters and histograms are summed. Gauges are
+summed or reduced to their maximum or minimum depending on their merge mode,
+e.g. the number of in-flight requests is the sum over the workers while the
+age of a cache is the age of its oldest copy
+"""
+
+import bisect
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+GAUGE_MERGE_MODES = ("sum", "max", "min")
+
+# Request and backend call latencies, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Number of query ids sent in one backend call
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class MetricFamily:
+    """
+    One named metric and its samples, keyed by the values of its labels
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.samples: Dict[LabelValues, object] = {}
+
+    def _label_values(self, labels: Dict[str, object]) -> LabelValues:
+        try:
+            if len(labels) == len(self.labelnames):
+                return tuple(str(labels[labelname]) for labelname in self.labelnames)
+        except KeyError:
+            pass
+        raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+
+    def clear(self) -> None:
+        self.samples.clear()
+
+    def snapshot(self) -> Dict:
+        return {
+            "type": self.kind,
+            "help": self.documentation,
+            "labels": list(self.labelnames),
+            "samples": [[list(label_values), value] for label_values, value in self.samples.items()],
+        }
+
+
+class Counter(MetricFamily):
+    kind = COUNTER
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        label_values = self._label_values(labels)
+        self.samples[label_values] = self.samples.get(label_values, 0.0) + amount
+
+    def set(self, value: float, **labels) -> None:
+        """
+        Set the total of a counter maintained elsewhere, such as the hit count
+        of an lru_cache
+        """
+        self.samples[self._label_values(labels)] = float(value)
+
+
+class Gauge(MetricFamily):
+    kind = GAUGE
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), merge_mode: str = "sum"):
+        if merge_mode not in GAUGE_MERGE_MODES:
+            raise ValueError(f"Unsupported gauge merge mode {merge_mode!r}, expected one of {GAUGE_MERGE_MODES}")
+        super().__init__(name, documentation, labelnames)
+        self.merge_mode = merge_mode
+
+    def set(self, value: float, **labels) -> None:
+        self.samples[self._label_values(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        label_values = self._label_values(labels)
+        self.samples[label_values] = self.samples.get(label_values, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def snapshot(self) -> Dict:
+        return {**super().snapshot(), "merge_mode": self.merge_mode}
+
+
+class Histogram(MetricFamily):
+    """
+    Samples are [bucket counts, sum] where the bucket counts are not cumulative
+    and their last entry counts the observations above the largest bound
+    """
+
+    kind = HISTOGRAM
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        label_values = self._label_values(labels)
+        sample = self.samples.get(label_values, None)
+        if sample is None:
+            sample = self.samples[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        sample[0][bisect.bisect_left(self.buckets, value)] += 1
+        sample[1] += value
+
+    def snapshot(self) -> Dict:
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families: Dict[str, MetricFamily] = {}
+
+    def register(self, family: MetricFamily) -> MetricFamily:
+        if family.name in self.families:
+            raise ValueError(f"Metric {family.name} is already registered")
+        self.families[family.name] = family
+        return family
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), merge_mode: str = "sum") -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, merge_mode))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: family.snapshot() for name, family in self.families.items()}
+
+    def clear(self) -> None:
+        for family in self.families.values():
+            family.clear()
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Dict]]) -> Dict[str, Dict]:
+    """
+    Merge the registry snapshots of several processes, see the module docstring
+    """
+    merged: Dict[str, Dict] = {}
+    for snapshot in snapshots:
+        for name, family in snapshot.items():
+            merged_family = merged.get(name, None)
+            if merged_family is None:
+                merged[name] = {**family, "samples": [[list(labels), value] for labels, value in family["samples"]]}
+                continue
+            if merged_family["type"] != family["type"] or merged_family.get("buckets") != family.get("buckets"):
+                # A worker running another version of the metric, keep the first definition
+                continue
+
+            merged_samples = {tuple(labels): value for labels, value in merged_family["samples"]}
+            for labels, value in family["samples"]:
+                label_values = tuple(labels)
+                current = merged_samples.get(label_values, None)
+                if current is None:
+                    merged_samples[label_values] = value
+                elif family["type"] == HISTOGRAM:
+                    merged_samples[label_values] = [
+                        [count + other for count, other in zip(current[0], value[0])],
+                        current[1] + value[1],
+                    ]
+                elif family["type"] == GAUGE and family.get("merge_mode") == "max":
+                    merged_samples[label_values] = max(current, value)
+                elif family["type"] == GAUGE and family.get("merge_mode") == "min":
+                    merged_samples[label_values] = min(current, value)
+                else:
+                    merged_samples[label_values] = current + value
+            merged_family["samples"] = [[list(labels), value] for labels, value in merged_samples.items()]
+    return merged
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], label_values: Sequence[str], extra: Optional[Tuple] = None) -> str:
+    pairs = [f'{labelname}="{_escape_label_value(value)}"' for labelname, value in zip(labelnames, label_values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus(snapshot: Dict[str, Dict]) -> str:
+    """
+    Render a (merged) snapshot in the Prometheus text exposition format 0.0.4
+    """
+    lines: List[str] = []
+    for name, family in snapshot.items():
+        documentation = family["help"].replace("\\", "\\\\").replace("\n", "\\n")
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        labelnames = family["labels"]
+        for label_values, value in sorted(family["samples"], key=lambda sample: sample[0]):
+            if family["type"] != HISTOGRAM:
+                lines.append(f"{name}{_format_labels(labelnames, label_values)} {_format_value(value)}")
+                continue
+
+            bucket_counts, total = value
+            cumulative = 0
+            for bound, bucket_count in zip([*family["buckets"], math.inf], bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(labelnames, label_values, ("le", _format_value(bound)))
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, label_values)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labelnames, label_values)} {cumulative}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+REGISTRY = MetricsRegistry()
+
+BACKEND_REQUEST_DURATION = REGISTRY.histogram(
+    "annotator_backend_request_duration_seconds",
+    "Duration of the backend calls, excluding the wait for a scheduler slot",
+    ("query_backend", "node_type"),
+)
+BACKEND_REQUEST_SIZE = REGISTRY.histogram(
+    "annotator_backend_request_size",
+    "Number of query ids sent in one backend call",
+    ("query_backend", "node_type"),
+    buckets=SIZE_BUCKETS,
+)
+BACKEND_REQUEST_ERRORS = REGISTRY.counter(
+    "annotator_backend_request_errors_total",
+    "Number of backend calls that raised an exception",
+    ("query_backend", "node_type"),
+)
@@ -0,0 +1,171 @@
+"""
+Planning stage of the /curie and /trapi annotations
+
+An AnnotationPlan is built from the resolved CURIEs of a request before any
+backend query is issued. It lists the backend batches (one per node type and
+scope group, deduplicated by query id), whether the hits are transformed, the
+CURIEs receiving extra annotations and an estimated cost in the unit used by
+the query scheduler (query ids plus a fixed cost per backend call). Expensive
+requests can so be logged and explained before they run, and both endpoints
+share one executor, see Annotator.execute_plan
+"""
+
+import math
+from typing import Dict, Iterable, List, Optional, Union
+
+from biothings_annotator.annotator.projection import FieldProjection, project_extra_fields, project_fields
+from biothings_annotator.annotator.records import ScopeGroup
+from biothings_annotator.annotator.resolver import CurieResolver
+from biothings_annotator.annotator.settings import ANNOTATOR_QUERY_BATCH_COST, ANNOTATOR_QUERY_CHUNK_SIZE
+
+# currently, extra annotations are only appended to chem nodes
+EXTRA_ANNOTATION_NODE_TYPES = ("chem",)
+
+
+def estimate_query_cost(
+    query_count: int,
+    chunk_size: int = ANNOTATOR_QUERY_CHUNK_SIZE,
+    batch_cost: float = ANNOTATOR_QUERY_BATCH_COST,
+) -> float:
+    """
+    Scheduler cost of querying query_count ids: one unit per id plus the
+    fixed cost of every backend call the ids are chunked into
+    """
+    if query_count <= 0:
+        return 0.0
+    return query_count + math.ceil(query_count / chunk_size) * batch_cost
+
+
+class QueryBatch:
+    """
+    One backend querymany of the plan: the unique query ids of a scope group
+    queried with the scopes of that group, fetching the fields of the projection
+    """
+
+    __slots__ = ("node_type", "scope_group", "scopes", "projection", "cost")
+
+    def __init__(
+        self, node_type: str, scope_group: ScopeGroup, scopes: Union[str, List[str]], projection: FieldProjection
+    ):
+        self.node_type = node_type
+        self.scope_group = scope_group
+        self.scopes = scopes
+        self.projection = projection
+        self.cost = estimate_query_cost(len(scope_group.node_ids))
+
+    @property
+    def query_ids(self) -> List[str]:
+        return self.scope_group.query_ids
+
+    def explain(self) -> Dict:
+        return {
+            "node_type": self.node_type,
+            "scopes": self.scopes,
+            "fields": self.projection.source_fields,
+            "query_ids": len(self.scope_group.node_ids),
+            "curies": len(self.scope_group),
+            "cost": self.cost,
+        }
+
+
+class AnnotationPlan:
+    """
+    The backend batches and post-processing steps of one annotation request
+    """
+
+    __slots__ = (
+        "query_backend",
+        "batches",
+        "unsupported",
+        "transform",
+        "fields",
+        "include_extra",
+        "extra_node_ids",
+        "extra_fields",
+        "estimated_cost",
+    )
+
+    def __init__(
+        self,
+        query_backend: str,
+        batches: List[QueryBatch],
+        unsupported: List[str],
+        transform: bool,
+        fields: Optional[Union[str, List[str]]],
+        include_extra: bool,
+        extra_node_ids: List[str],
+        extra_fields: Union[str, List[str]],
+    ):
+        self.query_backend = query_backend
+        self.batches = batches
+        self.unsupported = unsupported
+        self.transform = transform
+        self.fields = fields
+        self.include_extra = include_extra
+        self.extra_node_ids = extra_node_ids
+        self.extra_fields = extra_fields
+        self.estimated_cost = sum(batch.cost for batch in batches) + estimate_query_cost(len(extra_node_ids))
+
+    @property
+    def node_types(self) -> List[str]:
+        return list(dict.fromkeys(batch.node_type for batch in self.batches))
+
+    def explain(self) -> Dict:
+        """
+        Summary of the plan for logging, without the CURIEs themselves
+        """
+        return {
+            "query_backend": self.query_backend,
+            "estimated_cost": self.estimated_cost,
+            "curies": sum(len(batch.scope_group) for batch in self.batches) + len(self.unsupported),
+            "query_ids": sum(len(batch.scope_group.node_ids) for batch in self.batches),
+            "unsupported": len(self.unsupported),
+            "transform": self.transform,
+            "fields": self.fields,
+            "extra_node_ids": len(self.extra_node_ids),
+            "batches": [batch.explain() for batch in self.batches],
+        }
+
+    def __repr__(self) -> str:
+        return (
+            f"AnnotationPlan(query_backend={self.query_backend!r}, batches={len(self.batches)}, "
+            f"estimated_cost={self.estimated_cost!r})"
+        )
+
+
+def build_annotation_plan(
+    resolver: CurieResolver,
+    curies: Iterable[str],
+    raw: bool = False,
+    fields: Optional[Union[str, List[str]]] = None,
+    include_extra: bool = True,
+) -> AnnotationPlan:
+    """
+    Resolve the CURIEs of a request and plan their annotation. Repeated CURIEs
+    and CURIEs sharing a query id within a scope group are queried once, the
+    requested fields are projected per node type (see projection.py)
+    """
+    type_plans, unsupported = resolver.resolve_many(curies)
+    batches = []
+    for node_type, type_plan in type_plans.items():
+        projection = project_fields(node_type, fields, raw=raw)
+        for scope_group in type_plan.scope_groups.values():
+            batches.append(QueryBatch(node_type, scope_group, resolver.scopes(scope_group.scope_key), projection))
+
+    extra_node_ids = []
+    if include_extra:
+        for node_type in EXTRA_ANNOTATION_NODE_TYPES:
+            type_plan = type_plans.get(node_type, None)
+            if type_plan is not None:
+                extra_node_ids.extend(type_plan.curies())
+
+    return AnnotationPlan(
+        query_backend=resolver.query_backend,
+        batches=batches,
+        unsupported=unsupported,
+        transform=not raw,
+        fields=fields,
+        include_extra=include_extra,
+        extra_node_ids=extra_node_ids,
+        extra_fields=project_extra_fields(fields),
+    )
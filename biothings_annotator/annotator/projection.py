@@ -0,0 +1,126 @@
+"""
+Field projection of the annotation queries
+
+The fields requested by a client are turned into the smallest set of fields
+fetched from the backend (the _source filter of the Elasticsearch adapter,
+the fields parameter of the BioThings client):
+
+* fields covered by a requested parent field are dropped
+* derived fields, computed by the ResponseTransformer from other fields, are
+  replaced by the fields they are computed from. Those source fields are
+  pruned from the annotations after the transformation unless requested
+* the extra annotation query only fetches the requested fields
+
+Without requested fields the default fields of ANNOTATOR_CLIENTS are fetched
+and the extra annotations are fetched whole, as before
+"""
+
+import functools
+from typing import Dict, List, Optional, Tuple, Union
+
+from biothings_annotator.annotator.settings import ANNOTATOR_CLIENTS
+from biothings_annotator.annotator.utils import DotfieldPath, compile_dotfield
+
+ALL_FIELDS = "all"
+
+# node type -> derived field -> the fields it is computed from by the ResponseTransformer
+DERIVED_FIELDS = {
+    "chem": {
+        "atc_classifications": ("chembl.atc_classifications", "pharmgkb.xrefs.atc"),
+    },
+}
+
+Fields = Optional[Union[str, List[str]]]
+
+
+def normalize_fields(fields: Fields) -> Optional[Tuple[str, ...]]:
+    """
+    Returns the requested fields as a tuple without blanks and duplicates, None
+    when no field was requested. A comma separated string is split, as passed
+    by the fields query parameter
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    normalized_fields = tuple(dict.fromkeys(field.strip() for field in fields if field and field.strip()))
+    return normalized_fields or None
+
+
+def _requests_all_fields(fields: Tuple[str, ...]) -> bool:
+    return ALL_FIELDS in fields or "*" in fields
+
+
+def _is_covered(field: str, parent_fields: Tuple[str, ...]) -> bool:
+    return any(field == parent or field.startswith(f"{parent}.") for parent in parent_fields)
+
+
+def minimal_fields(fields: Tuple[str, ...]) -> List[str]:
+    """
+    Drops the fields covered by a parent field of the list, keeping the order
+    """
+    return [field for field in fields if not any(field.startswith(f"{parent}.") for parent in fields)]
+
+
+class FieldProjection:
+    """
+    The fields fetched for one node type and the fields pruned after the
+    transformation
+    """
+
+    __slots__ = ("source_fields", "pruned_fields")
+
+    def __init__(self, source_fields: Union[str, List[str]], pruned_fields: Tuple[DotfieldPath, ...] = ()):
+        self.source_fields = source_fields
+        self.pruned_fields: Tuple[DotfieldPath, ...] = tuple(pruned_fields)
+
+    def prune(self, res_by_id: Dict) -> Dict:
+        """
+        Remove the fields only fetched to compute derived fields, in place
+        """
+        if self.pruned_fields:
+            for res in res_by_id.values():
+                for pruned_field in self.pruned_fields:
+                    pruned_field.remove(res)
+        return res_by_id
+
+    def __repr__(self) -> str:
+        return f"FieldProjection(source_fields={self.source_fields!r}, pruned_fields={self.pruned_fields!r})"
+
+
+@functools.lru_cache(maxsize=256)
+def _project_fields(node_type: str, fields: Optional[Tuple[str, ...]], raw: bool) -> FieldProjection:
+    if fields is None:
+        return FieldProjection(ANNOTATOR_CLIENTS.get(node_type, {}).get("fields", ALL_FIELDS))
+    if _requests_all_fields(fields):
+        return FieldProjection(ALL_FIELDS)
+
+    requested_fields = minimal_fields(fields)
+    derived_fields = {} if raw else DERIVED_FIELDS.get(node_type, {})
+    source_fields = []
+    for field in requested_fields:
+        source_fields.extend(derived_fields.get(field, (field,)))
+    source_fields = minimal_fields(tuple(dict.fromkeys(source_fields)))
+    pruned_fields = [
+        compile_dotfield(field) for field in source_fields if not _is_covered(field, tuple(requested_fields))
+    ]
+    return FieldProjection(source_fields, tuple(pruned_fields))
+
+
+def project_fields(node_type: str, fields: Fields, raw: bool = False) -> FieldProjection:
+    """
+    Returns the field projection of the fields requested for a node type. raw
+    annotations are not transformed, so their derived fields are not expanded
+    """
+    return _project_fields(node_type, normalize_fields(fields), raw)
+
+
+def project_extra_fields(fields: Fields) -> Union[str, List[str]]:
+    """
+    Returns the fields of the extra annotation query: the requested fields, all
+    of them when no field was requested
+    """
+    normalized_fields = normalize_fields(fields)
+    if normalized_fields is None or _requests_all_fields(normalized_fields):
+        return ALL_FIELDS
+    return minimal_fields(normalized_fields)
@@ -0,0 +1,112 @@
+"""
+Compact record types passed between the resolution and query stages of the
+annotator
+
+All records use __slots__ so batches of tens of thousands of CURIEs do not
+allocate a per-instance __dict__, and a scope group keeps a single query id to
+node id mapping instead of a list per query id
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+ScopeKey = Union[str, Tuple[str, ...]]
+
+
+class ResolvedCurie:
+    """
+    A CURIE resolved into its prefix, node type, query id and scope group key
+    (the hashable form of its querymany scopes). node_type and scope_key are
+    None for unsupported CURIEs
+    """
+
+    __slots__ = ("curie", "prefix", "node_type", "query_id", "scope_key")
+
+    def __init__(
+        self,
+        curie: str,
+        prefix: str,
+        node_type: Optional[str],
+        query_id: str,
+        scope_key: Optional[ScopeKey],
+    ):
+        self.curie = curie
+        self.prefix = prefix
+        self.node_type = node_type
+        self.query_id = query_id
+        self.scope_key = scope_key
+
+    def __repr__(self) -> str:
+        return (
+            f"ResolvedCurie(curie={self.curie!r}, prefix={self.prefix!r}, node_type={self.node_type!r}, "
+            f"query_id={self.query_id!r}, scope_key={self.scope_key!r})"
+        )
+
+
+class ScopeGroup:
+    """
+    The CURIEs of one node type queried with the same scopes, deduplicated by
+    query id. node_ids maps every query id to the first CURIE resolving to it,
+    CURIEs sharing a query id with an earlier one are kept in aliases
+    """
+
+    __slots__ = ("scope_key", "node_ids", "aliases")
+
+    def __init__(self, scope_key: ScopeKey):
+        self.scope_key = scope_key
+        self.node_ids: Dict[str, str] = {}
+        self.aliases: Optional[Dict[str, List[str]]] = None
+
+    def add(self, resolved: ResolvedCurie) -> None:
+        query_id = resolved.query_id
+        node_id = self.node_ids.get(query_id, None)
+        if node_id is None:
+            self.node_ids[query_id] = resolved.curie
+            return
+        if node_id == resolved.curie:
+            return
+
+        if self.aliases is None:
+            self.aliases = {}
+        aliases = self.aliases.setdefault(query_id, [])
+        if resolved.curie not in aliases:
+            aliases.append(resolved.curie)
+
+    @property
+    def query_ids(self) -> List[str]:
+        return list(self.node_ids)
+
+    def aliases_of(self, query_id: str) -> List[str]:
+        if self.aliases is None:
+            return []
+        return self.aliases.get(query_id, [])
+
+    def curies(self) -> Iterator[str]:
+        for query_id, node_id in self.node_ids.items():
+            yield node_id
+            yield from self.aliases_of(query_id)
+
+    def __len__(self) -> int:
+        alias_count = 0 if self.aliases is None else sum(len(aliases) for aliases in self.aliases.values())
+        return len(self.node_ids) + alias_count
+
+
+class TypeQueryPlan:
+    """
+    The scope groups of the CURIEs of one node type, in input order
+    """
+
+    __slots__ = ("node_type", "scope_groups")
+
+    def __init__(self, node_type: str):
+        self.node_type = node_type
+        self.scope_groups: Dict[ScopeKey, ScopeGroup] = {}
+
+    def add(self, resolved: ResolvedCurie) -> None:
+        scope_group = self.scope_groups.get(resolved.scope_key, None)
+        if scope_group is None:
+            scope_group = self.scope_groups[resolved.scope_key] = ScopeGroup(resolved.scope_key)
+        scope_group.add(resolved)
+
+    def curies(self) -> Iterator[str]:
+        for scope_group in self.scope_groups.values():
+            yield from scope_group.curies()
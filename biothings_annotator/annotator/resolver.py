@@ -0,0 +1,191 @@
+"""
+Compiled CURIE resolution
+
+The CurieResolver flattens BIOLINK_PREFIX_to_BioThings and ANNOTATOR_CLIENTS
+into one lookup table per query backend, so a CURIE is resolved to its node
+type, query id and querymany scopes with a single dictionary lookup.
+
+The same CURIEs arrive over and over, so both the URL unquoting of CURIEs and
+their resolution are memoized in bounded LRU caches (CURIE_CACHE_SIZE entries
+each) shared by all requests of a worker
+"""
+
+import functools
+import logging
+import os
+import urllib.parse
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from biothings_annotator.annotator.exceptions import InvalidCurieError
+from biothings_annotator.annotator.records import ResolvedCurie, ScopeKey, TypeQueryPlan
+from biothings_annotator.annotator.settings import (
+    ANNOTATOR_CLIENTS,
+    BIOLINK_PREFIX_to_BioThings,
+    CURIE_CACHE_SIZE,
+    CURIE_CACHE_SIZE_ENV,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _PrefixRule(NamedTuple):
+    node_type: str
+    keep_prefix: bool
+    converter: Optional[Callable[[str], str]]
+    scope_key: Optional[ScopeKey]
+
+
+def curie_cache_size() -> int:
+    try:
+        return int(os.environ.get(CURIE_CACHE_SIZE_ENV, CURIE_CACHE_SIZE))
+    except ValueError:
+        logger.warning("Invalid %s value. Using the default size of %s", CURIE_CACHE_SIZE_ENV, CURIE_CACHE_SIZE)
+        return CURIE_CACHE_SIZE
+
+
+def _cache_stats(cached_function) -> Dict:
+    cache_info = cached_function.cache_info()
+    lookups = cache_info.hits + cache_info.misses
+    return {
+        "hits": cache_info.hits,
+        "misses": cache_info.misses,
+        "size": cache_info.currsize,
+        "maxsize": cache_info.maxsize,
+        "hit_rate": cache_info.hits / lookups if lookups else 0.0,
+    }
+
+
+@functools.lru_cache(maxsize=curie_cache_size())
+def unquote_curie(curie: str) -> str:
+    """
+    Memoized strict UTF-8 URL unquoting of a CURIE. Raises UnicodeError on
+    invalid percent-encoded sequences
+    """
+    return urllib.parse.unquote(curie, encoding="utf-8", errors="strict")
+
+
+def _scope_key(scopes: Union[str, List[str]]) -> ScopeKey:
+    return tuple(scopes) if isinstance(scopes, list) else scopes
+
+
+class CurieResolver:
+    """
+    Resolves CURIEs for one query backend. Built once per backend from the
+    prefix settings, see get_resolver
+    """
+
+    def __init__(self, query_backend: str, cache_size: Optional[int] = None):
+        self.query_backend = query_backend
+        cache_size = curie_cache_size() if cache_size is None else cache_size
+        self.resolve = functools.lru_cache(maxsize=cache_size)(self._resolve)
+        self._scopes_by_key: Dict[ScopeKey, Union[str, List[str]]] = {}
+        self._rules: Dict[str, _PrefixRule] = {}
+        for prefix, prefix_settings in BIOLINK_PREFIX_to_BioThings.items():
+            node_type = prefix_settings.get("type", None)
+            if not node_type:
+                continue
+            scopes = self.scopes_for_prefix(node_type, prefix)
+            scope_key = None
+            if scopes:
+                scope_key = _scope_key(scopes)
+                self._scopes_by_key[scope_key] = scopes
+            self._rules[prefix] = _PrefixRule(
+                node_type=node_type,
+                keep_prefix=prefix_settings.get("keep_prefix", False),
+                converter=prefix_settings.get("converter", None),
+                scope_key=scope_key,
+            )
+
+    def default_scopes(self, node_type: str) -> Optional[Union[str, List[str]]]:
+        """Return the backend-appropriate default query scopes for a node type."""
+        client_settings = ANNOTATOR_CLIENTS.get(node_type, None)
+        if client_settings is None:
+            return None
+        if self.query_backend == "elasticsearch":
+            return client_settings.get("elasticsearch_scopes", client_settings["scopes"])
+        return client_settings["scopes"]
+
+    def scopes_for_prefix(self, node_type: str, prefix: str) -> Optional[Union[str, List[str]]]:
+        """Return prefix-specific scopes using exact ES fields when configured."""
+        prefix_settings = BIOLINK_PREFIX_to_BioThings.get(prefix, {})
+        if self.query_backend == "elasticsearch":
+            elasticsearch_scopes = prefix_settings.get("elasticsearch_scopes")
+            if elasticsearch_scopes:
+                return elasticsearch_scopes
+        return prefix_settings.get("scopes") or self.default_scopes(node_type)
+
+    def scopes(self, scope_key: ScopeKey) -> Union[str, List[str]]:
+        return self._scopes_by_key[scope_key]
+
+    def _resolve(self, curie: str) -> ResolvedCurie:
+        """
+        Resolve a CURIE into its prefix, node type, query id and scope group.
+        The query id follows parse_curie: CURIEs of unsupported prefixes keep
+        their prefix and have no node type. Memoized as CurieResolver.resolve
+
+        Raises InvalidCurieError when the CURIE has no prefix
+        """
+        prefix, separator, local_id = curie.partition(":")
+        if not separator:
+            raise InvalidCurieError(curie)
+
+        rule = self._rules.get(prefix, None)
+        if rule is None:
+            return ResolvedCurie(curie, prefix, None, curie, None)
+
+        if rule.converter is not None:
+            query_id = rule.converter(curie)
+        elif rule.keep_prefix:
+            query_id = curie
+        else:
+            query_id = local_id
+        return ResolvedCurie(curie, prefix, rule.node_type, query_id, rule.scope_key)
+
+    def cache_stats(self) -> Dict:
+        return _cache_stats(self.resolve)
+
+    def resolve_many(self, curies: Iterable[str]) -> Tuple[Dict[str, TypeQueryPlan], List[str]]:
+        """
+        Resolve a whole CURIE list in one pass and partition it by node type and
+        scope group, keeping the input order. Repeated CURIEs are kept once
+
+        Returns the query plan of every node type along with the CURIEs of
+        unsupported prefixes
+        """
+        plans: Dict[str, TypeQueryPlan] = {}
+        unsupported: List[str] = []
+        resolve = self.resolve
+        for curie in curies:
+            resolved = resolve(curie)
+            if resolved.scope_key is None:
+                unsupported.append(curie)
+                continue
+            plan = plans.get(resolved.node_type, None)
+            if plan is None:
+                plan = plans[resolved.node_type] = TypeQueryPlan(resolved.node_type)
+            plan.add(resolved)
+        return plans, unsupported
+
+
+_resolvers: Dict[str, CurieResolver] = {}
+
+
+def get_resolver(query_backend: str) -> CurieResolver:
+    """
+    Returns the CurieResolver of a query backend, compiling it on first use
+    """
+    resolver = _resolvers.get(query_backend, None)
+    if resolver is None:
+        resolver = _resolvers[query_backend] = CurieResolver(query_backend)
+    return resolver
+
+
+def curie_cache_stats() -> Dict:
+    """
+    Hit-rate statistics of the CURIE unquoting cache and of the resolution
+    cache of every query backend used by the worker
+    """
+    return {
+        "unquote": _cache_stats(unquote_curie),
+        "resolve": {query_backend: resolver.cache_stats() for query_backend, resolver in _resolvers.items()},
+    }
@@ -0,0 +1,130 @@
+"""
+Cost-aware fair scheduling of the backend queries issued by the annotator
+
+Every Annotator instance (one per web request) is a flow. Its backend queries
+are split into chunks and each chunk waits for one of the worker wide backend
+slots. Waiting chunks are served in order of their virtual finish tag (weighted
+fair queuing), where a chunk's cost is the number of query ids it carries plus
+a fixed per-call cost. A bulk request therefore only ever holds the slots it
+won chunk by chunk, while a single CURIE lookup arriving in the middle of it is
+dispatched ahead of the bulk request's remaining chunks
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+from biothings_annotator.annotator.settings import (
+    ANNOTATOR_QUERY_BATCH_COST,
+    ANNOTATOR_QUERY_CHUNK_SIZE,
+    ANNOTATOR_QUERY_CONCURRENCY,
+)
+from biothings_annotator.annotator.utils import _current_event_loop_id, batched
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerFlow:
+    """
+    Scheduling state of one request. A larger weight gives the flow a larger
+    share of the backend slots while it competes with other flows
+    """
+
+    __slots__ = ("weight", "finish_tag")
+
+    def __init__(self, weight: float = 1.0):
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        self.weight = weight
+        self.finish_tag = 0.0
+
+
+class FairQueryScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = ANNOTATOR_QUERY_CONCURRENCY,
+        chunk_size: int = ANNOTATOR_QUERY_CHUNK_SIZE,
+        batch_cost: float = ANNOTATOR_QUERY_BATCH_COST,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self.batch_cost = batch_cost
+        self.active = 0
+        self.virtual_time = 0.0
+        self._queue: List[Tuple[float, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for entry in self._queue if not entry[3].done())
+
+    def chunk(self, query_list: Iterable[str]) -> List[List[str]]:
+        return [list(query_chunk) for query_chunk in batched(query_list, self.chunk_size)]
+
+    def chunk_cost(self, query_chunk: List[str]) -> float:
+        return len(query_chunk) + self.batch_cost
+
+    async def acquire(self, flow: SchedulerFlow, cost: float) -> None:
+        """
+        Wait for a backend slot on behalf of the flow
+        """
+        start_tag = max(flow.finish_tag, self.virtual_time)
+        finish_tag = start_tag + cost / flow.weight
+        flow.finish_tag = finish_tag
+
+        if self.active < self.max_concurrency and not self._queue:
+            self.active += 1
+            self.virtual_time = max(self.virtual_time, start_tag)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (finish_tag, next(self._sequence), start_tag, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over right before the waiter was cancelled
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.active -= 1
+        while self._queue and self.active < self.max_concurrency:
+            _, _, start_tag, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self.active += 1
+            self.virtual_time = max(self.virtual_time, start_tag)
+            future.set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, flow: SchedulerFlow, cost: float) -> AsyncIterator[None]:
+        await self.acquire(flow, cost)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+_scheduler: Optional[FairQueryScheduler] = None
+_scheduler_loop_id: Optional[int] = None
+
+
+def get_scheduler() -> FairQueryScheduler:
+    """
+    Returns the scheduler shared by all requests served by the running event
+    loop, i.e. by the current sanic worker
+    """
+    global _scheduler, _scheduler_loop_id
+    current_loop_id = _current_event_loop_id()
+    if _scheduler is None or _scheduler_loop_id != current_loop_id:
+        _scheduler = FairQueryScheduler()
+        _scheduler_loop_id = current_loop_id
+    return _scheduler
@@ -31,6 +31,25 @@ ELASTICSEARCH_REQUEST_TIMEOUT = 30
 ELASTICSEARCH_QUERY_SIZE = 10
 ELASTICSEARCH_QUERY_BATCH_SIZE = 1000
 
+# Backend query scheduling. Requests are split into chunks of at most
+# ANNOTATOR_QUERY_CHUNK_SIZE query ids and each worker runs at most
+# ANNOTATOR_QUERY_CONCURRENCY chunks against the backends at once. Waiting chunks
+# are ordered by weighted fair queuing on their cost (number of ids plus
+# ANNOTATOR_QUERY_BATCH_COST per backend call) so small interactive lookups are
+# interleaved with the chunks of bulk requests instead of queuing behind them.
+ANNOTATOR_QUERY_CONCURRENCY = 8
+ANNOTATOR_QUERY_CHUNK_SIZE = 500
+ANNOTATOR_QUERY_BATCH_COST = 25
+
+# Annotation plans (see planner.py) with an estimated cost of at least
+# ANNOTATION_PLAN_LOG_COST scheduler units are logged along with their summary
+ANNOTATION_PLAN_LOG_COST = 10000
+
+# Number of CURIEs whose URL unquoting and resolution (see resolver.py) are
+# memoized by every worker, overridden by the ANNOTATOR_CURIE_CACHE_SIZE variable
+CURIE_CACHE_SIZE = 65536
+CURIE_CACHE_SIZE_ENV = "ANNOTATOR_CURIE_CACHE_SIZE"
+
 
 BIOLINK_PREFIX_to_BioThings = {
     # "scopes" contains BioThings query scopes. "elasticsearch_scopes" overrides
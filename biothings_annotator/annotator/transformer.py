@@ -5,9 +5,10 @@ recieve within the biothings annotator
 
 import inspect
 import logging
+import time
 from typing import Dict, Optional
 
-from biothings_annotator.annotator.utils import get_client
+from biothings_annotator.annotator.utils import compile_dotfield, get_client
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +20,10 @@ def append_prefix(id, prefix):
 
 
 atc_cache = {}  # Backend/source keyed WHO ATC code-to-name mappings.
+atc_cache_loaded_at = {}  # Unix time each atc_cache entry was loaded at.
+
+CHEMBL_DRUG_INDICATIONS = compile_dotfield("chembl.drug_indications")
+ATC_CODE_FIELDS = (compile_dotfield("chembl.atc_classifications"), compile_dotfield("pharmgkb.xrefs.atc"))
 
 
 async def load_atc_cache(api_host: str, atc_client: Optional[object] = None, cache_key: Optional[str] = None) -> Dict:
@@ -35,6 +40,7 @@ async def load_atc_cache(api_host: str, atc_client: Optional[object] = None, cac
         async for atc in atc_li:
             cache[atc["atc"]["code"]] = atc["atc"]["name"]
         atc_cache[cache_key] = cache
+        atc_cache_loaded_at[cache_key] = time.time()
         logger.info(f"Loaded {len(atc_cache[cache_key])} WHO ATC code-to-name mappings.")
     return atc_cache[cache_key]
 
@@ -55,21 +61,11 @@ class ResponseTransformer:
         if self.node_type != "chem":
             return doc
 
-        def _append_mesh_prefix(chembl):
-            xli = chembl.get("drug_indications", [])
-            for _doc in xli:
-                if "mesh_id" in _doc:
-                    # Add MESH prefix to chembl.drug_indications.mesh_id field
-                    _doc["mesh_id"] = append_prefix(_doc["mesh_id"], "MESH")
-
-        chembl = doc.get("chembl", {})
-        if chembl:
-            if isinstance(chembl, list):
-                # in case returned chembl is a list, rare but still possible
-                for c in chembl:
-                    _append_mesh_prefix(c)
-            else:
-                _append_mesh_prefix(chembl)
+        # chembl and its drug_indications can be lists, rare but still possible
+        for drug_indication in CHEMBL_DRUG_INDICATIONS.values(doc):
+            if isinstance(drug_indication, dict) and "mesh_id" in drug_indication:
+                # Add MESH prefix to chembl.drug_indications.mesh_id field
+                drug_indication["mesh_id"] = append_prefix(drug_indication["mesh_id"], "MESH")
 
         return doc
 
@@ -83,40 +79,14 @@ class ResponseTransformer:
         if self.node_type != "chem":
             return doc
 
-        def _get_atc_from_chembl(chembl):
-            atc_from_chembl = chembl.get("atc_classifications", [])
-            if isinstance(atc_from_chembl, str):
-                atc_from_chembl = [atc_from_chembl]
-            return atc_from_chembl
-
-        chembl = doc.get("chembl", {})
-        atc_from_chembl = []
-        if chembl:
-            if isinstance(chembl, list):
-                # in case returned chembl is a list, rare but still possible
-                for c in chembl:
-                    atc_from_chembl.extend(_get_atc_from_chembl(c))
-            else:
-                atc_from_chembl.extend(_get_atc_from_chembl(chembl))
-
-        def _get_atc_from_pharmgkb(pharmgkb):
-            atc_from_pharmgkb = pharmgkb.get("xrefs", {}).get("atc", [])
-            if isinstance(atc_from_pharmgkb, str):
-                atc_from_pharmgkb = [atc_from_pharmgkb]
-            return atc_from_pharmgkb
-
-        pharmgkb = doc.get("pharmgkb", {})
-        atc_from_pharmgkb = []
-        if pharmgkb:
-            if isinstance(pharmgkb, list):
-                # in case returned pharmgkb is a list, rare but still possible
-                for p in pharmgkb:
-                    atc_from_pharmgkb.extend(_get_atc_from_pharmgkb(p))
-            else:
-                atc_from_pharmgkb.extend(_get_atc_from_pharmgkb(pharmgkb))
+        # chembl.atc_classifications and pharmgkb.xrefs.atc hold one code or a list of codes,
+        # chembl and pharmgkb themselves can be lists, rare but still possible
+        atc_codes = set()
+        for atc_code_field in ATC_CODE_FIELDS:
+            atc_codes.update(atc_code for atc_code in atc_code_field.values(doc) if isinstance(atc_code, str))
 
         atc = []
-        for atc_code in set(atc_from_chembl + atc_from_pharmgkb):
+        for atc_code in atc_codes:
             if len(atc_code) == 7:
                 # example: L04AB02
                 level_d = {}
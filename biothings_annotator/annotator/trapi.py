@@ -0,0 +1,333 @@
+"""
+Lazy extraction of the knowledge graph nodes of a TRAPI message
+
+The annotator only reads message.knowledge_graph.nodes, while TRAPI messages
+are usually dominated by their knowledge graph edges and results. Instead of
+decoding the whole body, extract_trapi_nodes walks the raw JSON bytes down the
+message.knowledge_graph.nodes path, skipping the values of other members
+without building them, and only decodes the nodes object.
+
+The rest of the body is then validated without being decoded: the members
+left in the objects along the path are checked against the JSON grammar (the
+scalar values json.loads accepts, the separators and the brackets) and must
+end the body, so truncated or malformed bodies are rejected as json.loads
+would. Objects holding the member of the path more than once are rejected
+too, json.loads would resolve them to their last member. Rejected bodies are
+decoded whole by the callers to report the error.
+
+The validation steps through every container in Python, so it only beats
+json.loads on bodies whose nodes are a small part of the message, see the
+TRAPI_LAZY_PARSING setting
+
+The same byte spans let splice_trapi_nodes build the /trapi response from the
+request body: only the biothings_annotations attribute of each annotated node
+is serialized and spliced into the node's original JSON, every other byte of
+the nodes is copied as is
+"""
+
+import codecs
+import json
+import re
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from biothings_annotator.annotator.utils import compile_dotfield
+
+TRAPI_NODES = compile_dotfield("message.knowledge_graph.nodes")
+TRAPI_ATTRIBUTE_TYPE_ID = "biothings_annotations"
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING_PATTERN = rb'"[^"\\\x00-\x1f]*(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\\x00-\x1f]*)*"'
+# the scalar values json.loads accepts, NaN and Infinity included
+_SCALAR_PATTERN = (
+    rb"(?:%s|true|false|null|NaN|-?Infinity|-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?)" % _STRING_PATTERN
+)
+_STRING = re.compile(_STRING_PATTERN)
+_SCALAR = re.compile(_SCALAR_PATTERN)
+# runs of scalar array items and object members followed by a comma, matched
+# at once so flat sections are validated without a step per value
+_SCALAR_ITEMS = re.compile(rb"(?:%s[ \t\n\r]*,[ \t\n\r]*)*" % _SCALAR_PATTERN)
+_SCALAR_MEMBERS = re.compile(
+    rb"(?:%s[ \t\n\r]*:[ \t\n\r]*%s[ \t\n\r]*,[ \t\n\r]*)*" % (_STRING_PATTERN, _SCALAR_PATTERN)
+)
+# a run of container content without brackets, strings are matched whole so
+# the brackets they hold are skipped along
+_CONTAINER_CONTENT = re.compile(rb'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*')
+
+_OPENING_BRACKETS = frozenset(b"[{")
+_CLOSING_BRACKETS = frozenset(b"]}")
+_OPEN_OBJECT, _CLOSE_OBJECT, _OPEN_ARRAY, _CLOSE_ARRAY = b"{}[]"
+_COMMA, _COLON = b",:"
+_UTF8_CHUNK_SIZE = 1 << 20
+
+
+def _skip_whitespace(body: bytes, index: int) -> int:
+    return _WHITESPACE.match(body, index).end()
+
+
+def _skip_container(body: bytes, index: int) -> int:
+    """
+    Returns the index past the object or array starting at index, only
+    matching its brackets. Its content is validated by the caller
+    """
+    depth = 0
+    skip_content = _CONTAINER_CONTENT.match
+    while True:
+        char = body[index]
+        if char in _OPENING_BRACKETS:
+            depth += 1
+        elif char in _CLOSING_BRACKETS:
+            depth -= 1
+        else:
+            # an unterminated string
+            raise ValueError(f"Invalid JSON container content at {index}")
+        index += 1
+        if depth == 0:
+            return index
+        index = skip_content(body, index).end()
+
+
+def _skip_key(body: bytes, index: int) -> int:
+    """
+    Returns the index of the value of the object member starting at index
+    """
+    key_match = _STRING.match(body, index)
+    if key_match is None:
+        raise ValueError(f"Invalid JSON object key at {index}")
+    index = _skip_whitespace(body, key_match.end())
+    if body[index] != _COLON:
+        raise ValueError(f"Expected ':' at {index}")
+    return _skip_whitespace(body, index + 1)
+
+
+def _skip_value(body: bytes, index: int) -> int:
+    """
+    Returns the index past the JSON value starting at index, validating its
+    syntax as json.loads does without decoding it
+    """
+    closers = []
+    while True:
+        char = body[index]
+        if char == _OPEN_OBJECT:
+            index = _skip_whitespace(body, index + 1)
+            if body[index] != _CLOSE_OBJECT:
+                closers.append(_CLOSE_OBJECT)
+                index = _skip_key(body, _SCALAR_MEMBERS.match(body, index).end())
+                continue
+            index += 1
+        elif char == _OPEN_ARRAY:
+            index = _skip_whitespace(body, index + 1)
+            if body[index] != _CLOSE_ARRAY:
+                closers.append(_CLOSE_ARRAY)
+                index = _SCALAR_ITEMS.match(body, index).end()
+                continue
+            index += 1
+        else:
+            value_match = _SCALAR.match(body, index)
+            if value_match is None:
+                raise ValueError(f"Invalid JSON value at {index}")
+            index = value_match.end()
+
+        # past a value, close the containers it ends up to the next sibling
+        while closers:
+            index = _skip_whitespace(body, index)
+            char = body[index]
+            if char == _COMMA:
+                index = _skip_whitespace(body, index + 1)
+                if closers[-1] == _CLOSE_OBJECT:
+                    index = _skip_key(body, _SCALAR_MEMBERS.match(body, index).end())
+                else:
+                    index = _SCALAR_ITEMS.match(body, index).end()
+                break
+            if char != closers[-1]:
+                raise ValueError(f"Expected ',' or {chr(closers[-1])!r} at {index}")
+            closers.pop()
+            index += 1
+        else:
+            return index
+
+
+def _read_key(body: bytes, index: int) -> Tuple[str, int]:
+    """
+    Returns the key of the object member starting at index and the index of its value
+    """
+    value_index = _skip_key(body, index)
+    return json.loads(_STRING.match(body, index).group()), value_index
+
+
+def _find_member(body: bytes, index: int, key: str) -> Optional[int]:
+    """
+    Returns the index of the value of the key member of the object starting at
+    index, None when the object has no such member
+    """
+    index = _skip_whitespace(body, index + 1)
+    if body[index] == ord("}"):
+        return None
+    while True:
+        member_key, index = _read_key(body, index)
+        if member_key == key:
+            return index
+
+        index = _skip_whitespace(body, _skip_value(body, index))
+        if body[index] == ord("}"):
+            return None
+        if body[index] != ord(","):
+            raise ValueError(f"Expected ',' or '}}' at {index}")
+        index = _skip_whitespace(body, index + 1)
+
+
+def _finish_object(body: bytes, index: int, key: str) -> Optional[int]:
+    """
+    Returns the index past the object whose key member value ends at index,
+    scanning the structure of its remaining members. None when the object holds
+    another key member
+    """
+    index = _skip_whitespace(body, index)
+    while body[index] == ord(","):
+        member_key, index = _read_key(body, _skip_whitespace(body, index + 1))
+        if member_key == key:
+            return None
+        index = _skip_whitespace(body, _skip_value(body, index))
+    if body[index] != ord("}"):
+        raise ValueError(f"Expected ',' or '}}' at {index}")
+    return index + 1
+
+
+def _check_utf8(body: bytes) -> None:
+    """
+    Raises a ValueError when body does not decode as json.loads decodes it.
+    Bodies that are not ASCII are decoded by chunks to keep the allocations small
+    """
+    if body.isascii():
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")("surrogatepass")
+    for start in range(0, len(body), _UTF8_CHUNK_SIZE):
+        decoder.decode(body[start : start + _UTF8_CHUNK_SIZE])
+    decoder.decode(b"", final=True)
+
+
+def locate_trapi_nodes(body: bytes) -> Optional[Tuple[Dict, Tuple[int, int]]]:
+    """
+    Decode message.knowledge_graph.nodes from the raw bytes of a TRAPI message.
+
+    Returns the nodes along with the (start, end) span of their JSON object in
+    body, None when the nodes cannot be extracted (the path is missing, the
+    nodes are not an object, their path is ambiguous or the JSON is malformed)
+    """
+    try:
+        index = _skip_whitespace(body, 0)
+        for key in TRAPI_NODES.keys:
+            if body[index] != ord("{"):
+                return None
+            index = _find_member(body, index, key)
+            if index is None:
+                return None
+        if body[index] != ord("{"):
+            return None
+        nodes_span = (index, _skip_container(body, index))
+        nodes = json.loads(body[nodes_span[0] : nodes_span[1]])
+
+        index = nodes_span[1]
+        for key in reversed(TRAPI_NODES.keys):
+            index = _finish_object(body, index, key)
+            if index is None:
+                return None
+        if _skip_whitespace(body, index) != len(body):
+            return None
+        _check_utf8(body)
+    except (ValueError, IndexError):
+        return None
+    if not isinstance(nodes, dict):
+        return None
+    return nodes, nodes_span
+
+
+def extract_trapi_nodes(body: bytes) -> Optional[Dict]:
+    """
+    Decode message.knowledge_graph.nodes from the raw bytes of a TRAPI message,
+    see locate_trapi_nodes. Callers decode the whole body when None is
+    returned to report the error as before
+    """
+    located_nodes = locate_trapi_nodes(body)
+    return None if located_nodes is None else located_nodes[0]
+
+
+def trapi_nodes_message(nodes: Dict) -> Dict:
+    """
+    The TRAPI message holding only the given knowledge graph nodes
+    """
+    return {"message": {"knowledge_graph": {"nodes": nodes}}}
+
+
+def _node_spans(body: bytes, nodes_start: int) -> Dict[str, Tuple[int, int]]:
+    """
+    Returns the (start, end) span of every node of the nodes object starting at
+    nodes_start, by node id. The nodes object was already validated by
+    locate_trapi_nodes
+    """
+    node_spans = {}
+    index = _skip_whitespace(body, nodes_start + 1)
+    if body[index] == ord("}"):
+        return node_spans
+    while True:
+        key_match = _STRING.match(body, index)
+        node_key = key_match.group()
+        node_id = json.loads(node_key) if b"\\" in node_key else node_key[1:-1].decode("utf-8")
+        index = _skip_whitespace(body, _skip_whitespace(body, key_match.end()) + 1)
+        node_end = _skip_container(body, index) if body[index] in _OPENING_BRACKETS else _skip_value(body, index)
+        node_spans[node_id] = (index, node_end)
+        index = _skip_whitespace(body, node_end)
+        if body[index] == ord("}"):
+            return node_spans
+        index = _skip_whitespace(body, index + 1)
+
+
+def _splice_attribute(body: bytes, node_span: Tuple[int, int], attribute: bytes, append: bool) -> Optional[bytes]:
+    """
+    Returns the JSON of the node at node_span with the attribute placed the way
+    Annotator.place_trapi_annotations places it, None when the node has a shape
+    the attribute cannot be placed in
+    """
+    node_start, node_end = node_span
+    if body[node_start] != ord("{"):
+        return None
+
+    attributes_start = _find_member(body, node_start, "attributes")
+    if attributes_start is None:
+        node_close = node_end - 1
+        separator = b"," if body[node_start + 1 : node_close].strip() else b""
+        return b"".join((body[node_start:node_close], separator, b'"attributes":[', attribute, b"]}"))
+
+    attributes_end = _skip_value(body, attributes_start)
+    if append and body[attributes_start] == ord("["):
+        attributes_close = attributes_end - 1
+        separator = b"," if body[attributes_start + 1 : attributes_close].strip() else b""
+        return b"".join((body[node_start:attributes_close], separator, attribute, body[attributes_close:node_end]))
+    if append and body[attributes_start:attributes_end] != b"null":
+        return None
+    return b"".join((body[node_start:attributes_start], b"[", attribute, b"]", body[attributes_end:node_end]))
+
+
+def splice_trapi_nodes(
+    body: bytes, nodes_span: Tuple[int, int], node_ids: Iterable[str], annotations: Dict[str, Any], append: bool
+) -> Optional[bytes]:
+    """
+    Serialize the node_ids nodes of the TRAPI message in body, as returned by
+    Annotator.annotate_trapi, with the annotations spliced into their original
+    JSON. Returns None when an annotated node cannot be spliced, callers then
+    place the annotations with Annotator.place_trapi_annotations
+    """
+    node_spans = _node_spans(body, nodes_span[0])
+    node_parts = []
+    for node_id in node_ids:
+        node_span = node_spans[node_id]
+        if node_id in annotations:
+            attribute = json.dumps(
+                {"attribute_type_id": TRAPI_ATTRIBUTE_TYPE_ID, "value": annotations[node_id]}, separators=(",", ":")
+            ).encode("utf-8")
+            node_json = _splice_attribute(body, node_span, attribute, append)
+            if node_json is None:
+                return None
+        else:
+            node_json = body[node_span[0] : node_span[1]]
+        node_parts.append(b"%s:%s" % (json.dumps(node_id).encode("utf-8"), node_json))
+    return b"{%s}" % b",".join(node_parts)
@@ -3,8 +3,9 @@ Collection of miscellaenous utility methods for the biothings_annotator package
 """
 
 import asyncio
+import functools
 import logging
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 
 try:
     from itertools import batched  # new in Python 3.12
@@ -218,13 +219,16 @@ def parse_curie(curie: str, return_type: bool = True, return_id: bool = True):
         return _id
 
 
-def group_by_subfield(collection: List[Dict], search_key: str) -> Dict:
+def group_by_subfield(collection: Iterable[Dict], search_key: str) -> Dict:
     """
     Takes a collection of dictionary entries with a specify subfield key "search_key" and
     extracts the subfield from each entry in the iterable into a dictionary.
 
     It the bins entries into the dictionary so that identical keys have all results in one
-    aggregated list across the entire collection of dictionary entries
+    aggregated list across the entire collection of dictionary entries. The collection is
+    consumed in a single pass, so it can be a generator. Backend clients able to group their
+    hits while parsing the response provide querymany_grouped instead (see
+    ElasticsearchAnnotatorClient.querymany_grouped)
 
     Example:
 
@@ -262,6 +266,84 @@ def group_by_subfield(collection: List[Dict], search_key: str) -> Dict:
     return sub_field_collection
 
 
+class DotfieldPath:
+    """
+    A dotfield like "chembl.drug_indications.mesh_id" split once into its keys,
+    see compile_dotfield
+
+    get follows the path strictly like get_dotfield_value, values walks it the
+    way BioThings fields are resolved: lists met along the path (including the
+    leaf value) are fanned out and documents missing a key are skipped
+    """
+
+    __slots__ = ("dotfield", "keys")
+
+    def __init__(self, dotfield: str):
+        self.dotfield = dotfield
+        self.keys = tuple(dotfield.split("."))
+
+    def get(self, d: Dict):
+        """
+        Return the value at the path. Raises KeyError when a key is missing
+        """
+        value = d
+        for key in self.keys:
+            value = value[key]
+        return value
+
+    def values(self, doc: Union[Dict, List]) -> Iterator:
+        """
+        Yield every value found at the path, in document order
+        """
+        keys = self.keys
+        depth_max = len(keys)
+        stack = [(doc, 0)]
+        while stack:
+            value, depth = stack.pop()
+            if isinstance(value, list):
+                stack.extend((item, depth) for item in reversed(value))
+            elif depth == depth_max:
+                yield value
+            elif isinstance(value, dict):
+                key = keys[depth]
+                if key in value:
+                    stack.append((value[key], depth + 1))
+
+    def remove(self, doc: Union[Dict, List]) -> None:
+        """
+        Remove every value found at the path, fanning out lists like values.
+        Objects and lists left empty by the removal are removed as well
+        """
+        self._remove(doc, 0)
+
+    def _remove(self, value, depth: int) -> bool:
+        """
+        Returns True when the removal left value empty
+        """
+        if isinstance(value, list):
+            value[:] = [item for item in value if not self._remove(item, depth)]
+            return not value
+        if not isinstance(value, dict):
+            return False
+        key = self.keys[depth]
+        if key not in value:
+            return False
+        if depth + 1 == len(self.keys) or self._remove(value[key], depth + 1):
+            del value[key]
+        return not value
+
+    def __repr__(self) -> str:
+        return f"DotfieldPath({self.dotfield!r})"
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_dotfield(dotfield: str) -> DotfieldPath:
+    """
+    Returns the compiled DotfieldPath of a dotfield, shared by all callers
+    """
+    return DotfieldPath(dotfield)
+
+
 def get_dotfield_value(dotfield: str, d: Dict):
     """
     Explore dictionary d using dotfield notation and return value.
@@ -274,9 +356,4 @@ def get_dotfield_value(dotfield: str, d: Dict):
     dependency from the package. This should make our dependencies a lot leaner
     biothings.api path: biothings.utils.common -> get_dotfield_value
     """
-    fields = dotfield.split(".")
-    if len(fields) == 1:
-        return d[fields[0]]
-    else:
-        first = fields[0]
-        return get_dotfield_value(".".join(fields[1:]), d[first])
+    return compile_dotfield(dotfield).get(d)
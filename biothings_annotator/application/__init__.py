@@ -5,7 +5,10 @@ import pathlib
 from sanic import Sanic
 
 from biothings_annotator.application.exceptions import build_exception_handers
+from biothings_annotator.application.listeners import build_listeners
+from biothings_annotator.application.metrics import configure_metrics
 from biothings_annotator.application.middleware import build_middleware
+from biothings_annotator.application.slow_requests import configure_slow_request_log
 from biothings_annotator.application.static import build_static_routes, build_static_content
 from biothings_annotator.application.telemetry import configure_telemetry
 from biothings_annotator.application.views import build_routes
@@ -52,6 +55,7 @@ def build_application(configuration: Dict = None) -> Sanic:
     Loads the following additional aspects for the webserver:
     > routes
     > middleware
+    > listeners
     > exception handlers
     """
     application_configuration = configuration["application"]["configuration"]
@@ -59,11 +63,14 @@ def build_application(configuration: Dict = None) -> Sanic:
 
     configuration_settings = {}
     configuration_settings.update(application_configuration)
+    configuration_settings.update(configuration["application"].get("sentry", {}))
     configuration_settings.update(extension_configuration["cors"])
 
     application = Sanic(name="biothings-annotator")
     application.update_config(configuration_settings)
     configure_telemetry(application, configuration["application"].get("telemetry", {}))
+    configure_metrics(application)
+    configure_slow_request_log(application)
 
     application_routes = build_routes()
     static_routes = build_static_routes()
@@ -93,6 +100,15 @@ def build_application(configuration: Dict = None) -> Sanic:
             logger.error("Unable to add middleware %s", middleware)
             raise gen_exc
 
+    application_listeners = build_listeners()
+    for listener in application_listeners:
+        try:
+            application.register_listener(**listener)
+        except Exception as gen_exc:
+            logger.exception(gen_exc)
+            logger.error("Unable to add listener %s", listener)
+            raise gen_exc
+
     exception_handlers = build_exception_handers()
     for exception_handler in exception_handlers:
         try:
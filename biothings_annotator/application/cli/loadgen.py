@@ -0,0 +1,99 @@
+"""
+Command line interface of the annotator load generator
+
+>>> python3 -m biothings_annotator loadgen tests/data/cleaned_annotator_logs.json --url http://localhost:9000
+"""
+
+from argparse import ArgumentParser, Namespace
+from typing import List, Optional
+import asyncio
+import json
+import logging
+
+from biothings_annotator.application.loadgen import LoadGenerator, load_workload, parse_mix
+
+logging.basicConfig()
+logger = logging.getLogger("sanic-application")
+logger.setLevel(logging.DEBUG)
+
+LOADGEN_COMMAND = "loadgen"
+
+
+class LoadGeneratorCLI:
+    """
+    Sends the annotation queries of a log to a running annotator and reports the
+    latency distribution and error rates, see biothings_annotator.application.loadgen
+    """
+
+    def __init__(self):
+        self.parser = ArgumentParser(
+            prog=f"biothings-annotator {LOADGEN_COMMAND}",
+            description="Load generator for the biothings annotator service",
+        )
+        self.parser.add_argument("workload", help="Annotation log holding the queries to send")
+        self.parser.add_argument("--url", default="http://localhost:9000", help="Base url of the annotator")
+        self.parser.add_argument(
+            "--mix",
+            type=parse_mix,
+            default=None,
+            help="Weights of the query kinds, such as curie=0.6,batch_curie=0.3,trapi=0.1. Log proportions by default",
+        )
+        self.parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at most")
+        self.parser.add_argument(
+            "--rps",
+            type=float,
+            default=None,
+            help="Requests started per second, as many as --concurrency allows when unset",
+        )
+        self.parser.add_argument("--duration", type=float, default=None, help="Seconds to send requests for (30)")
+        self.parser.add_argument("--requests", type=int, default=None, help="Number of requests to send")
+        self.parser.add_argument("--timeout", type=float, default=60.0, help="Timeout of every request in seconds")
+        self.parser.add_argument("--seed", type=int, default=None, help="Seed of the query selection")
+        self.parser.add_argument("--output", default=None, help="File the JSON report is written to")
+        self.parser.add_argument(
+            "--max-error-rate",
+            type=float,
+            default=None,
+            help="Exit with status 1 when the error rate exceeds this value",
+        )
+        self.args: Optional[Namespace] = None
+
+    def parse(self, additional_args: Optional[List[str]] = None) -> Namespace:
+        self.args = self.parser.parse_args(args=additional_args)
+        if self.args.duration is None and self.args.requests is None:
+            self.args.duration = 30.0
+        return self.args
+
+    def run(self, transport=None) -> int:
+        """
+        Runs the load generator with the parsed arguments. Returns the exit status
+        """
+        workload = load_workload(self.args.workload)
+        load_generator = LoadGenerator(
+            base_url=self.args.url,
+            workload=workload,
+            mix=self.args.mix,
+            concurrency=self.args.concurrency,
+            rps=self.args.rps,
+            timeout=self.args.timeout,
+            transport=transport,
+            seed=self.args.seed,
+        )
+        logger.info(
+            "Sending the %s queries of %s to %s",
+            sum(len(queries) for queries in workload.values()),
+            self.args.workload,
+            self.args.url,
+        )
+        report = asyncio.run(load_generator.run(duration=self.args.duration, requests=self.args.requests))
+
+        report_text = json.dumps(report, indent=4)
+        if self.args.output:
+            with open(self.args.output, "w", encoding="utf-8") as file_handle:
+                file_handle.write(report_text)
+        print(report_text)
+
+        if self.args.max_error_rate is not None and report["error_rate"] > self.args.max_error_rate:
+            logger.error("Error rate %.4f exceeds %.4f", report["error_rate"], self.args.max_error_rate)
+            return 1
+        return 0
@@ -9,13 +9,24 @@
 Parallel implementation to our defacto implementation of tornado
 """
 
+import sys
+
 from biothings_annotator.application.cli.interface import AnnotatorCLI
+from biothings_annotator.application.cli.loadgen import LOADGEN_COMMAND, LoadGeneratorCLI
 
 
 def main():
     """
     The entry point for launching the sanic server instance from CLI
+
+    `biothings-annotator loadgen ...` runs the load generator instead, see
+    biothings_annotator.application.cli.loadgen
     """
+    if sys.argv[1:2] == [LOADGEN_COMMAND]:
+        load_generator = LoadGeneratorCLI()
+        load_generator.parse(sys.argv[2:])
+        return load_generator.run()
+
     application = AnnotatorCLI()
     application.attach()
     application.parse()
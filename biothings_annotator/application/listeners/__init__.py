@@ -1,5 +1,7 @@
 from typing import Dict, List
 
+from .health import start_health_monitor
+from .metadata import load_build_metadata
 from .sentry import initialize_sentry
 
 
@@ -9,5 +11,7 @@ def build_listeners() -> List[Dict]:
     for the annotator service
     """
     sentry_listener = {"listener": initialize_sentry, "event": "before_server_start", "priority": 0}
-    listener_collection = [sentry_listener]
+    health_listener = {"listener": start_health_monitor, "event": "after_server_start", "priority": 0}
+    metadata_listener = {"listener": load_build_metadata, "event": "after_server_start", "priority": 0}
+    listener_collection = [sentry_listener, health_listener, metadata_listener]
     return listener_collection
@@ -0,0 +1,121 @@
+"""
+Listener running the periodic deep status check of the annotator service
+
+Every worker probes its query backends in the background and keeps the latest
+result in memory, so the readiness endpoint answers from that cached report
+instead of issuing a backend round trip on every Kubernetes or load balancer
+health check
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import sanic
+
+from biothings_annotator.annotator import Annotator
+
+logger = logging.getLogger(__name__)
+
+STATUS_CHECK_CURIE = "NCBIGene:1017"
+
+DEFAULT_HEALTH_SETTINGS = {
+    "STATUS_CHECK_INTERVAL": 30,
+    "STATUS_CHECK_TIMEOUT": 10,
+    "STATUS_CHECK_BACKENDS": [],
+}
+
+
+class HealthMonitor:
+    """
+    Periodically annotates STATUS_CHECK_CURIE against every configured query
+    backend and caches the outcome and latency of the last check
+    """
+
+    def __init__(self, backends: List[str], interval: float, timeout: float):
+        self.backends = backends
+        self.interval = interval
+        self.timeout = timeout
+        self.report: Optional[Dict] = None
+
+    async def check_backend(self, backend: str) -> Dict:
+        started = time.monotonic()
+        try:
+            annotator = Annotator(query_backend=backend)
+            resolved = annotator.resolver.resolve(STATUS_CHECK_CURIE)
+            scopes = annotator.resolver.scopes(resolved.scope_key)
+            annotation = await asyncio.wait_for(
+                annotator.query_annotations(resolved.node_type, [resolved.query_id], fields="_id", scopes=scopes),
+                self.timeout,
+            )
+            hits = annotation.get(resolved.query_id, [])
+            healthy = any(not hit.get("notfound", False) for hit in hits)
+            error = None if healthy else "Service unavailable due to a failed data check!"
+        except Exception as exc:
+            healthy = False
+            error = repr(exc)
+        latency = time.monotonic() - started
+
+        return {"healthy": healthy, "latency_ms": round(latency * 1000, 3), "error": error}
+
+    async def run_check(self) -> Dict:
+        backend_reports = await asyncio.gather(*(self.check_backend(backend) for backend in self.backends))
+        report = {
+            "ready": all(backend_report["healthy"] for backend_report in backend_reports),
+            "checked_at": time.time(),
+            "backends": dict(zip(self.backends, backend_reports)),
+        }
+        if not report["ready"]:
+            logger.warning("Deep status check failed: %s", report["backends"])
+        self.report = report
+        return report
+
+    def readiness(self) -> Tuple[Dict, bool]:
+        """
+        Returns the cached report along with its age. A report older than a few
+        check intervals means the background check stopped and counts as not ready
+        """
+        if self.report is None:
+            return {"ready": False, "error": "The first deep status check has not completed yet"}, False
+
+        age = time.time() - self.report["checked_at"]
+        report = {**self.report, "age": round(age, 3)}
+        if age > 3 * self.interval + self.timeout:
+            report["ready"] = False
+            report["error"] = "The deep status check result is stale"
+        return report, report["ready"]
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.run_check()
+            except Exception as exc:
+                logger.exception("Unexpected error while running the deep status check: %r", exc)
+            await asyncio.sleep(self.interval)
+
+
+def health_settings(config) -> Dict:
+    return {name: config.get(name, default) for name, default in DEFAULT_HEALTH_SETTINGS.items()}
+
+
+async def start_health_monitor(application_instance: sanic.Sanic) -> None:
+    """
+    Listener starting the background deep status check of the current worker
+
+    A STATUS_CHECK_INTERVAL of 0 disables the background check, in which case
+    the readiness endpoint reports the worker as not ready
+    """
+    if getattr(application_instance.ctx, "health_monitor", None) is not None:
+        return
+
+    settings = health_settings(application_instance.config)
+    interval = float(settings["STATUS_CHECK_INTERVAL"])
+    if interval <= 0:
+        logger.info("Deep status check disabled")
+        return
+
+    backends = list(settings["STATUS_CHECK_BACKENDS"]) or [Annotator().query_backend]
+    monitor = HealthMonitor(backends=backends, interval=interval, timeout=float(settings["STATUS_CHECK_TIMEOUT"]))
+    application_instance.ctx.health_monitor = monitor
+    application_instance.add_task(monitor.run_forever(), name="status-deep-check")
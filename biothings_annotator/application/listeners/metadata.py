@@ -0,0 +1,24 @@
+"""
+Listener loading the version and build metadata served by the
+/version endpoint once per worker
+"""
+
+import logging
+
+import sanic
+
+from biothings_annotator.application.views.metadata import VersionView
+
+logger = logging.getLogger(__name__)
+
+
+async def load_build_metadata(application_instance: sanic.Sanic) -> None:
+    """
+    Listener reading version.txt and building the pre-serialized /version
+    response at worker start
+    """
+    try:
+        VersionView().load_build_metadata(application_instance)
+    except Exception as exc:
+        # The /version endpoint retries loading the metadata on its first request
+        logger.error(f"Unable to load the build metadata: {exc}")
@@ -3,12 +3,76 @@ Listener for configuring the sentry support for the
 sanic web-app associated with the annotator service
 """
 
+import re
+from typing import Callable, Dict, List, Mapping, Tuple, Union
+
 import sanic
 
 import sentry_sdk
 from sentry_sdk.integrations.asyncio import AsyncioIntegration
 from sentry_sdk.integrations.sanic import SanicIntegration
 
+DEFAULT_SENTRY_SETTINGS = {
+    "SENTRY_CLIENT_KEY": "",
+    "SENTRY_TRACES_SAMPLE_RATE": 0.05,
+    "SENTRY_PROFILES_SAMPLE_RATE": 0.2,
+    "SENTRY_ROUTE_SAMPLE_RATES": {},
+    "SENTRY_LARGE_REQUEST_BYTES": 1000000,
+    "SENTRY_SLOW_REQUEST_SECONDS": 10,
+}
+
+
+def sentry_settings(config) -> Dict:
+    return {name: config.get(name, default) for name, default in DEFAULT_SENTRY_SETTINGS.items()}
+
+
+def request_content_length(request) -> int:
+    try:
+        return int(request.headers.get("content-length", 0))
+    except ValueError:
+        return 0
+
+
+def build_traces_sampler(
+    route_sample_rates: Mapping[str, float], default_sample_rate: float, large_request_bytes: int
+) -> Callable[[Dict], Union[float, bool]]:
+    """
+    Returns a sentry traces_sampler picking the sample rate of a transaction by
+    request path
+
+    route_sample_rates maps path regular expressions to sample rates, the first
+    matching expression wins and unmatched paths use default_sample_rate. The
+    sampling decision of an upstream service is kept. When the sanic request is
+    part of the sampling context, requests of at least large_request_bytes are
+    always sampled
+
+    The route of a request is only resolved after sentry starts its
+    transaction, so the rules match the path the transaction is named after
+    """
+    rules: List[Tuple[re.Pattern, float]] = [
+        (re.compile(pattern), float(sample_rate)) for pattern, sample_rate in route_sample_rates.items()
+    ]
+
+    def traces_sampler(sampling_context: Dict) -> Union[float, bool]:
+        parent_sampled = sampling_context.get("parent_sampled", None)
+        if parent_sampled is not None:
+            return parent_sampled
+
+        request = sampling_context.get("sanic_request", None)
+        if request is not None:
+            path = request.path
+            if request_content_length(request) >= large_request_bytes:
+                return True
+        else:
+            path = sampling_context.get("transaction_context", {}).get("name", "") or ""
+
+        for pattern, sample_rate in rules:
+            if pattern.search(path) is not None:
+                return sample_rate
+        return default_sample_rate
+
+    return traces_sampler
+
 
 async def initialize_sentry(application_instance: sanic.Sanic) -> None:
     """
@@ -16,10 +80,18 @@ async def initialize_sentry(application_instance: sanic.Sanic) -> None:
 
     Set the sample rate for transactions
     https://docs.sentry.io/platforms/python/configuration/options/#traces-sample-rate
+    The rate is picked per request by build_traces_sampler from
+    SENTRY_ROUTE_SAMPLE_RATES, falling back to SENTRY_TRACES_SAMPLE_RATE
+    https://docs.sentry.io/platforms/python/configuration/sampling/#setting-a-sampling-function
 
-    Set the profiles sample rate for transactions
+    Set the profiles sample rate for transactions, relative to the sampled transactions
     https://docs.sentry.io/platforms/python/profiling/
     """
+    settings = sentry_settings(application_instance.config)
+    sentry_key = settings["SENTRY_CLIENT_KEY"]
+    if not sentry_key:
+        return
+
     # https://docs.sentry.io/platforms/python/integrations/asyncio/
     async_integration = AsyncioIntegration()
 
@@ -29,11 +101,15 @@ async def initialize_sentry(application_instance: sanic.Sanic) -> None:
         # transactions for all HTTP status codes, including 404
         unsampled_statuses=None,
     )
-    sentry_configuration = application_instance.config.get("sentry", {})
-    sentry_key = sentry_configuration.get("SENTRY_CLIENT_KEY", "")
+    traces_sampler = build_traces_sampler(
+        settings["SENTRY_ROUTE_SAMPLE_RATES"],
+        float(settings["SENTRY_TRACES_SAMPLE_RATE"]),
+        int(settings["SENTRY_LARGE_REQUEST_BYTES"]),
+    )
     sentry_sdk.init(
         dsn=sentry_key,
-        traces_sample_rate=0.20,
-        profiles_sample_rate=0.20,
+        traces_sampler=traces_sampler,
+        profiles_sample_rate=float(settings["SENTRY_PROFILES_SAMPLE_RATE"]),
         integrations=[async_integration, sanic_integration],
     )
+    application_instance.ctx.sentry_enabled = True
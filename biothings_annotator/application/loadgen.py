@@ -0,0 +1,294 @@
+"""
+Load generator for the annotator service
+
+Drives a running annotator with the GET /curie/<curie>, POST /curie and
+POST /trapi queries of an annotation log (the format of
+tests/data/cleaned_annotator_logs.json), drawn in a configurable mix:
+
+> closed loop: `concurrency` clients each send their next request as soon as
+  the previous one is answered
+> open loop: requests start at a fixed rate of `rps` per second, with at most
+  `concurrency` of them in flight. Latencies are measured from the scheduled
+  start of every request, so a slow server is not hidden by delayed starts
+
+The report holds the throughput, the latency distribution, the status codes and
+the error rate, overall and by kind of query. Transport errors, 5xx and 429
+responses count as errors. The httpx transport can be injected, e.g. an
+httpx.ASGITransport to load an in-process application
+"""
+
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+import asyncio
+import collections
+import json
+import logging
+import math
+import random
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+LoadQuery = Tuple[str, str, Optional[Dict]]
+
+CURIE_QUERY = "curie"
+BATCH_CURIE_QUERY = "batch_curie"
+TRAPI_QUERY = "trapi"
+QUERY_KINDS = (CURIE_QUERY, BATCH_CURIE_QUERY, TRAPI_QUERY)
+
+# the deprecated /annotator endpoints of older logs, sent to their replacements
+LEGACY_ENDPOINTS = {
+    ("GET", "/annotator/"): "/curie/",
+    ("POST", "/annotator/"): "/trapi/",
+}
+
+
+def classify_query(method: str, endpoint: str) -> Optional[str]:
+    path = endpoint.split("?", 1)[0].rstrip("/")
+    if method == "GET" and path.startswith("/curie/"):
+        return CURIE_QUERY
+    if method == "POST" and path == "/curie":
+        return BATCH_CURIE_QUERY
+    if method == "POST" and path == "/trapi":
+        return TRAPI_QUERY
+    return None
+
+
+def load_logged_queries(log_file: Union[str, Path]) -> List[LoadQuery]:
+    """
+    Returns the (method, endpoint, json body) of every logged query, see
+    LEGACY_ENDPOINTS
+    """
+    with open(str(log_file), "r", encoding="utf-8") as file_handle:
+        query_list = json.load(file_handle)
+
+    logged_queries = []
+    for user_query in query_list:
+        method, endpoint, _ = user_query["request"].split(" ")
+        for (legacy_method, legacy_prefix), prefix in LEGACY_ENDPOINTS.items():
+            if method == legacy_method and endpoint.startswith(legacy_prefix):
+                endpoint = prefix + endpoint[len(legacy_prefix) :]
+        body = user_query.get("body", "")
+        logged_queries.append((method, endpoint, json.loads(body) if body else None))
+    return logged_queries
+
+
+def load_workload(log_file: Union[str, Path]) -> Dict[str, List[LoadQuery]]:
+    """
+    Returns the (method, endpoint, json body) of the logged annotation queries
+    by kind of query. Other logged requests are left out
+    """
+    workload = {}
+    for method, endpoint, body in load_logged_queries(log_file):
+        query_kind = classify_query(method, endpoint)
+        if query_kind is not None:
+            workload.setdefault(query_kind, []).append((method, endpoint, body))
+    return workload
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parses a query mix such as "curie=0.6,batch_curie=0.3,trapi=0.1"
+    """
+    weights = {}
+    for entry in mix.split(","):
+        query_kind, separator, weight = entry.partition("=")
+        query_kind = query_kind.strip()
+        if not separator or query_kind not in QUERY_KINDS:
+            raise ValueError(f"Invalid query mix entry {entry!r}, expected <kind>=<weight> with kind in {QUERY_KINDS}")
+        weights[query_kind] = float(weight)
+        if weights[query_kind] < 0:
+            raise ValueError(f"Invalid query mix entry {entry!r}, weights cannot be negative")
+    return weights
+
+
+def percentile(sorted_values: List[float], rank: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values
+    """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(rank / 100 * len(sorted_values)) - 1, 0)]
+
+
+def is_error_status(status: int) -> bool:
+    return status >= 500 or status == 429
+
+
+class LoadResults:
+    """
+    Latencies, status codes and transport errors of the sent requests, by kind of query
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = collections.defaultdict(list)
+        self.status_codes: Dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+        self.errors: Dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+
+    def record(self, query_kind: str, latency: float, status: Optional[int] = None, error: Optional[str] = None):
+        self.latencies[query_kind].append(latency)
+        if status is not None:
+            self.status_codes[query_kind][status] += 1
+            if is_error_status(status):
+                self.errors[query_kind][f"status:{status}"] += 1
+        if error is not None:
+            self.errors[query_kind][error] += 1
+
+    @staticmethod
+    def _summarize(latencies: List[float], status_codes: Mapping[int, int], errors: Mapping[str, int]) -> Dict:
+        sorted_latencies = sorted(latencies)
+        request_count = len(sorted_latencies)
+        error_count = sum(errors.values())
+        return {
+            "requests": request_count,
+            "error_rate": error_count / request_count if request_count else 0.0,
+            "errors": dict(sorted(errors.items())),
+            "status_codes": {str(status): count for status, count in sorted(status_codes.items())},
+            "latency": {
+                "mean": sum(sorted_latencies) / request_count if request_count else 0.0,
+                "p50": percentile(sorted_latencies, 50),
+                "p90": percentile(sorted_latencies, 90),
+                "p95": percentile(sorted_latencies, 95),
+                "p99": percentile(sorted_latencies, 99),
+                "max": sorted_latencies[-1] if sorted_latencies else 0.0,
+            },
+        }
+
+    def summarize(self) -> Dict:
+        summary = self._summarize(
+            [latency for latencies in self.latencies.values() for latency in latencies],
+            sum(self.status_codes.values(), collections.Counter()),
+            sum(self.errors.values(), collections.Counter()),
+        )
+        summary["kinds"] = {
+            query_kind: self._summarize(latencies, self.status_codes[query_kind], self.errors[query_kind])
+            for query_kind, latencies in sorted(self.latencies.items())
+        }
+        return summary
+
+
+class LoadGenerator:
+    """
+    Sends the queries of a workload to base_url, see the module docstring
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        workload: Mapping[str, List[LoadQuery]],
+        mix: Optional[Mapping[str, float]] = None,
+        concurrency: int = 8,
+        rps: Optional[float] = None,
+        timeout: float = 60.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        seed: Optional[int] = None,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if rps is not None and rps <= 0:
+            raise ValueError("rps must be positive")
+
+        # the log proportions of every kind of query by default
+        mix = mix if mix is not None else {query_kind: len(queries) for query_kind, queries in workload.items()}
+        self.query_kinds = [query_kind for query_kind, weight in mix.items() if weight > 0 and workload.get(query_kind)]
+        if not self.query_kinds:
+            raise ValueError(f"The workload holds none of the query kinds of the mix {dict(mix)}")
+        self.weights = [mix[query_kind] for query_kind in self.query_kinds]
+
+        self.base_url = base_url
+        self.workload = workload
+        self.concurrency = concurrency
+        self.rps = rps
+        self.timeout = timeout
+        self.transport = transport
+        self.random = random.Random(seed)
+
+    def next_query(self) -> Tuple[str, LoadQuery]:
+        query_kind = self.random.choices(self.query_kinds, weights=self.weights)[0]
+        return query_kind, self.random.choice(self.workload[query_kind])
+
+    async def _send(
+        self, client: httpx.AsyncClient, results: LoadResults, query_kind: str, query: LoadQuery, started: float
+    ) -> None:
+        method, endpoint, body = query
+        try:
+            response = await client.request(method=method, url=endpoint, json=body)
+        except httpx.HTTPError as exc:
+            results.record(query_kind, time.perf_counter() - started, error=type(exc).__name__)
+        else:
+            results.record(query_kind, time.perf_counter() - started, status=response.status_code)
+
+    async def _run_closed_loop(
+        self, client: httpx.AsyncClient, results: LoadResults, deadline: float, requests: Optional[int]
+    ) -> None:
+        sent = 0
+
+        async def _client_loop():
+            nonlocal sent
+            while (requests is None or sent < requests) and time.perf_counter() < deadline:
+                sent += 1
+                query_kind, query = self.next_query()
+                await self._send(client, results, query_kind, query, time.perf_counter())
+
+        await asyncio.gather(*(_client_loop() for _ in range(self.concurrency)))
+
+    async def _run_open_loop(
+        self, client: httpx.AsyncClient, results: LoadResults, deadline: float, requests: Optional[int]
+    ) -> None:
+        slots = asyncio.Semaphore(self.concurrency)
+        pending = set()
+
+        async def _paced_send(query_kind: str, query: LoadQuery, scheduled: float):
+            try:
+                await self._send(client, results, query_kind, query, scheduled)
+            finally:
+                slots.release()
+
+        start = time.perf_counter()
+        index = 0
+        while requests is None or index < requests:
+            scheduled = start + index / self.rps
+            if scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await slots.acquire()
+            task = asyncio.create_task(_paced_send(*self.next_query(), scheduled))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            index += 1
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def run(self, duration: Optional[float] = None, requests: Optional[int] = None) -> Dict:
+        """
+        Sends requests for duration seconds or until requests requests were
+        sent, whichever comes first, and returns the report
+        """
+        if duration is None and requests is None:
+            raise ValueError("Either a duration or a number of requests is required")
+
+        results = LoadResults()
+        async with httpx.AsyncClient(base_url=self.base_url, transport=self.transport, timeout=self.timeout) as client:
+            start = time.perf_counter()
+            deadline = start + duration if duration is not None else math.inf
+            if self.rps is None:
+                await self._run_closed_loop(client, results, deadline, requests)
+            else:
+                await self._run_open_loop(client, results, deadline, requests)
+            elapsed = time.perf_counter() - start
+
+        summary = results.summarize()
+        return {
+            "target": self.base_url,
+            "mode": "open" if self.rps is not None else "closed",
+            "concurrency": self.concurrency,
+            "target_rps": self.rps,
+            "mix": dict(zip(self.query_kinds, self.weights)),
+            "elapsed": elapsed,
+            "throughput": summary["requests"] / elapsed if elapsed else 0.0,
+            **summary,
+        }
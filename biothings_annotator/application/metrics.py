@@ -0,0 +1,325 @@
+"""
+Prometheus metrics of the annotator web application
+
+Every sanic worker records its request metrics in the process-local registry
+of biothings_annotator.annotator.metrics, along with the backend call metrics
+recorded by the Annotator. The cache and queue gauges are collected from the
+worker state whenever the worker takes a snapshot of its registry.
+
+To aggregate the metrics across the workers, every worker periodically writes
+its snapshot to <METRICS_DIRECTORY>/<pid>.json. The /metrics endpoint merges the
+in-memory snapshot of the worker serving the scrape with the recent snapshots
+of the other workers, so any worker answers for the whole server. The snapshot
+files are written and read in the default executor, off the event loop, and a
+scrape only reads them. Without a
+configured METRICS_DIRECTORY the main process creates a temporary directory
+shared with the workers it spawns
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import weakref
+from typing import Dict, List
+
+import sanic
+from sanic.request import Request
+
+from biothings_annotator.annotator import transformer
+from biothings_annotator.annotator.metrics import REGISTRY, merge_snapshots, render_prometheus
+from biothings_annotator.annotator.resolver import curie_cache_stats
+from biothings_annotator.annotator.scheduler import get_scheduler
+from biothings_annotator.application.middleware.admission import request_route_name
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIRECTORY_ENV = "ANNOTATOR_METRICS_DIRECTORY"
+
+DEFAULT_METRICS_SETTINGS = {
+    "METRICS_ENABLED": True,
+    "METRICS_DIRECTORY": "",
+    "METRICS_SNAPSHOT_INTERVAL": 5,
+}
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "annotator_http_request_duration_seconds",
+    "Duration of the HTTP requests, from the request middleware to the response",
+    ("route", "method", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "annotator_http_requests_in_flight", "Number of HTTP requests being served", ("route",)
+)
+WORKERS = REGISTRY.gauge("annotator_workers", "Number of workers whose metrics are aggregated")
+CURIE_CACHE_HITS = REGISTRY.counter(
+    "annotator_curie_cache_hits_total", "Hits of the CURIE caches", ("cache", "query_backend")
+)
+CURIE_CACHE_MISSES = REGISTRY.counter(
+    "annotator_curie_cache_misses_total", "Misses of the CURIE caches", ("cache", "query_backend")
+)
+CURIE_CACHE_SIZE = REGISTRY.gauge(
+    "annotator_curie_cache_size", "Number of entries of the CURIE caches", ("cache", "query_backend")
+)
+ATC_CACHE_SIZE = REGISTRY.gauge(
+    "annotator_atc_cache_size", "Number of loaded WHO ATC code-to-name mappings", ("source",), merge_mode="max"
+)
+ATC_CACHE_LOADED = REGISTRY.gauge(
+    "annotator_atc_cache_loaded_timestamp_seconds",
+    "Unix time the WHO ATC code-to-name mapping was loaded at",
+    ("source",),
+    merge_mode="min",
+)
+SCHEDULER_QUEUE_DEPTH = REGISTRY.gauge(
+    "annotator_scheduler_queue_depth", "Number of backend query chunks waiting for a scheduler slot"
+)
+SCHEDULER_ACTIVE = REGISTRY.gauge("annotator_scheduler_active_slots", "Number of scheduler slots in use")
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "annotator_admission_queue_depth", "Number of annotation requests waiting for admission"
+)
+ADMISSION_INFLIGHT = REGISTRY.gauge(
+    "annotator_admission_inflight", "Number of admitted annotation requests", ("budget",)
+)
+ADMISSION_INFLIGHT_CURIES = REGISTRY.gauge(
+    "annotator_admission_inflight_curies", "Number of CURIEs carried by the admitted batch annotation requests"
+)
+
+# Derived from the merged snapshot when rendering
+CURIE_CACHE_HIT_RATIO = "annotator_curie_cache_hit_ratio"
+ATC_CACHE_AGE = "annotator_atc_cache_age_seconds"
+
+
+def metrics_settings(config) -> Dict:
+    return {name: config.get(name, default) for name, default in DEFAULT_METRICS_SETTINGS.items()}
+
+
+def metrics_directory(application: sanic.Sanic) -> str:
+    return metrics_settings(application.config)["METRICS_DIRECTORY"] or os.environ.get(METRICS_DIRECTORY_ENV, "")
+
+
+async def start_request_metrics(request: Request):
+    """
+    Request middleware counting the request as in flight. The gauge is also
+    decremented when a request is dropped without a response (client disconnects)
+    """
+    route = request_route_name(request) or "unmatched"
+    HTTP_REQUESTS_IN_FLIGHT.inc(route=route)
+    request.ctx.metrics_route = route
+    request.ctx.metrics_started = time.perf_counter()
+    request.ctx.metrics_release = weakref.finalize(request, HTTP_REQUESTS_IN_FLIGHT.dec, route=route)
+
+
+async def finish_request_metrics(request: Request, response):
+    """
+    Response middleware observing the request duration
+    """
+    release = getattr(request.ctx, "metrics_release", None)
+    if release is None:
+        return
+    release()
+    HTTP_REQUEST_DURATION.observe(
+        time.perf_counter() - request.ctx.metrics_started,
+        route=request.ctx.metrics_route,
+        method=request.method,
+        status=response.status,
+    )
+
+
+def collect_worker_gauges(application: sanic.Sanic) -> None:
+    """
+    Set the cache and queue gauges from the current state of the worker
+    """
+    WORKERS.set(1)
+
+    cache_stats = curie_cache_stats()
+    cache_entries = [("unquote", "", cache_stats["unquote"])]
+    cache_entries.extend(("resolve", query_backend, stats) for query_backend, stats in cache_stats["resolve"].items())
+    for cache, query_backend, stats in cache_entries:
+        CURIE_CACHE_HITS.set(stats["hits"], cache=cache, query_backend=query_backend)
+        CURIE_CACHE_MISSES.set(stats["misses"], cache=cache, query_backend=query_backend)
+        CURIE_CACHE_SIZE.set(stats["size"], cache=cache, query_backend=query_backend)
+
+    ATC_CACHE_SIZE.clear()
+    ATC_CACHE_LOADED.clear()
+    for source, atc_mapping in transformer.atc_cache.items():
+        ATC_CACHE_SIZE.set(len(atc_mapping), source=source)
+        loaded_at = transformer.atc_cache_loaded_at.get(source, None)
+        if loaded_at is not None:
+            ATC_CACHE_LOADED.set(loaded_at, source=source)
+
+    scheduler = get_scheduler()
+    SCHEDULER_QUEUE_DEPTH.set(scheduler.queue_depth)
+    SCHEDULER_ACTIVE.set(scheduler.active)
+
+    admission_controller = getattr(application.ctx, "admission_controller", None)
+    if admission_controller is not None:
+        ADMISSION_QUEUE_DEPTH.set(admission_controller.queue_depth)
+        for budget, inflight in admission_controller.inflight.items():
+            ADMISSION_INFLIGHT.set(inflight, budget=budget)
+        ADMISSION_INFLIGHT_CURIES.set(admission_controller.inflight_curies)
+
+
+def worker_snapshot(application: sanic.Sanic) -> Dict:
+    collect_worker_gauges(application)
+    return {"pid": os.getpid(), "written_at": time.time(), "metrics": REGISTRY.snapshot()}
+
+
+def write_snapshot_file(directory: str, snapshot: Dict) -> None:
+    """
+    Atomically replace the snapshot file of the worker
+    """
+    snapshot_path = os.path.join(directory, f"{snapshot['pid']}.json")
+    temporary_path = f"{snapshot_path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as snapshot_file:
+        json.dump(snapshot, snapshot_file)
+    os.replace(temporary_path, snapshot_path)
+
+
+async def export_worker_snapshot(application: sanic.Sanic, directory: str) -> Dict:
+    """
+    Take a snapshot of the worker and write it in the default executor, returns
+    the snapshot. The registry is only read on the event loop
+    """
+    snapshot = worker_snapshot(application)
+    await asyncio.get_running_loop().run_in_executor(None, write_snapshot_file, directory, snapshot)
+    return snapshot
+
+
+def read_worker_snapshots(directory: str, max_age: float) -> List[Dict]:
+    """
+    Returns the snapshots of the workers written within the last max_age
+    seconds. Older snapshots belong to stopped workers and are left out
+    """
+    oldest = time.time() - max_age
+    with os.scandir(directory) as entries:
+        snapshot_paths = [entry.path for entry in entries if entry.name.endswith(".json")]
+    snapshots = []
+    for snapshot_path in snapshot_paths:
+        try:
+            with open(snapshot_path, "r", encoding="utf-8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            continue
+        if snapshot.get("written_at", 0) >= oldest:
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def add_derived_metrics(merged: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Add the metrics computed from the aggregated samples: the CURIE cache hit
+    ratios and the age of the oldest copy of the ATC caches
+    """
+    hits = {tuple(labels): value for labels, value in merged[CURIE_CACHE_HITS.name]["samples"]}
+    misses = {tuple(labels): value for labels, value in merged[CURIE_CACHE_MISSES.name]["samples"]}
+    merged[CURIE_CACHE_HIT_RATIO] = {
+        "type": "gauge",
+        "help": "Ratio of the CURIE cache lookups that were hits, across the workers",
+        "labels": list(CURIE_CACHE_HITS.labelnames),
+        "samples": [
+            [list(labels), hit_count / (hit_count + misses.get(labels, 0.0)) if hit_count else 0.0]
+            for labels, hit_count in hits.items()
+        ],
+    }
+
+    now = time.time()
+    merged[ATC_CACHE_AGE] = {
+        "type": "gauge",
+        "help": "Age of the oldest loaded WHO ATC code-to-name mapping, in seconds",
+        "labels": list(ATC_CACHE_LOADED.labelnames),
+        "samples": [
+            [labels, max(now - loaded_at, 0.0)] for labels, loaded_at in merged[ATC_CACHE_LOADED.name]["samples"]
+        ],
+    }
+    return merged
+
+
+async def collect_metrics(application: sanic.Sanic) -> str:
+    """
+    Returns the metrics of all the workers in the Prometheus text format. The
+    snapshot files of the other workers are read in the default executor, the
+    snapshot file of the worker is left to the periodic exporter
+    """
+    snapshots: List[Dict] = [worker_snapshot(application)]
+    directory = metrics_directory(application)
+    if directory:
+        interval = float(metrics_settings(application.config)["METRICS_SNAPSHOT_INTERVAL"])
+        try:
+            worker_snapshots = await asyncio.get_running_loop().run_in_executor(
+                None, read_worker_snapshots, directory, 3 * interval
+            )
+        except OSError as exc:
+            logger.warning("Unable to read the metrics snapshots of the workers: %r", exc)
+            worker_snapshots = []
+        snapshots.extend(snapshot for snapshot in worker_snapshots if snapshot["pid"] != snapshots[0]["pid"])
+    merged = merge_snapshots(snapshot["metrics"] for snapshot in snapshots)
+    return render_prometheus(add_derived_metrics(merged))
+
+
+async def prepare_metrics_directory(application: sanic.Sanic) -> None:
+    """
+    Main process listener creating the temporary snapshot directory shared with
+    the workers when no METRICS_DIRECTORY is configured
+    """
+    if metrics_directory(application):
+        return
+    directory = tempfile.mkdtemp(prefix="biothings-annotator-metrics-")
+    os.environ[METRICS_DIRECTORY_ENV] = directory
+    application.ctx.temporary_metrics_directory = directory
+
+
+async def remove_metrics_directory(application: sanic.Sanic) -> None:
+    directory = getattr(application.ctx, "temporary_metrics_directory", None)
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.environ.pop(METRICS_DIRECTORY_ENV, None)
+
+
+async def _export_worker_snapshots(application: sanic.Sanic, directory: str, interval: float) -> None:
+    while True:
+        try:
+            await export_worker_snapshot(application, directory)
+        except Exception as exc:
+            logger.warning("Unable to write the metrics snapshot of worker %s: %r", os.getpid(), exc)
+        await asyncio.sleep(interval)
+
+
+async def start_metrics_exporter(application: sanic.Sanic) -> None:
+    """
+    Worker listener periodically writing the worker snapshot
+    """
+    directory = metrics_directory(application)
+    if not directory or getattr(application.ctx, "metrics_directory", None) is not None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    application.ctx.metrics_directory = directory
+    interval = float(metrics_settings(application.config)["METRICS_SNAPSHOT_INTERVAL"])
+    application.add_task(_export_worker_snapshots(application, directory, interval), name="metrics-snapshot-export")
+
+
+async def remove_worker_snapshot(application: sanic.Sanic) -> None:
+    directory = metrics_directory(application)
+    if directory:
+        try:
+            os.remove(os.path.join(directory, f"{os.getpid()}.json"))
+        except OSError:
+            pass
+
+
+def configure_metrics(application: sanic.Sanic) -> bool:
+    """
+    Register the request metrics middleware and the snapshot listeners
+    """
+    if not metrics_settings(application.config)["METRICS_ENABLED"]:
+        logger.info("Metrics are disabled")
+        return False
+
+    application.register_middleware(start_request_metrics, "request")
+    application.register_middleware(finish_request_metrics, "response")
+    application.register_listener(prepare_metrics_directory, "main_process_start")
+    application.register_listener(remove_metrics_directory, "main_process_stop")
+    application.register_listener(start_metrics_exporter, "after_server_start")
+    application.register_listener(remove_worker_snapshot, "before_server_stop")
+    return True
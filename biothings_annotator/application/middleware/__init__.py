@@ -1,5 +1,11 @@
 from typing import Dict, List
 
+from biothings_annotator.application.middleware.admission import (
+    admit_annotation_request,
+    release_annotation_request,
+)
+from biothings_annotator.application.middleware.sentry import report_large_or_slow_request, start_sentry_request_timer
+
 
 def build_middleware() -> List[Dict]:
     """
@@ -15,5 +21,14 @@ def build_middleware() -> List[Dict]:
         priority: Union[Default, int] = _default,
     ) -> Union[MiddlewareType, Middleware]:
     """
-    middleware_collection = []
+    admission_middleware = {"middleware": admit_annotation_request, "attach_to": "request"}
+    admission_release_middleware = {"middleware": release_annotation_request, "attach_to": "response"}
+    sentry_timer_middleware = {"middleware": start_sentry_request_timer, "attach_to": "request"}
+    sentry_report_middleware = {"middleware": report_large_or_slow_request, "attach_to": "response"}
+    middleware_collection = [
+        sentry_timer_middleware,
+        admission_middleware,
+        admission_release_middleware,
+        sentry_report_middleware,
+    ]
     return middleware_collection
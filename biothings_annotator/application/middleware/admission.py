@@ -0,0 +1,284 @@
+"""
+Admission control and load shedding for the annotation routes
+
+Each sanic worker owns an AdmissionController that bounds the number of
+annotation requests (and CURIEs) it works on concurrently. Requests above
+those limits wait in a bounded FIFO queue and are shed with a 429 (queue full)
+or 503 (queue wait timed out) response carrying a Retry-After header, so the
+latency of admitted requests stays bounded when traffic spikes.
+
+Cheap single CURIE lookups (GET /curie/<curie>) and heavy batch requests
+(POST /curie/, POST /trapi/) are tracked against separate budgets so a burst of
+batch requests cannot block interactive lookups
+"""
+
+import asyncio
+import collections
+import logging
+import weakref
+from typing import Deque, Dict, List, Optional
+
+import sanic
+from sanic.request import Request
+
+from biothings_annotator.annotator.trapi import TRAPI_NODES
+from biothings_annotator.application.requests import load_trapi_body
+
+logger = logging.getLogger(__name__)
+
+LIGHT_BUDGET = "light"
+HEAVY_BUDGET = "heavy"
+
+# Route name -> admission budget. Routes not listed here bypass admission control
+ANNOTATION_ROUTE_BUDGETS = {
+    "curie_endpoint": LIGHT_BUDGET,
+    "batch_curie_endpoint": HEAVY_BUDGET,
+    "trapi_endpoint": HEAVY_BUDGET,
+}
+
+DEFAULT_ADMISSION_SETTINGS = {
+    "ADMISSION_CONTROL_ENABLED": True,
+    "ADMISSION_MAX_INFLIGHT_LIGHT": 64,
+    "ADMISSION_MAX_INFLIGHT_HEAVY": 8,
+    "ADMISSION_MAX_INFLIGHT_CURIES": 100000,
+    "ADMISSION_MAX_QUEUE": 64,
+    "ADMISSION_QUEUE_TIMEOUT": 30,
+    "ADMISSION_RETRY_AFTER": 5,
+}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status: int, message: str):
+        self.status = status
+        self.message = message
+        super().__init__(message)
+
+
+class AdmissionTicket:
+    """Handle for the capacity held by one admitted request"""
+
+    __slots__ = ("budget", "cost", "released")
+
+    def __init__(self, budget: str, cost: int):
+        self.budget = budget
+        self.cost = cost
+        self.released = False
+
+
+class AdmissionController:
+    """
+    Per-worker bookkeeping of in-flight annotation requests
+
+    A request is admitted when its budget has a free slot. Heavy requests must
+    also fit the CURIEs they carry into the CURIE budget they share, so the
+    single CURIE lookups are never held back by batches. A heavy request larger
+    than the whole CURIE budget is admitted once no other batch holds CURIEs so
+    it cannot starve. Waiters are served in FIFO order within each budget
+    """
+
+    def __init__(
+        self,
+        max_inflight_light: int,
+        max_inflight_heavy: int,
+        max_inflight_curies: int,
+        max_queue: int,
+        queue_timeout: float,
+    ):
+        self.limits = {LIGHT_BUDGET: max_inflight_light, HEAVY_BUDGET: max_inflight_heavy}
+        self.inflight = {LIGHT_BUDGET: 0, HEAVY_BUDGET: 0}
+        self.max_inflight_curies = max_inflight_curies
+        self.inflight_curies = 0
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._waiters: Deque[List] = collections.deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _can_admit(self, budget: str, cost: int) -> bool:
+        if self.inflight[budget] >= self.limits[budget]:
+            return False
+        if budget != HEAVY_BUDGET or self.inflight_curies == 0:
+            return True
+        return self.inflight_curies + cost <= self.max_inflight_curies
+
+    def _admit(self, budget: str, cost: int) -> AdmissionTicket:
+        self.inflight[budget] += 1
+        self.inflight_curies += cost
+        return AdmissionTicket(budget, cost)
+
+    async def acquire(self, budget: str, cost: int) -> AdmissionTicket:
+        """
+        Admit a request of the given budget and CURIE cost, waiting in the
+        bounded queue if the worker is saturated
+
+        Raises AdmissionRejected when the queue is full or the wait timed out
+        """
+        # only the heavy requests hold CURIEs of the shared budget
+        cost = max(1, min(cost, self.max_inflight_curies)) if budget == HEAVY_BUDGET else 0
+        if not any(waiter[0] == budget for waiter in self._waiters) and self._can_admit(budget, cost):
+            return self._admit(budget, cost)
+
+        if len(self._waiters) >= self.max_queue:
+            raise AdmissionRejected(429, "Too many annotation requests are queued on this worker")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = [budget, cost, future]
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError as timeout_error:
+            raise AdmissionRejected(503, "Timed out waiting for annotation capacity") from timeout_error
+        except asyncio.CancelledError:
+            # The ticket may have been granted right before the waiting request was cancelled
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            else:
+                # The waiter left without a ticket, the ones it held back may now be admitted
+                self._dispatch_waiters()
+
+    def release(self, ticket: AdmissionTicket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        self.inflight[ticket.budget] -= 1
+        self.inflight_curies -= ticket.cost
+        self._dispatch_waiters()
+
+    def _dispatch_waiters(self) -> None:
+        blocked_budgets = set()
+        for waiter in list(self._waiters):
+            budget, cost, future = waiter
+            if future.done():
+                continue
+            if budget in blocked_budgets:
+                continue
+            if self._can_admit(budget, cost):
+                self._waiters.remove(waiter)
+                future.set_result(self._admit(budget, cost))
+            else:
+                blocked_budgets.add(budget)
+                if len(blocked_budgets) == len(self.limits):
+                    break
+
+
+def admission_settings(config) -> Dict:
+    return {name: config.get(name, default) for name, default in DEFAULT_ADMISSION_SETTINGS.items()}
+
+
+def get_admission_controller(application: sanic.Sanic) -> Optional[AdmissionController]:
+    """
+    Lazily create the AdmissionController of the current worker from the
+    application configuration. Returns None when admission control is disabled
+    """
+    if hasattr(application.ctx, "admission_controller"):
+        return application.ctx.admission_controller
+
+    settings = admission_settings(application.config)
+    controller = None
+    if settings["ADMISSION_CONTROL_ENABLED"]:
+        controller = AdmissionController(
+            max_inflight_light=int(settings["ADMISSION_MAX_INFLIGHT_LIGHT"]),
+            max_inflight_heavy=int(settings["ADMISSION_MAX_INFLIGHT_HEAVY"]),
+            max_inflight_curies=int(settings["ADMISSION_MAX_INFLIGHT_CURIES"]),
+            max_queue=int(settings["ADMISSION_MAX_QUEUE"]),
+            queue_timeout=float(settings["ADMISSION_QUEUE_TIMEOUT"]),
+        )
+    application.ctx.admission_controller = controller
+    return controller
+
+
+def request_route_name(request: Request) -> Optional[str]:
+    route = getattr(request, "route", None)
+    if route is None:
+        return None
+    return route.name.rsplit(".", 1)[-1]
+
+
+def request_budget(request: Request) -> Optional[str]:
+    return ANNOTATION_ROUTE_BUDGETS.get(request_route_name(request), None)
+
+
+def estimate_request_cost(request: Request, budget: str) -> int:
+    """
+    Estimate the number of CURIEs carried by an annotation request
+
+    The parsed body is cached on the request (by sanic, or by load_trapi_body
+    for TRAPI messages) so the view does not decode it a second time
+    """
+    if budget == LIGHT_BUDGET:
+        return 1
+    try:
+        if request_route_name(request) == "trapi_endpoint":
+            body = load_trapi_body(request)
+        else:
+            body = request.json
+        if isinstance(body, dict) and "message" in body:
+            node_count = len(TRAPI_NODES.get(body))
+            limit = int(request.args.get("limit", 0))
+            return min(node_count, limit) if limit else node_count
+        if isinstance(body, dict):
+            return len(body.get("ids", []))
+        if isinstance(body, list):
+            return len(body)
+    except Exception:
+        # Malformed bodies are rejected by the view itself
+        pass
+    return 1
+
+
+async def admit_annotation_request(request: Request):
+    """
+    Request middleware enforcing the per-worker admission limits
+    """
+    budget = request_budget(request)
+    if budget is None:
+        return None
+
+    controller = get_admission_controller(request.app)
+    if controller is None:
+        return None
+
+    cost = estimate_request_cost(request, budget)
+    try:
+        ticket = await controller.acquire(budget, cost)
+    except AdmissionRejected as rejection:
+        retry_after = admission_settings(request.app.config)["ADMISSION_RETRY_AFTER"]
+        logger.warning(
+            "Shedding %s %s (%s CURIEs) with HTTP %s: %s",
+            request.method,
+            request.path,
+            cost,
+            rejection.status,
+            rejection.message,
+        )
+        error_context = {
+            "endpoint": request.path,
+            "message": rejection.message,
+            "retry_after": retry_after,
+        }
+        return sanic.json(error_context, status=rejection.status, headers={"Retry-After": str(retry_after)})
+
+    request.ctx.admission_ticket = ticket
+    # Release the capacity even if the response middleware never runs (client disconnects)
+    weakref.finalize(request, controller.release, ticket)
+    return None
+
+
+async def release_annotation_request(request: Request, response):
+    """
+    Response middleware returning the capacity held by an admitted request
+    """
+    ticket = getattr(request.ctx, "admission_ticket", None)
+    if ticket is None:
+        return
+    controller = get_admission_controller(request.app)
+    if controller is not None:
+        controller.release(ticket)
@@ -0,0 +1,66 @@
+"""
+Reporting of the large and slow requests missed by the sentry traces sampler
+
+The sentry transaction of a request is sampled when it starts, before its body
+is read and long before its duration is known, and an unsampled transaction
+cannot be sampled afterwards. So requests whose body is at least
+SENTRY_LARGE_REQUEST_BYTES long or that took SENTRY_SLOW_REQUEST_SECONDS or
+more are reported as sentry events when their transaction is not sampled. The
+sampled transactions of such requests are tagged instead
+"""
+
+import time
+from typing import Optional
+
+import sentry_sdk
+from sanic.request import Request
+
+from biothings_annotator.application.listeners.sentry import request_content_length, sentry_settings
+from biothings_annotator.application.middleware.admission import request_route_name
+
+REQUEST_REASON_TAG = "request_reason"
+
+
+def report_sentry_request(request: Request, reason: str, duration: float) -> Optional[str]:
+    """
+    Tag the sampled sentry transaction of the current request with reason, or
+    capture an event for the request when its transaction is not sampled.
+    Returns the id of the captured event
+    """
+    transaction = sentry_sdk.get_current_scope().transaction
+    if transaction is not None and transaction.sampled:
+        transaction.set_tag(REQUEST_REASON_TAG, reason)
+        return None
+
+    event = {
+        "message": f"{reason.replace('_', ' ').capitalize()}: {request.method} {request.path}",
+        "level": "info",
+        "tags": {REQUEST_REASON_TAG: reason, "route": request_route_name(request) or "unmatched"},
+        "extra": {"duration": duration, "content_length": request_content_length(request)},
+    }
+    return sentry_sdk.capture_event(event)
+
+
+async def start_sentry_request_timer(request: Request):
+    """
+    Request middleware timing the requests when sentry is enabled
+    """
+    if getattr(request.app.ctx, "sentry_enabled", False):
+        request.ctx.sentry_started = time.perf_counter()
+
+
+async def report_large_or_slow_request(request: Request, response):
+    """
+    Response middleware reporting the large and slow requests
+    """
+    started = getattr(request.ctx, "sentry_started", None)
+    if started is None:
+        return None
+
+    duration = time.perf_counter() - started
+    settings = sentry_settings(request.app.config)
+    if duration >= float(settings["SENTRY_SLOW_REQUEST_SECONDS"]):
+        report_sentry_request(request, "slow_request", duration)
+    elif request_content_length(request) >= int(settings["SENTRY_LARGE_REQUEST_BYTES"]):
+        report_sentry_request(request, "large_request", duration)
+    return None
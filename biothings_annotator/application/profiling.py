@@ -0,0 +1,103 @@
+"""
+On-demand sampling profiles of a live worker
+
+Two kinds of profiles are captured for a number of seconds, both rendered in
+the folded stack format ("frame;frame;frame count" lines, root frame first)
+read by flamegraph.pl, speedscope and most flamegraph viewers:
+
+> cpu: a background thread samples the stack of the event loop thread of the
+  worker at a fixed interval. Time the loop spends waiting for I/O shows up
+  under the selector frames
+> tasks: the coroutine stacks of all the asyncio tasks of the worker are
+  sampled at a fixed interval, showing where the in-flight requests wait
+"""
+
+import asyncio
+import collections
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Counter, Iterable, List, Optional
+
+CPU_PROFILE = "cpu"
+TASKS_PROFILE = "tasks"
+PROFILE_MODES = (CPU_PROFILE, TASKS_PROFILE)
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def fold_frames(frames: Iterable[FrameType]) -> str:
+    """
+    Folds frames ordered from the root to the leaf into one stack
+    """
+    return ";".join(_frame_name(frame) for frame in frames)
+
+
+def _thread_frames(frame: Optional[FrameType]) -> List[FrameType]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def sample_thread_stacks(thread_id: int, duration: float, interval: float) -> Counter[str]:
+    """
+    Samples the stack of a thread for duration seconds. Meant to run in another
+    thread than the sampled one
+    """
+    stacks = collections.Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id, None)
+        if frame is None:
+            break
+        stacks[fold_frames(_thread_frames(frame))] += 1
+        del frame
+        time.sleep(interval)
+    return stacks
+
+
+async def profile_event_loop(duration: float, interval: float) -> Counter[str]:
+    """
+    CPU profile of the thread running the current event loop
+    """
+    loop_thread_id = threading.get_ident()
+    return await asyncio.to_thread(sample_thread_stacks, loop_thread_id, duration, interval)
+
+
+async def profile_tasks(duration: float, interval: float) -> Counter[str]:
+    """
+    Samples the coroutine stacks of the other tasks of the current event loop.
+    Every stack is prefixed with the name of its task
+    """
+    stacks = collections.Counter()
+    current_task = asyncio.current_task()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for task in asyncio.all_tasks():
+            if task is current_task or task.done():
+                continue
+            frames = task.get_stack()
+            stack = fold_frames(frames)
+            stacks[f"{task.get_name()};{stack}" if stack else task.get_name()] += 1
+        await asyncio.sleep(interval)
+    return stacks
+
+
+async def capture_profile(mode: str, duration: float, interval: float) -> Counter[str]:
+    if mode == CPU_PROFILE:
+        return await profile_event_loop(duration, interval)
+    if mode == TASKS_PROFILE:
+        return await profile_tasks(duration, interval)
+    raise ValueError(f"Unsupported profile mode {mode!r}, expected one of {PROFILE_MODES}")
+
+
+def render_folded(stacks: Counter[str]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
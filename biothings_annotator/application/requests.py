@@ -0,0 +1,40 @@
+"""
+Request body helpers shared by the middleware and the views of the annotator
+web application
+"""
+
+from typing import Dict, Optional
+
+from sanic.request import Request
+
+from biothings_annotator.annotator.instrumentation import stage
+from biothings_annotator.annotator.trapi import locate_trapi_nodes, trapi_nodes_message
+
+
+def load_trapi_body(request: Request) -> Optional[Dict]:
+    """
+    Returns the TRAPI body of an annotation request, cached on the request
+    context so admission control and the view decode it once
+
+    With TRAPI_LAZY_PARSING enabled only message.knowledge_graph.nodes is
+    decoded and the other sections of the message are validated and left out,
+    the only part the annotator reads. Bodies the nodes cannot be extracted
+    from are decoded whole, so invalid input is reported as before. The span of
+    the nodes in the body is kept on the request context for
+    TRAPI_RESPONSE_SPLICING
+    """
+    trapi_body = getattr(request.ctx, "trapi_body", None)
+    if trapi_body is not None:
+        return trapi_body
+
+    lazy_parsing = request.app.config.get("TRAPI_LAZY_PARSING", False)
+    with stage("parse", body_size=len(request.body), lazy=lazy_parsing):
+        if lazy_parsing:
+            located_nodes = locate_trapi_nodes(request.body)
+            if located_nodes is not None:
+                nodes, request.ctx.trapi_nodes_span = located_nodes
+                trapi_body = trapi_nodes_message(nodes)
+        if trapi_body is None:
+            trapi_body = request.json
+    request.ctx.trapi_body = trapi_body
+    return trapi_body
@@ -0,0 +1,141 @@
+"""
+Slow-request log of the annotator web application
+
+The stage timings of every request are collected (see
+biothings_annotator.annotator.instrumentation) from the request middleware on.
+Requests taking SLOW_REQUEST_SECONDS or longer are logged as one JSON object
+with their route, the CURIE count per node type and scope groups of their
+annotation plans, their number of backend calls, cache hits and stage timings.
+
+Every worker keeps its last SLOW_REQUEST_LOG_SIZE slow requests in memory,
+served by the /admin/slow-requests route of the worker
+"""
+
+import collections
+import json
+import logging
+import os
+import time
+from typing import Deque, Dict
+
+import sanic
+from sanic.request import Request
+
+from biothings_annotator.annotator.instrumentation import StageTimings, start_stage_timings, stop_stage_timings
+from biothings_annotator.application.middleware.admission import request_route_name
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_REQUEST_SETTINGS = {
+    "SLOW_REQUEST_LOG_ENABLED": True,
+    "SLOW_REQUEST_SECONDS": 5,
+    "SLOW_REQUEST_LOG_SIZE": 100,
+}
+
+# The admin routes are slow on purpose, such as a profile lasting N seconds
+EXCLUDED_PATH_PREFIX = "/admin/"
+
+
+def slow_request_settings(config) -> Dict:
+    return {name: config.get(name, default) for name, default in DEFAULT_SLOW_REQUEST_SETTINGS.items()}
+
+
+def get_slow_request_log(application: sanic.Sanic) -> Deque[Dict]:
+    """
+    Lazily create the slow-request ring buffer of the current worker
+    """
+    slow_request_log = getattr(application.ctx, "slow_request_log", None)
+    if slow_request_log is None:
+        size = int(slow_request_settings(application.config)["SLOW_REQUEST_LOG_SIZE"])
+        slow_request_log = application.ctx.slow_request_log = collections.deque(maxlen=size)
+    return slow_request_log
+
+
+def summarize_slow_request(request: Request, status: int, duration: float, timings: StageTimings) -> Dict:
+    """
+    The slow-request log entry of a request, without the CURIEs themselves
+    """
+    curies_by_node_type: Dict[str, int] = {}
+    scope_groups = []
+    unsupported_curies = 0
+    curie_cache_hits = 0
+    plans = timings.plan_summaries()
+    for plan in plans:
+        unsupported_curies += plan["unsupported"]
+        curie_cache_hits += plan["curie_cache_hits"]
+        for batch in plan["batches"]:
+            node_type = batch["node_type"]
+            curies_by_node_type[node_type] = curies_by_node_type.get(node_type, 0) + batch["curies"]
+            scope_groups.append(
+                {
+                    "node_type": node_type,
+                    "scopes": batch["scopes"],
+                    "curies": batch["curies"],
+                    "query_ids": batch["query_ids"],
+                }
+            )
+
+    stages = timings.as_dict()
+    return {
+        "timestamp": time.time(),
+        "worker": os.getpid(),
+        "request_id": str(request.id),
+        "method": request.method,
+        "path": request.path,
+        "route": request_route_name(request),
+        "status": status,
+        "duration": duration,
+        "query_backends": sorted({plan["query_backend"] for plan in plans}),
+        "curies": curies_by_node_type,
+        "unsupported_curies": unsupported_curies,
+        "scope_groups": scope_groups,
+        "backend_calls": stages.get("backend_call", {}).get("count", 0),
+        "cache_hits": {"curie": curie_cache_hits, "atc": timings.events.get("atc_cache_hits", 0)},
+        "stages": stages,
+    }
+
+
+async def start_slow_request_record(request: Request):
+    """
+    Request middleware collecting the stage timings of the request
+    """
+    if request.path.startswith(EXCLUDED_PATH_PREFIX):
+        return
+    request.ctx.slow_request_timings, request.ctx.slow_request_token = start_stage_timings()
+    request.ctx.slow_request_started = time.perf_counter()
+
+
+async def finish_slow_request_record(request: Request, response):
+    """
+    Response middleware logging the request when it was slow
+    """
+    timings = getattr(request.ctx, "slow_request_timings", None)
+    if timings is None:
+        return
+    duration = time.perf_counter() - request.ctx.slow_request_started
+    request.ctx.slow_request_timings = None
+    try:
+        stop_stage_timings(request.ctx.slow_request_token)
+    except ValueError:
+        # The response is sent from another context than the request middleware
+        pass
+
+    if duration < float(slow_request_settings(request.app.config)["SLOW_REQUEST_SECONDS"]):
+        return
+
+    entry = summarize_slow_request(request, response.status, duration, timings)
+    logger.warning("%s", json.dumps(entry, separators=(",", ":")))
+    get_slow_request_log(request.app).append(entry)
+
+
+def configure_slow_request_log(application: sanic.Sanic) -> bool:
+    """
+    Register the slow-request middleware
+    """
+    if not slow_request_settings(application.config)["SLOW_REQUEST_LOG_ENABLED"]:
+        logger.info("Slow-request log is disabled")
+        return False
+
+    application.register_middleware(start_slow_request_record, "request")
+    application.register_middleware(finish_slow_request_record, "response")
+    return True
@@ -9,24 +9,34 @@ import re
 from collections.abc import Mapping, Sequence
 from typing import Any
 
+from opentelemetry import propagate, trace
+from opentelemetry.instrumentation.utils import suppress_instrumentation
 from sanic import Sanic
 
 logger = logging.getLogger(__name__)
 _initialized_pid = None
+_tracer = trace.get_tracer(__name__)
 
 DEFAULT_TELEMETRY_SETTINGS = {
     "OPENTELEMETRY_ENABLED": False,
     "OPENTELEMETRY_SERVICE_NAME": "BioThingsAnnotator",
     "OPENTELEMETRY_JAEGER_HOST": "http://localhost",
     "OPENTELEMETRY_JAEGER_PORT": 4318,
-    "OPENTELEMETRY_EXCLUDED_URLS": ["^/$", "^/status$", "^/version$", "^/webapp", "^/favicon\\.ico$"],
+    "OPENTELEMETRY_SAMPLE_RATE": 1.0,
+    "OPENTELEMETRY_EXCLUDED_URLS": [
+        "^/$",
+        "^/status(/live|/ready)?$",
+        "^/version$",
+        "^/metrics$",
+        "^/admin/",
+        "^/webapp",
+        "^/favicon\\.ico$",
+    ],
 }
 
 
 def _suppress_request_instrumentation(request):
     """Prevent excluded requests from producing orphaned child spans."""
-    from opentelemetry.instrumentation.utils import suppress_instrumentation
-
     suppression = suppress_instrumentation()
     suppression.__enter__()
     request.ctx.opentelemetry_suppression = suppression
@@ -41,6 +51,8 @@ def _environment_value(name: str, default: Any) -> Any:
         return value.strip().lower() in {"1", "true", "yes", "on"}
     if isinstance(default, int):
         return int(value)
+    if isinstance(default, float):
+        return float(value)
     if isinstance(default, Sequence) and not isinstance(default, str):
         return [item.strip() for item in value.split(",") if item.strip()]
     return value
@@ -51,24 +63,44 @@ def telemetry_settings(configuration: Mapping[str, Any]) -> dict[str, Any]:
     return {name: _environment_value(name, value) for name, value in configuration.items()}
 
 
+def _compile_excluded_urls(excluded_urls: Sequence[str]) -> re.Pattern | None:
+    """Combine the excluded URL patterns into a single regular expression."""
+    if not excluded_urls:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in excluded_urls))
+
+
+def _excluded_url_pattern(settings) -> re.Pattern | None:
+    """Return the combined exclusion pattern, compiled once per settings."""
+    try:
+        return settings["excluded_url_pattern"]
+    except KeyError:
+        pattern = settings["excluded_url_pattern"] = _compile_excluded_urls(settings["excluded_urls"])
+        return pattern
+
+
 def _initialize_worker_telemetry(settings):
     """Create the exporter lazily inside the worker handling the request."""
-    global _initialized_pid
+    global _initialized_pid, _tracer
     current_pid = os.getpid()
     if _initialized_pid == current_pid:
         return
-    from opentelemetry import trace
     from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
     from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
     from opentelemetry.sdk.resources import SERVICE_NAME, Resource
     from opentelemetry.sdk.trace import TracerProvider
     from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
 
     endpoint = settings["endpoint"]
-    provider = TracerProvider(resource=Resource.create({SERVICE_NAME: settings["service_name"]}))
+    provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: settings["service_name"]}),
+        sampler=ParentBased(TraceIdRatioBased(settings.get("sample_rate", 1.0))),
+    )
     provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
     trace.set_tracer_provider(provider)
     HTTPXClientInstrumentor().instrument()
+    _tracer = trace.get_tracer(__name__)
     _initialized_pid = current_pid
     logger.warning("OpenTelemetry worker is exporting traces to %s", endpoint)
 
@@ -81,15 +113,17 @@ async def _start_request_span(request):
     if getattr(request, "route", None) is None:
         _suppress_request_instrumentation(request)
         return
-    if any(re.search(pattern, request.path) for pattern in settings["excluded_urls"]):
+    excluded_url_pattern = _excluded_url_pattern(settings)
+    if excluded_url_pattern is not None and excluded_url_pattern.search(request.path) is not None:
         _suppress_request_instrumentation(request)
         return
     _initialize_worker_telemetry(settings)
-    from opentelemetry import propagate, trace
 
-    span_context = trace.get_tracer(__name__).start_as_current_span(
+    # The propagators read the headers case-insensitively from the request
+    # headers multidict, there is no need to copy them
+    span_context = _tracer.start_as_current_span(
         f"{request.method} {request.path}",
-        context=propagate.extract(dict(request.headers)),
+        context=propagate.extract(request.headers),
         kind=trace.SpanKind.SERVER,
         attributes={
             "http.request.method": request.method,
@@ -98,8 +132,8 @@ async def _start_request_span(request):
             "server.address": request.host.split(":", 1)[0],
         },
     )
+    request.ctx.opentelemetry_span = span_context.__enter__()
     request.ctx.opentelemetry_span_context = span_context
-    span_context.__enter__()
 
 
 async def _finish_request_span(request, response):
@@ -111,12 +145,12 @@ async def _finish_request_span(request, response):
     span_context = getattr(request.ctx, "opentelemetry_span_context", None)
     if span_context is None:
         return
-    from opentelemetry import trace
 
-    span = trace.get_current_span()
-    span.set_attribute("http.response.status_code", response.status)
-    if response.status >= 500:
-        span.set_status(trace.Status(trace.StatusCode.ERROR))
+    span = request.ctx.opentelemetry_span
+    if span.is_recording():
+        span.set_attribute("http.response.status_code", response.status)
+        if response.status >= 500:
+            span.set_status(trace.Status(trace.StatusCode.ERROR))
     span_context.__exit__(None, None, None)
 
 
@@ -139,10 +173,18 @@ def configure_telemetry(application: Sanic, configuration: Mapping[str, Any]) ->
     if not isinstance(excluded_urls, str):
         excluded_urls = ",".join(excluded_urls)
 
+    sample_rate = float(settings.get("OPENTELEMETRY_SAMPLE_RATE", 1.0))
+    if not 0.0 <= sample_rate <= 1.0:
+        logger.warning("Invalid OPENTELEMETRY_SAMPLE_RATE %s, sampling every trace", sample_rate)
+        sample_rate = 1.0
+
+    excluded_urls = [pattern for pattern in excluded_urls.split(",") if pattern]
     application.ctx.opentelemetry_settings = {
         "endpoint": endpoint,
         "service_name": settings.get("OPENTELEMETRY_SERVICE_NAME", "BioThingsAnnotator"),
-        "excluded_urls": [pattern for pattern in excluded_urls.split(",") if pattern],
+        "sample_rate": sample_rate,
+        "excluded_urls": excluded_urls,
+        "excluded_url_pattern": _compile_excluded_urls(excluded_urls),
     }
     application.register_middleware(_start_request_span, "request")
     application.register_middleware(_finish_request_span, "response")
@@ -1,7 +1,9 @@
 from typing import Dict, List
+from biothings_annotator.application.views.admin import ProfileView, SlowRequestView
 from biothings_annotator.application.views.curie import CurieView
 from biothings_annotator.application.views.metadata import VersionView
-from biothings_annotator.application.views.status import StatusView
+from biothings_annotator.application.views.metrics import MetricsView
+from biothings_annotator.application.views.status import LivenessView, ReadinessView, StatusView
 from biothings_annotator.application.views.trapi import TrapiView
 
 
@@ -24,6 +26,18 @@ def build_routes() -> List[Dict]:
         "name": "status_endpoint",
     }
 
+    liveness_route = {
+        "handler": LivenessView.as_view(),
+        "uri": r"/status/live",
+        "name": "liveness_endpoint",
+    }
+
+    readiness_route = {
+        "handler": ReadinessView.as_view(),
+        "uri": r"/status/ready",
+        "name": "readiness_endpoint",
+    }
+
     # --- CURIE ROUTES ---
     curie_route_get = {
         "handler": CurieView.as_view(),
@@ -49,11 +63,38 @@ def build_routes() -> List[Dict]:
         "name": "version_endpoint",
     }
 
+    # --- METRICS ROUTES ---
+    metrics_route = {
+        "handler": MetricsView.as_view(),
+        "uri": r"/metrics",
+        "name": "metrics_endpoint",
+    }
+
+    # --- ADMIN ROUTES ---
+    profile_route = {
+        "handler": ProfileView.as_view(),
+        "uri": r"/admin/profile",
+        "name": "profile_endpoint",
+        "methods": ["GET"],
+    }
+
+    slow_requests_route = {
+        "handler": SlowRequestView.as_view(),
+        "uri": r"/admin/slow-requests",
+        "name": "slow_requests_endpoint",
+        "methods": ["GET"],
+    }
+
     route_collection = [
         curie_route_get,
         curie_route_post,
         trapi_route,
         status_route,
+        liveness_route,
+        readiness_route,
         version_route,
+        metrics_route,
+        profile_route,
+        slow_requests_route,
     ]
     return route_collection
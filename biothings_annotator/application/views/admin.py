@@ -0,0 +1,161 @@
+"""
+Administrative routes for inspecting a live worker: profiles and slow requests
+
+The routes are disabled unless ADMIN_ENABLED is set and an admin token is
+configured, either through ADMIN_TOKEN or the ANNOTATOR_ADMIN_TOKEN environment
+variable. Requests authenticate with an "Authorization: Bearer <token>" header.
+While disabled the routes answer like unknown routes
+"""
+
+import asyncio
+import hmac
+import os
+from typing import Dict, Optional
+
+import sanic
+from sanic.request import Request
+from sanic.response import HTTPResponse
+from sanic.views import HTTPMethodView
+
+from biothings_annotator.application.profiling import (
+    CPU_PROFILE,
+    PROFILE_MODES,
+    capture_profile,
+    render_folded,
+)
+from biothings_annotator.application.slow_requests import get_slow_request_log, slow_request_settings
+
+DEFAULT_ADMIN_SETTINGS = {
+    "ADMIN_ENABLED": False,
+    "ADMIN_TOKEN": "",
+    "ADMIN_PROFILE_MAX_SECONDS": 60,
+}
+
+ADMIN_TOKEN_ENVIRONMENT_VARIABLE = "ANNOTATOR_ADMIN_TOKEN"
+
+DEFAULT_PROFILE_SECONDS = 10.0
+DEFAULT_PROFILE_INTERVAL = 0.01
+MIN_PROFILE_INTERVAL = 0.001
+MAX_PROFILE_INTERVAL = 1.0
+
+
+def admin_settings(config) -> Dict:
+    settings = {name: config.get(name, default) for name, default in DEFAULT_ADMIN_SETTINGS.items()}
+    settings["ADMIN_TOKEN"] = settings["ADMIN_TOKEN"] or os.environ.get(ADMIN_TOKEN_ENVIRONMENT_VARIABLE, "")
+    return settings
+
+
+def authorize_admin_request(request: Request) -> Optional[HTTPResponse]:
+    """
+    Returns the error response for a request to an admin route that is disabled
+    or not authorized, None when the request may proceed
+    """
+    settings = admin_settings(request.app.config)
+    admin_token = settings["ADMIN_TOKEN"]
+    if not settings["ADMIN_ENABLED"] or not admin_token:
+        return sanic.json({"endpoint": request.path, "message": "Not found."}, status=404)
+
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(credentials.strip().encode(), admin_token.encode()):
+        return sanic.json(
+            {"endpoint": request.path, "message": "Invalid or missing admin token."},
+            status=401,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return None
+
+
+class ProfileView(HTTPMethodView):
+    """
+    Captures a profile of the worker receiving the request, see
+    biothings_annotator.application.profiling
+
+    Query parameters:
+    > mode: "cpu" (default) or "tasks"
+    > seconds: profile duration, up to ADMIN_PROFILE_MAX_SECONDS
+    > interval: seconds between two samples
+
+    The profile is returned in the folded stack format. Only one profile is
+    captured at a time per worker
+    """
+
+    default_headers = {"Cache-Control": "no-store"}
+
+    async def get(self, request: Request):
+        error_response = authorize_admin_request(request)
+        if error_response is not None:
+            return error_response
+
+        max_seconds = float(admin_settings(request.app.config)["ADMIN_PROFILE_MAX_SECONDS"])
+        mode = request.args.get("mode", CPU_PROFILE)
+        try:
+            seconds = float(request.args.get("seconds", DEFAULT_PROFILE_SECONDS))
+            interval = float(request.args.get("interval", DEFAULT_PROFILE_INTERVAL))
+        except ValueError:
+            seconds = interval = -1.0
+        if mode not in PROFILE_MODES or not 0 < seconds <= max_seconds or not 0 < interval <= MAX_PROFILE_INTERVAL:
+            return sanic.json(
+                {
+                    "endpoint": request.path,
+                    "message": (
+                        f"Expected mode in {PROFILE_MODES}, 0 < seconds <= {max_seconds:g} "
+                        f"and 0 < interval <= {MAX_PROFILE_INTERVAL:g}"
+                    ),
+                },
+                status=400,
+            )
+        interval = max(interval, MIN_PROFILE_INTERVAL)
+
+        profile_lock = getattr(request.app.ctx, "profile_lock", None)
+        if profile_lock is None:
+            profile_lock = request.app.ctx.profile_lock = asyncio.Lock()
+        if profile_lock.locked():
+            return sanic.json(
+                {"endpoint": request.path, "message": "A profile of this worker is already being captured."},
+                status=409,
+            )
+
+        async with profile_lock:
+            stacks = await capture_profile(mode, seconds, interval)
+
+        pid = os.getpid()
+        headers = {
+            **self.default_headers,
+            "Content-Disposition": f'attachment; filename="annotator-{pid}-{mode}.folded"',
+            "X-Worker-Pid": str(pid),
+        }
+        return sanic.text(render_folded(stacks), headers=headers)
+
+
+class SlowRequestView(HTTPMethodView):
+    """
+    The slow requests logged by the worker receiving the request, newest
+    first, see biothings_annotator.application.slow_requests
+
+    Query parameters:
+    > limit: maximum number of requests returned
+    """
+
+    default_headers = {"Cache-Control": "no-store"}
+
+    async def get(self, request: Request):
+        error_response = authorize_admin_request(request)
+        if error_response is not None:
+            return error_response
+
+        slow_requests = list(reversed(get_slow_request_log(request.app)))
+        try:
+            limit = int(request.args.get("limit", len(slow_requests)))
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            return sanic.json({"endpoint": request.path, "message": "Expected limit >= 0"}, status=400)
+
+        settings = slow_request_settings(request.app.config)
+        body = {
+            "worker": os.getpid(),
+            "enabled": settings["SLOW_REQUEST_LOG_ENABLED"],
+            "threshold": settings["SLOW_REQUEST_SECONDS"],
+            "requests": slow_requests[:limit],
+        }
+        return sanic.json(body, headers=self.default_headers)
@@ -4,7 +4,6 @@ Translator Node Annotator Service Handler translated to sanic
 
 import logging
 import json
-import urllib.parse
 
 import sanic
 from sanic.views import HTTPMethodView
@@ -12,6 +11,8 @@ from sanic.request import Request
 
 from biothings_annotator.annotator import Annotator
 from biothings_annotator.annotator.exceptions import InvalidCurieError, InvalidQueryBackendError
+from biothings_annotator.annotator.instrumentation import stage
+from biothings_annotator.annotator.resolver import unquote_curie
 
 logger = logging.getLogger(__name__)
 
@@ -41,13 +42,13 @@ class CurieView(HTTPMethodView):
         query_backend = request.args.get("query_backend", None)
 
         try:
-            curie = urllib.parse.unquote(curie, encoding="utf-8", errors="strict")
+            curie = unquote_curie(curie)
         except UnicodeError as unicode_err:
             error_context = {
                 "input": curie,
                 "endpoint": "/curie/",
                 "message": "Unicode issue while attempting to process curie",
-                "exception": repr(exc),
+                "exception": repr(unicode_err),
             }
             unicode_curie_error_response = sanic.json(error_context, status=400)
             return unicode_curie_error_response
@@ -106,17 +107,14 @@ class CurieView(HTTPMethodView):
             curie_error_response = sanic.json(error_context, status=400)
             return curie_error_response
 
-        parsed_curie_list = []
         try:
-            for curie in curie_list:
-                curie = urllib.parse.unquote(curie, encoding="utf-8", errors="strict")
-                parsed_curie_list.append(curie)
+            parsed_curie_list = [unquote_curie(curie) for curie in curie_list]
         except UnicodeError as unicode_err:
             error_context = {
                 "input": curie_list,
                 "endpoint": "/curie/",
                 "message": "Unicode issue while attempting to process curie list",
-                "exception": repr(exc),
+                "exception": repr(unicode_err),
             }
             unicode_curie_error_response = sanic.json(error_context, status=400)
             return unicode_curie_error_response
@@ -127,7 +125,8 @@ class CurieView(HTTPMethodView):
                 curie_list=parsed_curie_list, fields=fields, raw=raw, include_extra=include_extra
             )
             response_headers = {**self.default_headers, "X-Query-Backend": annotator.query_backend}
-            return sanic.json(annotated_node, headers=response_headers)
+            with stage("serialize"):
+                return sanic.json(annotated_node, headers=response_headers)
         except InvalidQueryBackendError:
             return _query_backend_configuration_error_response()
         except InvalidCurieError as curie_err:
@@ -7,6 +7,7 @@ from sanic.request import Request
 
 from biothings_annotator.annotator import Annotator
 from biothings_annotator.annotator.exceptions import TRAPIInputError
+from biothings_annotator.application.requests import load_trapi_body
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +37,7 @@ class TrapiLegacyView(HTTPMethodView):
         include_extra: bool = request.args.get("include_extra", True)
 
         annotator = Annotator()
-        trapi_body = request.json
+        trapi_body = load_trapi_body(request)
         try:
             annotated_node = await annotator.annotate_trapi(
                 trapi_body, fields=fields, raw=raw, append=append, limit=limit, include_extra=include_extra
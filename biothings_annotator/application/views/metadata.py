@@ -2,18 +2,63 @@
 Metadata routes
 """
 
+import dataclasses
+import hashlib
+import json
 import logging
+from typing import Optional
 
 import sanic
-from sanic import json
 from sanic.views import HTTPMethodView
 from sanic.request import Request
 
 from biothings_annotator.annotator import Annotator
+from biothings_annotator.annotator import transformer
 
 logger = logging.getLogger(__name__)
 
 
+@dataclasses.dataclass(frozen=True)
+class BuildMetadata:
+    """
+    Version and build metadata of the running worker along with the
+    pre-serialized /version response body
+
+    atc_mapping and atc_loaded_at record the WHO ATC mapping of atc_cache_key
+    the metadata was built from and its load time, so it is rebuilt once that
+    mapping is (re)loaded or replaced, whatever its number of codes
+    """
+
+    version: str
+    query_backend: str
+    elasticsearch_connection: Optional[str]
+    atc_cache_key: str
+    atc_codes: int
+    data_version: str
+    body: bytes
+    atc_mapping: Optional[dict] = dataclasses.field(default=None, compare=False, repr=False)
+    atc_loaded_at: Optional[float] = None
+
+    def is_current(self) -> bool:
+        return (
+            transformer.atc_cache.get(self.atc_cache_key, None) is self.atc_mapping
+            and transformer.atc_cache_loaded_at.get(self.atc_cache_key, None) == self.atc_loaded_at
+        )
+
+
+def compute_data_version(version: str, annotator: Annotator) -> str:
+    """
+    Fingerprint of the code version, query backend and loaded ATC mapping.
+    Changes whenever cached annotations from this worker may become stale
+    """
+    fingerprint = hashlib.sha256()
+    fingerprint.update(f"{version}|{annotator.atc_cache_key}|".encode("utf-8"))
+    atc_mapping = transformer.atc_cache.get(annotator.atc_cache_key, {})
+    for code, name in sorted(atc_mapping.items()):
+        fingerprint.update(f"{code}={name};".encode("utf-8"))
+    return fingerprint.hexdigest()[:16]
+
+
 class VersionView(HTTPMethodView):
     def __init__(self):
         super().__init__()
@@ -26,6 +71,16 @@ class VersionView(HTTPMethodView):
             version = version_file.read().strip()
             return version
 
+    def read_version(self) -> str:
+        version = "Unknown"
+        try:
+            version = self.open_version_file()
+        except FileNotFoundError:
+            logger.error("The version.txt file does not exist.")
+        except Exception as exc:
+            logger.error(f"Error getting GitHub commit hash from version.txt file: {exc}")
+        return version
+
     def build_response_body(self, version: str):
         annotator = Annotator()
         result = {
@@ -34,30 +89,54 @@ class VersionView(HTTPMethodView):
         }
         if annotator.query_backend == "elasticsearch":
             result["elasticsearch_connection"] = annotator.elasticsearch_connection
+        result["atc_codes"] = len(transformer.atc_cache.get(annotator.atc_cache_key, {}))
+        result["data_version"] = compute_data_version(version, annotator)
         return result
 
-    async def get(self, _: Request) -> json:
+    def load_build_metadata(self, application: sanic.Sanic) -> BuildMetadata:
+        """
+        Returns the build metadata cached on the application context. It is
+        read once per worker and only rebuilt when the ATC cache changed, the
+        version read from version.txt is then kept
+        """
+        build_metadata = getattr(application.ctx, "build_metadata", None)
+        if build_metadata is not None and build_metadata.is_current():
+            return build_metadata
+
+        version = build_metadata.version if build_metadata is not None else self.read_version()
+        atc_cache_key = Annotator().atc_cache_key
+        atc_mapping = transformer.atc_cache.get(atc_cache_key, None)
+        atc_loaded_at = transformer.atc_cache_loaded_at.get(atc_cache_key, None)
+        result = self.build_response_body(version)
+        build_metadata = BuildMetadata(
+            version=result["version"],
+            query_backend=result["query_backend"],
+            elasticsearch_connection=result.get("elasticsearch_connection"),
+            atc_cache_key=atc_cache_key,
+            atc_codes=result["atc_codes"],
+            data_version=result["data_version"],
+            body=json.dumps(result).encode("utf-8"),
+            atc_mapping=atc_mapping,
+            atc_loaded_at=atc_loaded_at,
+        )
+        application.ctx.build_metadata = build_metadata
+        return build_metadata
+
+    async def get(self, request: Request) -> sanic.HTTPResponse:
         """
         API versioning endpoint
 
         Leverages extracting a github commit hash from the annotator
         repository as the version to check the commit HEAD.
-        Allows for verifying what the latest commit is on the live instance
+        Allows for verifying what the latest commit is on the live instance.
+        The data_version fingerprint changes whenever the code version, the
+        query backend or the loaded WHO ATC mapping changes
 
-        Will return {"version": "Unknown", "query_backend": "..."} if unable to read the version file.
+        Will return {"version": "Unknown", "query_backend": "...", ...} if unable to read the version file.
         """
         try:
-            version = "Unknown"
-
-            try:
-                version = self.open_version_file()
-            except FileNotFoundError:
-                logger.error("The version.txt file does not exist.")
-            except Exception as exc:
-                logger.error(f"Error getting GitHub commit hash from version.txt file: {exc}")
-
-            result = self.build_response_body(version)
-            return sanic.json(result, headers=self.default_headers)
+            build_metadata = self.load_build_metadata(request.app)
+            return sanic.raw(build_metadata.body, content_type="application/json", headers=self.default_headers)
 
         except Exception as exc:
             logger.error(f"Error getting GitHub commit hash: {exc}")
@@ -0,0 +1,27 @@
+"""
+Prometheus metrics route
+"""
+
+import sanic
+from sanic.views import HTTPMethodView
+from sanic.request import Request
+
+from biothings_annotator.application.metrics import collect_metrics, metrics_settings
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsView(HTTPMethodView):
+    """
+    Metrics of all the workers in the Prometheus text exposition format, see
+    biothings_annotator.application.metrics
+    """
+
+    default_headers = {"Cache-Control": "no-store"}
+
+    async def get(self, request: Request):
+        if not metrics_settings(request.app.config)["METRICS_ENABLED"]:
+            return sanic.json({"endpoint": "/metrics", "message": "Metrics are disabled."}, status=404)
+        return sanic.text(
+            await collect_metrics(request.app), content_type=PROMETHEUS_CONTENT_TYPE, headers=self.default_headers
+        )
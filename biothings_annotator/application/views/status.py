@@ -51,3 +51,41 @@ class StatusView(HTTPMethodView):
         except Exception as exc:
             result = {"success": False, "error": repr(exc)}
             return sanic.json(result, status=400)
+
+
+class LivenessView(HTTPMethodView):
+    """
+    Process liveness check. Never touches the query backends
+    """
+
+    default_headers = {"Cache-Control": "no-store"}
+
+    async def head(self, _: Request):
+        return sanic.json(None, headers=self.default_headers, status=200)
+
+    async def get(self, _: Request):
+        return sanic.json({"alive": True}, headers=self.default_headers, status=200)
+
+
+class ReadinessView(HTTPMethodView):
+    """
+    Readiness check reporting the cached result of the periodic deep status
+    check (see biothings_annotator.application.listeners.health) including the
+    latency of every query backend
+    """
+
+    default_headers = {"Cache-Control": "no-store"}
+
+    def _readiness(self, request: Request):
+        health_monitor = getattr(request.app.ctx, "health_monitor", None)
+        if health_monitor is None:
+            return {"ready": False, "error": "The deep status check is not running"}, False
+        return health_monitor.readiness()
+
+    async def head(self, request: Request):
+        _, ready = self._readiness(request)
+        return sanic.json(None, headers=self.default_headers, status=200 if ready else 503)
+
+    async def get(self, request: Request):
+        report, ready = self._readiness(request)
+        return sanic.json(report, headers=self.default_headers, status=200 if ready else 503)
@@ -1,5 +1,5 @@
 import logging
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 import sanic
 from sanic.views import HTTPMethodView
@@ -7,6 +7,9 @@ from sanic.request import Request
 
 from biothings_annotator.annotator import Annotator
 from biothings_annotator.annotator.exceptions import InvalidQueryBackendError, TRAPIInputError
+from biothings_annotator.annotator.instrumentation import stage
+from biothings_annotator.annotator.trapi import splice_trapi_nodes
+from biothings_annotator.application.requests import load_trapi_body
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +21,32 @@ class TrapiView(HTTPMethodView):
         cache = application.config.CACHE_MAX_AGE
         self.default_headers = {"Cache-Control": f"max-age={cache}, public"}
 
+    @staticmethod
+    async def spliced_response(
+        request: Request,
+        annotator: Annotator,
+        trapi_body: Dict,
+        nodes_span: Tuple[int, int],
+        response_headers: Dict,
+        append: bool,
+        **annotation_options,
+    ) -> sanic.HTTPResponse:
+        """
+        With TRAPI_RESPONSE_SPLICING enabled, the annotated nodes are written by
+        splicing the serialized annotations into the node JSON of the request
+        body instead of serializing the nodes again. Nodes the annotations cannot
+        be spliced into are placed and serialized as before
+        """
+        node_d, annotations = await annotator.annotate_trapi_nodes(trapi_body, **annotation_options)
+        with stage("trapi_splice", nodes=len(annotations), append=bool(append)) as span:
+            response_body = splice_trapi_nodes(request.body, nodes_span, node_d, annotations, append)
+            span.set_attribute("spliced", response_body is not None)
+        if response_body is None:
+            annotated_node = annotator.place_trapi_annotations(node_d, annotations, append=append)
+            with stage("serialize"):
+                return sanic.json(annotated_node, headers=response_headers)
+        return sanic.raw(response_body, content_type="application/json", headers=response_headers)
+
     async def post(self, request: Request):
         fields: Optional[list[str]] = request.args.get("fields", None)
         raw: bool = request.args.get("raw", False)
@@ -26,14 +55,30 @@ class TrapiView(HTTPMethodView):
         include_extra: bool = request.args.get("include_extra", True)
         query_backend: Optional[str] = request.args.get("query_backend", None)
 
-        trapi_body = request.json
+        trapi_body = load_trapi_body(request)
         try:
             annotator = Annotator(query_backend=query_backend)
+            response_headers = {**self.default_headers, "X-Query-Backend": annotator.query_backend}
+            nodes_span = getattr(request.ctx, "trapi_nodes_span", None)
+            if nodes_span is not None and request.app.config.get("TRAPI_RESPONSE_SPLICING", False):
+                return await self.spliced_response(
+                    request,
+                    annotator,
+                    trapi_body,
+                    nodes_span,
+                    response_headers,
+                    fields=fields,
+                    raw=raw,
+                    append=append,
+                    limit=limit,
+                    include_extra=include_extra,
+                )
+
             annotated_node = await annotator.annotate_trapi(
                 trapi_body, fields=fields, raw=raw, append=append, limit=limit, include_extra=include_extra
             )
-            response_headers = {**self.default_headers, "X-Query-Backend": annotator.query_backend}
-            return sanic.json(annotated_node, headers=response_headers)
+            with stage("serialize"):
+                return sanic.json(annotated_node, headers=response_headers)
         except InvalidQueryBackendError:
             logger.error("Invalid query backend deployment configuration")
             return sanic.json(
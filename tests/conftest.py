@@ -18,6 +18,8 @@ import pytest
 pytest_plugins = [
     "fixtures.application",
     "fixtures.datastore",
+    "fixtures.backend",
+    "fixtures.elasticsearch",
 ]
 
 logger = logging.getLogger(__name__)
@@ -29,3 +31,14 @@ def annotator_environment():
     api_host = "https://biothings.ci.transltr.io"
     os.environ["SERVICE_PROVIDER_API_HOST"] = api_host
     logger.info("Set SERVICE PROVIDER API HOST: %s for tests", api_host)
+
+
+@pytest.fixture
+def fresh_build_metadata(test_annotator):
+    """
+    Drops the version metadata cached on the application before and after the
+    test, so the test builds its own
+    """
+    vars(test_annotator.ctx).pop("build_metadata", None)
+    yield test_annotator
+    vars(test_annotator.ctx).pop("build_metadata", None)
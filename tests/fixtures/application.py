@@ -14,6 +14,8 @@ def test_annotator() -> sanic.Sanic:
     """
     default_configuration = load_configuration()
     default_configuration["application"]["runtime"]["debug"] = True
+    # the deep status check is exercised explicitly instead of querying backends in the background
+    default_configuration["application"]["configuration"]["STATUS_CHECK_INTERVAL"] = 0
     application = build_application(default_configuration)
     TestManager(application)
     yield application
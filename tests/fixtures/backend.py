@@ -0,0 +1,135 @@
+"""
+Deterministic stand-in for the annotator query backends
+
+Every node type client (and the extra annotation client) is replaced with a
+StandInQueryClient generating its hits from the query ids, so the whole
+annotation path, from the Sanic views down to the transformer, runs offline.
+A fixed latency can be injected per backend call to model the round trip of
+a real backend
+"""
+
+from copy import deepcopy
+from typing import Dict, Iterable, List, Optional
+import asyncio
+import hashlib
+
+import pytest
+
+from biothings_annotator.annotator import transformer
+
+STAND_IN_ATC_ROWS = [
+    {"atc": {"code": "N", "name": "Nervous system"}},
+    {"atc": {"code": "N02", "name": "Analgesics"}},
+    {"atc": {"code": "N02B", "name": "Other analgesics and antipyretics"}},
+    {"atc": {"code": "N02BA", "name": "Salicylic acid and derivatives"}},
+    {"atc": {"code": "N02BA01", "name": "Acetylsalicylic acid"}},
+]
+
+
+def _query_seed(query_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(query_id.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+class StandInQueryClient:
+    """
+    Query client generating the hits of a query id from the id itself. One in
+    notfound_every query ids is not found, the others get hit_count hits
+    """
+
+    def __init__(self, node_type: str, latency: float = 0.0, hit_count: int = 1, notfound_every: int = 10):
+        self.node_type = node_type
+        self.latency = latency
+        self.hit_count = hit_count
+        self.notfound_every = notfound_every
+        self.querymany_calls = 0
+        self.query_ids = 0
+
+    def hits(self, query_id: str) -> List[Dict]:
+        seed = _query_seed(query_id)
+        if self.notfound_every and seed % self.notfound_every == 0:
+            return [{"query": query_id, "notfound": True}]
+
+        hits = []
+        for index in range(self.hit_count):
+            hit = {"query": query_id, "_id": f"{query_id}-{index}" if index else query_id, "_score": 100.0 - index}
+            if self.node_type == "chem":
+                hit["chembl"] = {
+                    "molecule_chembl_id": f"CHEMBL{seed % 100000}",
+                    "drug_indications": [{"mesh_id": f"D{seed % 1000000:06d}"}],
+                    "atc_classifications": "N02BA01",
+                }
+            else:
+                hit["name"] = f"{self.node_type} {seed % 100000}"
+            hits.append(hit)
+        return hits
+
+    async def querymany(self, query_list: Iterable[str], scopes, fields) -> List[Dict]:
+        del scopes, fields
+        query_list = list(query_list)
+        self.querymany_calls += 1
+        self.query_ids += len(query_list)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        hits = []
+        for query_id in query_list:
+            hits.extend(self.hits(query_id))
+        return hits
+
+    async def query(self, query, fields=None, fetch_all=False, size=None, skip=0):
+        del query, fields, size, skip
+
+        async def _atc_iterator():
+            for row in STAND_IN_ATC_ROWS:
+                yield deepcopy(row)
+
+        if fetch_all:
+            return _atc_iterator()
+        return {"took": 0, "total": 0, "max_score": None, "hits": []}
+
+
+class StandInBackend:
+    """
+    The stand-in clients by node type, shared by both query backends
+    """
+
+    def __init__(self, latency: float = 0.0, hit_count: int = 1, notfound_every: int = 10):
+        self.latency = latency
+        self.hit_count = hit_count
+        self.notfound_every = notfound_every
+        self.clients: Dict[str, StandInQueryClient] = {}
+
+    def get_query_client(
+        self, node_type: str, query_backend: str, api_host: str, elasticsearch_connection: Optional[str] = None
+    ) -> StandInQueryClient:
+        del query_backend, api_host, elasticsearch_connection
+        client = self.clients.get(node_type, None)
+        if client is None:
+            client = StandInQueryClient(node_type, self.latency, self.hit_count, self.notfound_every)
+            self.clients[node_type] = client
+        return client
+
+    def set_latency(self, latency: float) -> None:
+        self.latency = latency
+        for client in self.clients.values():
+            client.latency = latency
+
+    @property
+    def querymany_calls(self) -> int:
+        return sum(client.querymany_calls for client in self.clients.values())
+
+    @property
+    def query_ids(self) -> int:
+        return sum(client.query_ids for client in self.clients.values())
+
+
+@pytest.fixture(scope="function")
+def stand_in_backend(monkeypatch) -> StandInBackend:
+    """
+    Replaces the annotator query clients with a StandInBackend without latency,
+    tests set one with StandInBackend.set_latency
+    """
+    backend = StandInBackend()
+    monkeypatch.setattr("biothings_annotator.annotator.annotator.get_query_client", backend.get_query_client)
+    monkeypatch.setattr(transformer, "atc_cache", {})
+    yield backend
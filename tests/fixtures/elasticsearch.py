@@ -0,0 +1,390 @@
+"""
+In-process Elasticsearch stand-in for the ElasticsearchAnnotatorClient
+
+ElasticsearchStandIn is an ASGI application serving the subset of the
+Elasticsearch REST API the adapter emits, over documents seeded by index:
+
+> POST /{index}/_msearch   ndjson bool/should queries of ids and term clauses
+> POST /{index}/_search    query_string, exists and match_all queries, from/size
+> POST /{index}/_pit       point in time over an index, DELETE /_pit closes it
+> POST /_search            point in time searches sorted by _shard_doc, search_after
+> GET  /{index}/_mapping   mapping inferred from the seeded documents
+
+A latency is injected per request and failures are injected per endpoint,
+either as HTTP errors or as failed _msearch items, so the adapter can be
+benchmarked and its error handling exercised without a live cluster. The
+adapter reaches it through an httpx.ASGITransport
+"""
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+import asyncio
+import collections
+import itertools
+import json
+import urllib.parse
+
+import httpx
+import pytest
+
+from biothings_annotator.annotator import transformer
+from biothings_annotator.annotator.elasticsearch import ElasticsearchAnnotatorClient
+from biothings_annotator.annotator.settings import ANNOTATOR_CLIENTS, ELASTICSEARCH_CONNECTIONS
+from biothings_annotator.annotator.utils import compile_dotfield
+
+STAND_IN_CONNECTION = "stand_in"
+STAND_IN_HOST = "http://elasticsearch.stand-in:9200"
+STAND_IN_SEED = Path(__file__).parent.parent.joinpath("data", "elasticsearch_seed.json")
+
+
+def _leaf_values(value: Any) -> Iterable[Any]:
+    if isinstance(value, list):
+        for item in value:
+            yield from _leaf_values(item)
+    elif value is not None:
+        yield value
+
+
+def _filter_source(source: Any, fields: List[Tuple[str, ...]]) -> Any:
+    """
+    The _source filtering of Elasticsearch: the fields are dotted paths, lists
+    are filtered item by item and a field covers all of its subfields
+    """
+    if isinstance(source, list):
+        filtered_items = [_filter_source(item, fields) for item in source]
+        return [item for item in filtered_items if item not in ({}, None)]
+    if not isinstance(source, dict):
+        return None
+
+    subfields = collections.defaultdict(list)
+    for field in fields:
+        subfields[field[0]].append(field[1:])
+    filtered_source = {}
+    for key, key_subfields in subfields.items():
+        if key not in source:
+            continue
+        if () in key_subfields:
+            filtered_source[key] = source[key]
+        else:
+            filtered_value = _filter_source(source[key], key_subfields)
+            if filtered_value not in ({}, [], None):
+                filtered_source[key] = filtered_value
+    return filtered_source
+
+
+def _infer_mapping(documents: Iterable[Dict]) -> Dict:
+    properties = {}
+    for document in documents:
+        _merge_mapping(properties, document)
+    return properties
+
+
+def _merge_mapping(properties: Dict, document: Dict) -> None:
+    for key, value in document.items():
+        for leaf in _leaf_values(value):
+            if isinstance(leaf, dict):
+                mapping = properties.setdefault(key, {"properties": {}})
+                _merge_mapping(mapping.setdefault("properties", {}), leaf)
+            elif isinstance(leaf, bool):
+                properties.setdefault(key, {"type": "boolean"})
+            elif isinstance(leaf, int):
+                properties.setdefault(key, {"type": "long"})
+            elif isinstance(leaf, float):
+                properties.setdefault(key, {"type": "float"})
+            else:
+                properties.setdefault(key, {"type": "text", "fields": {"keyword": {"type": "keyword"}}})
+
+
+class InjectedFailure:
+    """
+    count failures of the requests to an endpoint (_msearch, _search, _pit,
+    _mapping, None for any), answered with status or, for _msearch with
+    status None, as failed items of the queries in query_ids
+    """
+
+    __slots__ = ("endpoint", "status", "count", "query_ids")
+
+    def __init__(
+        self, endpoint: Optional[str], status: Optional[int], count: int, query_ids: Optional[Iterable[str]] = None
+    ):
+        self.endpoint = endpoint
+        self.status = status
+        self.count = count
+        self.query_ids = frozenset(query_ids or ())
+
+    def matches(self, endpoint: str) -> bool:
+        return self.count > 0 and self.endpoint in (None, endpoint)
+
+
+class StandInIndex:
+    """
+    The seeded documents of one index, with the term lookups built on demand
+    """
+
+    def __init__(self, name: str, documents: List[Dict]):
+        self.name = name
+        self.documents = documents
+        self.positions_by_id = {document["_id"]: position for position, document in enumerate(documents)}
+        self._terms: Dict[str, Dict[str, List[int]]] = {}
+
+    def term_positions(self, field: str, value: Any) -> List[int]:
+        if field.endswith(".keyword"):
+            field = field[: -len(".keyword")]
+        terms = self._terms.get(field, None)
+        if terms is None:
+            terms = collections.defaultdict(list)
+            field_path = compile_dotfield(field)
+            for position, document in enumerate(self.documents):
+                for term in set(map(str, field_path.values(document["_source"]))):
+                    terms[term].append(position)
+            self._terms[field] = terms
+        return terms.get(str(value), [])
+
+    def match(self, query: Dict) -> List[int]:
+        """
+        Positions of the documents matching the query, in index order
+        """
+        if not query or "match_all" in query:
+            return list(range(len(self.documents)))
+        if "ids" in query:
+            positions = (self.positions_by_id.get(_id, None) for _id in query["ids"]["values"])
+            return sorted(position for position in positions if position is not None)
+        if "term" in query:
+            ((field, value),) = query["term"].items()
+            if isinstance(value, dict):
+                value = value["value"]
+            return self.term_positions(field, value)
+        if "exists" in query:
+            field_path = compile_dotfield(query["exists"]["field"])
+            return [
+                position
+                for position, document in enumerate(self.documents)
+                if any(value is not None for value in field_path.values(document["_source"]))
+            ]
+        if "query_string" in query:
+            return self._match_query_string(query["query_string"]["query"])
+        if "bool" in query:
+            should_positions = set()
+            for should_query in query["bool"].get("should", []):
+                should_positions.update(self.match(should_query))
+            return sorted(should_positions)
+        raise ValueError(f"Unsupported query {sorted(query)}")
+
+    def _match_query_string(self, query_string: str) -> List[int]:
+        if query_string.strip() in ("", "*"):
+            return self.match({"match_all": {}})
+        if query_string.startswith("_exists_:"):
+            return self.match({"exists": {"field": query_string.split(":", 1)[1]}})
+        if ":" in query_string:
+            field, value = query_string.split(":", 1)
+            return self.term_positions(field, value.strip('"'))
+        return self.match({"ids": {"values": [query_string]}})
+
+    def hit(self, position: int, source_fields: Union[bool, List[str]], score: Optional[float] = 1.0) -> Dict:
+        document = self.documents[position]
+        source = document["_source"]
+        if source_fields is False:
+            source = {}
+        elif isinstance(source_fields, list):
+            source = _filter_source(source, [tuple(field.split(".")) for field in source_fields])
+        return {"_index": self.name, "_id": document["_id"], "_score": score, "_source": source}
+
+
+class ElasticsearchStandIn:
+    """
+    ASGI application emulating an Elasticsearch cluster, see the module docstring
+    """
+
+    def __init__(self, documents_by_index: Dict[str, List[Dict]], latency: float = 0.0):
+        self.indices = {name: StandInIndex(name, documents) for name, documents in documents_by_index.items()}
+        self.latency = latency
+        self.failures: List[InjectedFailure] = []
+        self.requests = collections.Counter()
+        self.point_in_times: Dict[str, str] = {}
+        self._pit_ids = itertools.count()
+
+    @classmethod
+    def from_seed(cls, seed_file: Union[str, Path] = STAND_IN_SEED, **kwargs) -> "ElasticsearchStandIn":
+        with open(str(seed_file), "r", encoding="utf-8") as file_handle:
+            return cls(json.load(file_handle), **kwargs)
+
+    def add_documents(self, index: str, documents: Iterable[Dict]) -> None:
+        existing_documents = self.indices[index].documents if index in self.indices else []
+        self.indices[index] = StandInIndex(index, existing_documents + list(documents))
+
+    def inject_failure(
+        self,
+        endpoint: Optional[str] = None,
+        status: Optional[int] = 503,
+        count: int = 1,
+        query_ids: Optional[Iterable[str]] = None,
+    ) -> InjectedFailure:
+        failure = InjectedFailure(endpoint, status, count, query_ids)
+        self.failures.append(failure)
+        return failure
+
+    def http_client(self, **kwargs) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=self), base_url=STAND_IN_HOST, **kwargs)
+
+    def client(
+        self, index: str, http_client: Optional[httpx.AsyncClient] = None, **kwargs
+    ) -> ElasticsearchAnnotatorClient:
+        http_client = http_client or self.http_client()
+        return ElasticsearchAnnotatorClient(STAND_IN_HOST, index, http_client=http_client, **kwargs)
+
+    async def __call__(self, scope: Dict, receive, send) -> None:
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        status, payload = self.handle(
+            scope["method"], scope["path"], urllib.parse.parse_qs(scope["query_string"].decode("latin-1")), body
+        )
+        response_body = json.dumps(payload).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(response_body)).encode("latin-1")),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": response_body})
+
+    def handle(self, method: str, path: str, params: Dict, body: bytes) -> Tuple[int, Dict]:
+        segments = [segment for segment in path.split("/") if segment]
+        if not segments:
+            return 200, {"tagline": "You Know, for Search"}
+        endpoint = segments[-1]
+        index_name = segments[0] if len(segments) > 1 else None
+        self.requests[(method, endpoint)] += 1
+
+        failure = next((failure for failure in self.failures if failure.matches(endpoint)), None)
+        if failure is not None and failure.status is not None:
+            failure.count -= 1
+            return failure.status, {"error": {"type": "injected_failure"}, "status": failure.status}
+
+        if index_name is not None and index_name not in self.indices:
+            return 404, {"error": {"type": "index_not_found_exception", "index": index_name}, "status": 404}
+        index = self.indices.get(index_name, None)
+
+        try:
+            if (method, endpoint) == ("POST", "_msearch"):
+                return 200, self._msearch(index, body, failure)
+            if (method, endpoint) == ("POST", "_search"):
+                return self._search(index, json.loads(body or b"{}"))
+            if (method, endpoint) == ("POST", "_pit") and index is not None:
+                pit_id = f"pit-{next(self._pit_ids)}"
+                self.point_in_times[pit_id] = index.name
+                return 200, {"id": pit_id}
+            if (method, endpoint) == ("DELETE", "_pit") and index is None:
+                pit_id = json.loads(body or b"{}").get("id")
+                if self.point_in_times.pop(pit_id, None) is None:
+                    return 404, {"succeeded": False, "num_freed": 0}
+                return 200, {"succeeded": True, "num_freed": 1}
+            if (method, endpoint) == ("GET", "_mapping") and index is not None:
+                properties = _infer_mapping(document["_source"] for document in index.documents)
+                return 200, {index.name: {"mappings": {"properties": properties}}}
+        except (ValueError, KeyError) as parse_error:
+            return 400, {"error": {"type": "parsing_exception", "reason": str(parse_error)}, "status": 400}
+        return 405, {"error": f"Incorrect HTTP method for uri [{path}] and method [{method}]", "status": 405}
+
+    def _msearch(self, index: StandInIndex, body: bytes, failure: Optional[InjectedFailure]) -> Dict:
+        lines = [json.loads(line) for line in body.decode("utf-8").splitlines() if line.strip()]
+        responses = []
+        for header, search in zip(lines[::2], lines[1::2]):
+            search_index = self.indices[header["index"]] if header.get("index") else index
+            if failure is not None and self._query_ids(search["query"]) & failure.query_ids:
+                failure.count -= 1
+                responses.append({"error": {"type": "injected_failure"}, "status": 500})
+                continue
+            positions = search_index.match(search["query"])
+            responses.append(self._hits_response(search_index, positions, search, status=200))
+        return {"took": 0, "responses": responses}
+
+    def _search(self, index: Optional[StandInIndex], search: Dict) -> Tuple[int, Dict]:
+        pit = search.get("pit", None)
+        if pit is not None:
+            index_name = self.point_in_times.get(pit.get("id"), None)
+            if index_name is None:
+                return 404, {"error": {"type": "search_context_missing_exception"}, "status": 404}
+            index = self.indices[index_name]
+        if index is None:
+            return 400, {"error": {"type": "action_request_validation_exception"}, "status": 400}
+
+        positions = index.match(search.get("query", {}))
+        search_after = search.get("search_after", None)
+        if search_after:
+            positions = [position for position in positions if position > search_after[0]]
+        response = self._hits_response(index, positions, search)
+        if pit is not None:
+            response["pit_id"] = pit["id"]
+            for hit in response["hits"]["hits"]:
+                hit["sort"] = [index.positions_by_id[hit["_id"]]]
+        return 200, response
+
+    @staticmethod
+    def _hits_response(index: StandInIndex, positions: List[int], search: Dict, **extra) -> Dict:
+        offset = search.get("from", 0)
+        size = search.get("size", 10)
+        source_fields = search.get("_source", True)
+        hits = [index.hit(position, source_fields) for position in positions[offset : offset + size]]
+        return {
+            "took": 0,
+            "timed_out": False,
+            "hits": {
+                "total": {"value": len(positions), "relation": "eq"},
+                "max_score": 1.0 if hits else None,
+                "hits": hits,
+            },
+            **extra,
+        }
+
+    @classmethod
+    def _query_ids(cls, query: Dict) -> set:
+        if "ids" in query:
+            return set(query["ids"]["values"])
+        if "term" in query:
+            return {str(value) for value in query["term"].values()}
+        if "bool" in query:
+            return set().union(*(cls._query_ids(should_query) for should_query in query["bool"].get("should", [])))
+        return set()
+
+
+@pytest.fixture(scope="function")
+def elasticsearch_stand_in() -> ElasticsearchStandIn:
+    """
+    An ElasticsearchStandIn seeded with tests/data/elasticsearch_seed.json
+    """
+    yield ElasticsearchStandIn.from_seed()
+
+
+@pytest.fixture(scope="function")
+def elasticsearch_stand_in_backend(monkeypatch, elasticsearch_stand_in: ElasticsearchStandIn) -> ElasticsearchStandIn:
+    """
+    Routes the elasticsearch query backend of the annotator to the stand-in
+    through the STAND_IN_CONNECTION connection, which annotators select with
+    their elasticsearch_connection attribute
+    """
+    monkeypatch.setattr(transformer, "atc_cache", {})
+    monkeypatch.setitem(ELASTICSEARCH_CONNECTIONS, STAND_IN_CONNECTION, {"host": STAND_IN_HOST})
+    http_client = elasticsearch_stand_in.http_client()
+    for client_configuration in ANNOTATOR_CLIENTS.values():
+        elasticsearch_configuration = client_configuration["elasticsearch"]
+        monkeypatch.setitem(
+            elasticsearch_configuration,
+            "instance",
+            elasticsearch_stand_in.client(elasticsearch_configuration["index"], http_client=http_client),
+        )
+    yield elasticsearch_stand_in
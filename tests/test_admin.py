@@ -0,0 +1,144 @@
+"""
+Tests the admin routes, the worker profiler and the slow-request log
+"""
+
+import asyncio
+import threading
+
+import pytest
+import sanic
+
+from biothings_annotator.application.profiling import render_folded, sample_thread_stacks
+from biothings_annotator.application.slow_requests import get_slow_request_log
+
+ADMIN_TOKEN = "test-admin-token"
+
+
+@pytest.fixture()
+def admin_enabled(test_annotator: sanic.Sanic, monkeypatch) -> dict:
+    monkeypatch.setitem(test_annotator.config, "ADMIN_ENABLED", True)
+    monkeypatch.setitem(test_annotator.config, "ADMIN_TOKEN", ADMIN_TOKEN)
+    return {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+
+
+def _busy_wait(stop: threading.Event) -> None:
+    while not stop.is_set():
+        stop.wait(0.001)
+
+
+@pytest.mark.unit
+def test_sample_thread_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_wait, args=(stop,))
+    worker.start()
+    try:
+        stacks = sample_thread_stacks(worker.ident, duration=0.1, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert sum(stacks.values()) > 1
+    assert all(f"{__name__}._busy_wait" in stack.split(";") for stack in stacks)
+    for line in render_folded(stacks).splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack.startswith("threading.Thread._bootstrap")
+        assert int(count) == stacks[stack]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+async def test_admin_routes_disabled_by_default(test_annotator: sanic.Sanic, monkeypatch):
+    _, response = await test_annotator.asgi_client.request(method="get", url="/admin/profile")
+    assert response.status_code == 404
+
+    # Enabling the admin routes without a token keeps them disabled
+    monkeypatch.setitem(test_annotator.config, "ADMIN_ENABLED", True)
+    monkeypatch.delenv("ANNOTATOR_ADMIN_TOKEN", raising=False)
+    _, response = await test_annotator.asgi_client.request(method="get", url="/admin/profile")
+    assert response.status_code == 404
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+async def test_admin_routes_require_token(test_annotator: sanic.Sanic, admin_enabled: dict):
+    _, response = await test_annotator.asgi_client.request(method="get", url="/admin/profile")
+    assert response.status_code == 401
+    assert response.headers["www-authenticate"] == "Bearer"
+
+    headers = {"Authorization": "Bearer wrong-token"}
+    _, response = await test_annotator.asgi_client.request(method="get", url="/admin/profile", headers=headers)
+    assert response.status_code == 401
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+@pytest.mark.parametrize("mode", ["cpu", "tasks"])
+async def test_profile_endpoint(test_annotator: sanic.Sanic, admin_enabled: dict, mode: str):
+    pending_task = asyncio.create_task(asyncio.sleep(10), name="pending-task")
+    try:
+        _, response = await test_annotator.asgi_client.request(
+            method="get", url="/admin/profile", params={"mode": mode, "seconds": 0.2}, headers=admin_enabled
+        )
+    finally:
+        pending_task.cancel()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.headers["content-disposition"].endswith(f'-{mode}.folded"')
+    lines = response.text.splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert stack
+        assert int(count) > 0
+    if mode == "tasks":
+        assert any(line.startswith("pending-task;asyncio.tasks.sleep ") for line in lines)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+@pytest.mark.parametrize(
+    "params", [{"mode": "memory"}, {"seconds": "soon"}, {"seconds": 0}, {"seconds": 3600}, {"interval": 5}]
+)
+async def test_profile_endpoint_rejects_invalid_parameters(test_annotator: sanic.Sanic, admin_enabled: dict, params):
+    _, response = await test_annotator.asgi_client.request(
+        method="get", url="/admin/profile", params=params, headers=admin_enabled
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+async def test_slow_request_log(test_annotator: sanic.Sanic, admin_enabled: dict, stand_in_backend, monkeypatch):
+    get_slow_request_log(test_annotator).clear()
+    curie_list = ["NCBIGene:1017", "NCBIGene:1018", "MONDO:0005148", "UNSUPPORTED:1"]
+    _, response = await test_annotator.asgi_client.request(method="get", url="/status/live")
+    assert response.status_code == 200
+    assert not get_slow_request_log(test_annotator)
+
+    monkeypatch.setitem(test_annotator.config, "SLOW_REQUEST_SECONDS", 0)
+    _, response = await test_annotator.asgi_client.request(
+        method="post", url="/curie/", params={"include_extra": 0}, json={"ids": curie_list}
+    )
+    assert response.status_code == 200
+
+    # The admin routes are not logged
+    _, response = await test_annotator.asgi_client.request(
+        method="get", url="/admin/slow-requests", headers=admin_enabled
+    )
+    assert response.status_code == 200
+    assert response.json["threshold"] == 0
+    (slow_request,) = response.json["requests"]
+    assert slow_request["route"] == "batch_curie_endpoint"
+    assert slow_request["status"] == 200
+    assert slow_request["curies"] == {"gene": 2, "disease": 1}
+    assert slow_request["unsupported_curies"] == 1
+    assert {scope_group["node_type"] for scope_group in slow_request["scope_groups"]} == {"gene", "disease"}
+    assert slow_request["backend_calls"] == stand_in_backend.querymany_calls == 2
+    assert set(slow_request["cache_hits"]) == {"curie", "atc"}
+    assert {"plan", "query", "backend_call", "transform", "serialize"} <= set(slow_request["stages"])
+
+    _, response = await test_annotator.asgi_client.request(
+        method="get", url="/admin/slow-requests", params={"limit": 0}, headers=admin_enabled
+    )
+    assert response.json["requests"] == []
@@ -0,0 +1,172 @@
+"""
+Tests the admission control middleware guarding the annotation routes
+"""
+
+import asyncio
+
+import pytest
+import sanic
+
+from biothings_annotator.application.middleware.admission import (
+    HEAVY_BUDGET,
+    LIGHT_BUDGET,
+    AdmissionController,
+    AdmissionRejected,
+)
+
+
+def build_controller(**overrides) -> AdmissionController:
+    settings = {
+        "max_inflight_light": 2,
+        "max_inflight_heavy": 1,
+        "max_inflight_curies": 100,
+        "max_queue": 2,
+        "queue_timeout": 1,
+    }
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_admission_budgets_are_independent():
+    controller = build_controller()
+
+    heavy_ticket = await controller.acquire(HEAVY_BUDGET, 10)
+    light_tickets = [await controller.acquire(LIGHT_BUDGET, 1) for _ in range(2)]
+
+    assert controller.inflight == {LIGHT_BUDGET: 2, HEAVY_BUDGET: 1}
+    assert controller.inflight_curies == 10
+
+    for ticket in (heavy_ticket, *light_tickets):
+        controller.release(ticket)
+        controller.release(ticket)
+    assert controller.inflight == {LIGHT_BUDGET: 0, HEAVY_BUDGET: 0}
+    assert controller.inflight_curies == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_admission_queues_until_capacity_is_released():
+    controller = build_controller()
+    first_ticket = await controller.acquire(HEAVY_BUDGET, 10)
+
+    waiting_request = asyncio.ensure_future(controller.acquire(HEAVY_BUDGET, 10))
+    await asyncio.sleep(0)
+    assert controller.queue_depth == 1
+    assert not waiting_request.done()
+
+    controller.release(first_ticket)
+    second_ticket = await waiting_request
+    assert controller.queue_depth == 0
+    assert controller.inflight[HEAVY_BUDGET] == 1
+    controller.release(second_ticket)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_admission_curie_budget_bounds_heavy_requests():
+    controller = build_controller(max_inflight_heavy=4, max_inflight_curies=100)
+    large_ticket = await controller.acquire(HEAVY_BUDGET, 80)
+
+    waiting_request = asyncio.ensure_future(controller.acquire(HEAVY_BUDGET, 50))
+    await asyncio.sleep(0)
+    assert not waiting_request.done()
+
+    controller.release(large_ticket)
+    ticket = await waiting_request
+    assert controller.inflight_curies == 50
+    controller.release(ticket)
+
+    # Requests above the whole CURIE budget are still served on an idle worker
+    oversized_ticket = await controller.acquire(HEAVY_BUDGET, 10000)
+    assert oversized_ticket.cost == 100
+    controller.release(oversized_ticket)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_admission_curie_budget_does_not_hold_back_light_requests():
+    controller = build_controller(max_inflight_heavy=1, max_inflight_curies=100)
+    heavy_ticket = await controller.acquire(HEAVY_BUDGET, 100)
+
+    # the batch holds every CURIE and the heavy slot, the lookups are admitted without queueing
+    waiting_request = asyncio.ensure_future(controller.acquire(HEAVY_BUDGET, 1))
+    await asyncio.sleep(0)
+    light_tickets = [await controller.acquire(LIGHT_BUDGET, 1) for _ in range(2)]
+    assert controller.inflight == {LIGHT_BUDGET: 2, HEAVY_BUDGET: 1}
+    assert controller.inflight_curies == 100
+    assert controller.queue_depth == 1
+
+    for ticket in (*light_tickets, heavy_ticket):
+        controller.release(ticket)
+    controller.release(await waiting_request)
+    assert controller.inflight_curies == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_admission_rejects_when_queue_is_full_or_wait_times_out():
+    controller = build_controller(max_queue=1, queue_timeout=0.05)
+    ticket = await controller.acquire(HEAVY_BUDGET, 1)
+
+    waiting_request = asyncio.ensure_future(controller.acquire(HEAVY_BUDGET, 1))
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejected) as queue_full:
+        await controller.acquire(HEAVY_BUDGET, 1)
+    assert queue_full.value.status == 429
+
+    with pytest.raises(AdmissionRejected) as timed_out:
+        await waiting_request
+    assert timed_out.value.status == 503
+    assert controller.queue_depth == 0
+
+    controller.release(ticket)
+    assert controller.inflight == {LIGHT_BUDGET: 0, HEAVY_BUDGET: 0}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_admission_dispatches_waiters_behind_a_timed_out_head():
+    controller = build_controller(max_inflight_heavy=4, max_inflight_curies=100, queue_timeout=0.1)
+    ticket = await controller.acquire(HEAVY_BUDGET, 60)
+
+    # the head does not fit into the CURIE budget, the next waiter only queues behind it
+    head_request = asyncio.ensure_future(controller.acquire(HEAVY_BUDGET, 50))
+    await asyncio.sleep(0.05)
+    next_request = asyncio.ensure_future(controller.acquire(HEAVY_BUDGET, 10))
+    await asyncio.sleep(0)
+    assert controller.queue_depth == 2
+
+    with pytest.raises(AdmissionRejected) as timed_out:
+        await head_request
+    assert timed_out.value.status == 503
+
+    next_ticket = await next_request
+    assert controller.queue_depth == 0
+    assert controller.inflight_curies == 70
+
+    for held_ticket in (ticket, next_ticket):
+        controller.release(held_ticket)
+    assert controller.inflight == {LIGHT_BUDGET: 0, HEAVY_BUDGET: 0}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+async def test_saturated_worker_sheds_annotation_requests(test_annotator: sanic.Sanic):
+    saturated_controller = build_controller(max_inflight_light=0, max_inflight_heavy=0, max_queue=0)
+    test_annotator.ctx.admission_controller = saturated_controller
+    try:
+        _, response = await test_annotator.asgi_client.request(method="get", url="/curie/NCBIGene:1017")
+        _, batch_response = await test_annotator.asgi_client.request(
+            method="post", url="/curie/", json=["NCBIGene:1017"]
+        )
+    finally:
+        del test_annotator.ctx.admission_controller
+
+    retry_after = str(test_annotator.config.ADMISSION_RETRY_AFTER)
+    for shed_response in (response, batch_response):
+        assert shed_response.status_code == 429
+        assert shed_response.headers["Retry-After"] == retry_after
+        assert shed_response.json["retry_after"] == test_annotator.config.ADMISSION_RETRY_AFTER
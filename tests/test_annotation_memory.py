@@ -0,0 +1,98 @@
+"""
+Memory benchmark of the CURIE planning stage on a large batch
+
+Compares the allocations of the slotted query plan records against the
+dictionaries and lists the annotator used to build for the same batch
+"""
+
+import logging
+import tracemalloc
+from collections import OrderedDict
+from typing import Callable, List
+
+import pytest
+
+from biothings_annotator.annotator.resolver import CurieResolver
+from biothings_annotator.annotator.utils import parse_curie
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50000
+
+
+def build_curie_batch(size: int) -> List[str]:
+    prefixes = ["NCBIGene", "ENSEMBL", "PUBCHEM.COMPOUND", "CHEBI", "MONDO", "UNKNOWN"]
+    curie_list = []
+    for index in range(size):
+        # one in ten CURIEs repeats an earlier one, as seen in ARA payloads
+        local_id = index - 9 if index % 10 == 9 else index
+        curie_list.append(f"{prefixes[local_id % len(prefixes)]}:{local_id}")
+    return curie_list
+
+
+def plan_with_dictionaries(curie_list: List[str], resolver: CurieResolver):
+    """
+    The planning data structures of annotate_curie_list before the
+    introduction of the query plan records
+    """
+    node_list_by_type = {}
+    node_d = OrderedDict()
+    for node_id in curie_list:
+        node_d[node_id] = {}
+        node_type = parse_curie(node_id, return_type=True, return_id=False)
+        if node_type:
+            node_list_by_type.setdefault(node_type, []).append(node_id)
+
+    grouped_queries = []
+    for node_type, node_list in node_list_by_type.items():
+        groups = OrderedDict()
+        for curie in node_list:
+            scopes = resolver.scopes_for_prefix(node_type, curie.split(":", 1)[0])
+            key = tuple(scopes) if isinstance(scopes, list) else scopes
+            groups.setdefault(key, []).append(curie)
+        for key, scoped_node_list in groups.items():
+            query_list = [parse_curie(_id, return_type=False, return_id=True) for _id in scoped_node_list]
+            node_id_d = dict(zip(query_list, scoped_node_list))
+            grouped_queries.append((key, query_list, node_id_d))
+    return node_d, grouped_queries
+
+
+def plan_with_records(curie_list: List[str], resolver: CurieResolver):
+    node_d = dict.fromkeys(curie_list)
+    plans, unsupported = resolver.resolve_many(node_d)
+    grouped_queries = [
+        (scope_group.scope_key, scope_group.query_ids, scope_group)
+        for plan in plans.values()
+        for scope_group in plan.scope_groups.values()
+    ]
+    return node_d, grouped_queries
+
+
+def peak_allocation(planner: Callable, curie_list: List[str]) -> int:
+    # an empty resolution cache, only the planning structures are measured
+    resolver = CurieResolver("biothings", cache_size=0)
+    tracemalloc.start()
+    try:
+        plan = planner(curie_list, resolver)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del plan
+    return peak
+
+
+@pytest.mark.unit
+@pytest.mark.performance
+def test_query_plan_records_allocate_less_than_dictionaries():
+    curie_list = build_curie_batch(BATCH_SIZE)
+
+    dictionary_peak = peak_allocation(plan_with_dictionaries, curie_list)
+    record_peak = peak_allocation(plan_with_records, curie_list)
+    logger.info(
+        "Planning %s CURIEs: %.1f MiB with dictionaries, %.1f MiB with records",
+        BATCH_SIZE,
+        dictionary_peak / 2**20,
+        record_peak / 2**20,
+    )
+
+    assert record_peak < 0.75 * dictionary_peak
@@ -9,7 +9,9 @@ import sanic
 
 from biothings_annotator import utils
 from biothings_annotator.annotator import Annotator
+from biothings_annotator.annotator import transformer
 from biothings_annotator.annotator.settings import QUERY_BACKEND_ENV
+from biothings_annotator.application.listeners.health import HealthMonitor
 from biothings_annotator.application.views import VersionView
 
 
@@ -138,6 +140,62 @@ async def test_status_get_failed_data_check(test_annotator: sanic.Sanic, endpoin
 
 @pytest.mark.unit
 @pytest.mark.asyncio(loop_scope="module")
+async def test_status_live(test_annotator: sanic.Sanic):
+    """
+    Tests the liveness endpoint never queries the backend
+    """
+    with patch.object(Annotator, "query_annotations") as mock_query:
+        _, response = await test_annotator.asgi_client.request(method="get", url="/status/live")
+        _, head_response = await test_annotator.asgi_client.request(method="head", url="/status/live")
+
+        mock_query.assert_not_called()
+        assert response.status_code == 200
+        assert response.json == {"alive": True}
+        assert response.headers["Cache-Control"] == "no-store"
+        assert head_response.status_code == 200
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+@pytest.mark.parametrize(
+    "annotation, expected_status",
+    [({"1017": [{"query": "1017", "_id": "1017"}]}, 200), ({"1017": [{"query": "1017", "notfound": True}]}, 503)],
+)
+async def test_status_ready(test_annotator: sanic.Sanic, annotation: Dict, expected_status: int):
+    """
+    Tests the readiness endpoint reports the cached deep status check
+    without querying the backend itself
+    """
+    health_monitor = HealthMonitor(backends=["biothings", "elasticsearch"], interval=30, timeout=1)
+    previous_monitor = getattr(test_annotator.ctx, "health_monitor", None)
+    test_annotator.ctx.health_monitor = health_monitor
+    try:
+        _, pending_response = await test_annotator.asgi_client.request(method="get", url="/status/ready")
+        assert pending_response.status_code == 503
+        assert pending_response.json["ready"] is False
+
+        with patch.object(Annotator, "query_annotations", return_value=annotation) as mock_query:
+            await health_monitor.run_check()
+            assert mock_query.await_count == 2
+
+            _, response = await test_annotator.asgi_client.request(method="get", url="/status/ready")
+            _, head_response = await test_annotator.asgi_client.request(method="head", url="/status/ready")
+            assert mock_query.await_count == 2
+    finally:
+        test_annotator.ctx.health_monitor = previous_monitor
+
+    assert response.status_code == head_response.status_code == expected_status
+    assert response.headers["Cache-Control"] == "no-store"
+    assert response.json["ready"] is (expected_status == 200)
+    assert list(response.json["backends"]) == ["biothings", "elasticsearch"]
+    for backend_report in response.json["backends"].values():
+        assert backend_report["healthy"] is (expected_status == 200)
+        assert backend_report["latency_ms"] >= 0
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("fresh_build_metadata")
+@pytest.mark.asyncio(loop_scope="module")
 @pytest.mark.parametrize("endpoint", ["/version/"])
 async def test_version_get_success(test_annotator: sanic.Sanic, endpoint: str, monkeypatch):
     """
@@ -145,6 +203,7 @@ async def test_version_get_success(test_annotator: sanic.Sanic, endpoint: str, m
     """
     monkeypatch.delenv(QUERY_BACKEND_ENV, raising=False)
     monkeypatch.delenv("ELASTICSEARCH_CONNECTION", raising=False)
+    transformer.atc_cache.clear()
 
     with patch.object(VersionView, "open_version_file", return_value="GITHUB_HASH_VERSION_ABC123") as mock_file_read:
         request, response = await test_annotator.asgi_client.request(method="get", url=endpoint)
@@ -157,7 +216,7 @@ async def test_version_get_success(test_annotator: sanic.Sanic, endpoint: str, m
         assert request.scheme == "http"
         assert request.server_path == endpoint
 
-        expected_response_body = {"version": "GITHUB_HASH_VERSION_ABC123", "query_backend": "biothings"}
+        expected_response_body = {"version": "GITHUB_HASH_VERSION_ABC123", "query_backend": "biothings", "atc_codes": 0}
         assert response.http_version == "HTTP/1.1"
         assert response.content_type == "application/json"
         assert response.is_success
@@ -165,10 +224,12 @@ async def test_version_get_success(test_annotator: sanic.Sanic, endpoint: str, m
         assert response.is_closed
         assert response.status_code == 200
         assert response.encoding == "utf-8"
+        assert len(response.json.pop("data_version", "")) == 16
         assert response.json == expected_response_body
 
 
 @pytest.mark.unit
+@pytest.mark.usefixtures("fresh_build_metadata")
 @pytest.mark.asyncio(loop_scope="module")
 @pytest.mark.parametrize("endpoint", ["/version/"])
 async def test_version_get_reports_elasticsearch_backend(test_annotator: sanic.Sanic, endpoint: str, monkeypatch):
@@ -177,6 +238,7 @@ async def test_version_get_reports_elasticsearch_backend(test_annotator: sanic.S
     """
     monkeypatch.setenv(QUERY_BACKEND_ENV, "elasticsearch")
     monkeypatch.setenv("ELASTICSEARCH_CONNECTION", "ci")
+    transformer.atc_cache.clear()
 
     with patch.object(VersionView, "open_version_file", return_value="GITHUB_HASH_VERSION_ABC123") as mock_file_read:
         request, response = await test_annotator.asgi_client.request(method="get", url=endpoint)
@@ -193,6 +255,7 @@ async def test_version_get_reports_elasticsearch_backend(test_annotator: sanic.S
             "version": "GITHUB_HASH_VERSION_ABC123",
             "query_backend": "elasticsearch",
             "elasticsearch_connection": "ci",
+            "atc_codes": 0,
         }
         assert response.http_version == "HTTP/1.1"
         assert response.content_type == "application/json"
@@ -201,10 +264,12 @@ async def test_version_get_reports_elasticsearch_backend(test_annotator: sanic.S
         assert response.is_closed
         assert response.status_code == 200
         assert response.encoding == "utf-8"
+        assert len(response.json.pop("data_version", "")) == 16
         assert response.json == expected_response_body
 
 
 @pytest.mark.unit
+@pytest.mark.usefixtures("fresh_build_metadata")
 @pytest.mark.asyncio(loop_scope="module")
 @pytest.mark.parametrize("endpoint", ["/version/"])
 async def test_version_get_file_not_found(test_annotator: sanic.Sanic, endpoint: str, monkeypatch):
@@ -213,6 +278,7 @@ async def test_version_get_file_not_found(test_annotator: sanic.Sanic, endpoint:
     """
     monkeypatch.delenv(QUERY_BACKEND_ENV, raising=False)
     monkeypatch.delenv("ELASTICSEARCH_CONNECTION", raising=False)
+    transformer.atc_cache.clear()
 
     with patch.object(VersionView, "open_version_file", side_effect=FileNotFoundError) as mock_file_read:
         request, response = await test_annotator.asgi_client.request(method="get", url=endpoint)
@@ -225,7 +291,7 @@ async def test_version_get_file_not_found(test_annotator: sanic.Sanic, endpoint:
         assert request.scheme == "http"
         assert request.server_path == endpoint
 
-        expected_response_body = {"version": "Unknown", "query_backend": "biothings"}
+        expected_response_body = {"version": "Unknown", "query_backend": "biothings", "atc_codes": 0}
         assert response.http_version == "HTTP/1.1"
         assert response.content_type == "application/json"
         assert response.is_success
@@ -233,10 +299,12 @@ async def test_version_get_file_not_found(test_annotator: sanic.Sanic, endpoint:
         assert response.is_closed
         assert response.status_code == 200
         assert response.encoding == "utf-8"
+        assert len(response.json.pop("data_version", "")) == 16
         assert response.json == expected_response_body
 
 
 @pytest.mark.unit
+@pytest.mark.usefixtures("fresh_build_metadata")
 @pytest.mark.asyncio(loop_scope="module")
 @pytest.mark.parametrize("endpoint", ["/version/"])
 async def test_version_get_exception(test_annotator: sanic.Sanic, endpoint: str, monkeypatch):
@@ -245,6 +313,7 @@ async def test_version_get_exception(test_annotator: sanic.Sanic, endpoint: str,
     """
     monkeypatch.delenv(QUERY_BACKEND_ENV, raising=False)
     monkeypatch.delenv("ELASTICSEARCH_CONNECTION", raising=False)
+    transformer.atc_cache.clear()
 
     with patch.object(VersionView, "open_version_file", side_effect=Exception("Simulated error")) as mock_file_read:
         request, response = await test_annotator.asgi_client.request(method="get", url=endpoint)
@@ -257,7 +326,7 @@ async def test_version_get_exception(test_annotator: sanic.Sanic, endpoint: str,
         assert request.scheme == "http"
         assert request.server_path == endpoint
 
-        expected_response_body = {"version": "Unknown", "query_backend": "biothings"}
+        expected_response_body = {"version": "Unknown", "query_backend": "biothings", "atc_codes": 0}
         assert response.http_version == "HTTP/1.1"
         assert response.content_type == "application/json"
         assert response.is_success
@@ -265,10 +334,12 @@ async def test_version_get_exception(test_annotator: sanic.Sanic, endpoint: str,
         assert response.is_closed
         assert response.status_code == 200
         assert response.encoding == "utf-8"
+        assert len(response.json.pop("data_version", "")) == 16
         assert response.json == expected_response_body
 
 
 @pytest.mark.unit
+@pytest.mark.usefixtures("fresh_build_metadata")
 @pytest.mark.asyncio(loop_scope="module")
 @pytest.mark.parametrize("endpoint", ["/version/"])
 async def test_version_get_outer_exception_keeps_cache_header(
@@ -279,24 +350,72 @@ async def test_version_get_outer_exception_keeps_cache_header(
     """
     monkeypatch.delenv(QUERY_BACKEND_ENV, raising=False)
     monkeypatch.delenv("ELASTICSEARCH_CONNECTION", raising=False)
+    transformer.atc_cache.clear()
 
     with patch.object(
         VersionView,
-        "build_response_body",
-        side_effect=[
-            Exception("Simulated response error"),
-            {"version": "Unknown", "query_backend": "biothings"},
-        ],
-    ) as mock_build_response_body:
+        "load_build_metadata",
+        side_effect=Exception("Simulated response error"),
+    ) as mock_load_build_metadata:
         request, response = await test_annotator.asgi_client.request(method="get", url=endpoint)
 
-        assert mock_build_response_body.call_count == 2
+        mock_load_build_metadata.assert_called_with(test_annotator)
 
         assert request.method == "GET"
         assert response.status_code == 200
         expected_cache_control = f"max-age={test_annotator.config.CACHE_MAX_AGE}, public"
         assert response.headers["Cache-Control"] == expected_cache_control
-        assert response.json == {"version": "Unknown", "query_backend": "biothings"}
+        assert len(response.json.pop("data_version", "")) == 16
+        assert response.json == {"version": "Unknown", "query_backend": "biothings", "atc_codes": 0}
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("fresh_build_metadata")
+@pytest.mark.asyncio(loop_scope="module")
+async def test_version_metadata_is_cached_until_atc_cache_changes(test_annotator: sanic.Sanic, monkeypatch):
+    """
+    Test the version file is read once and the metadata is only rebuilt, keeping
+    the version, when the WHO ATC cache is loaded
+    """
+    monkeypatch.delenv(QUERY_BACKEND_ENV, raising=False)
+    monkeypatch.delenv("ELASTICSEARCH_CONNECTION", raising=False)
+    transformer.atc_cache.clear()
+    build_response_body = VersionView.build_response_body
+
+    with patch.object(
+        VersionView, "open_version_file", return_value="GITHUB_HASH_VERSION_ABC123"
+    ) as mock_file_read, patch.object(
+        VersionView, "build_response_body", autospec=True, side_effect=build_response_body
+    ) as spy_build_response_body:
+        _, first_response = await test_annotator.asgi_client.request(method="get", url="/version")
+        file_reads, builds = mock_file_read.call_count, spy_build_response_body.call_count
+        _, second_response = await test_annotator.asgi_client.request(method="get", url="/version")
+        assert (mock_file_read.call_count, spy_build_response_body.call_count) == (file_reads, builds)
+
+        atc_cache_key = Annotator().atc_cache_key
+        transformer.atc_cache[atc_cache_key] = {"A01AB02": "Hydrogen peroxide"}
+        try:
+            _, atc_response = await test_annotator.asgi_client.request(method="get", url="/version")
+            assert spy_build_response_body.call_count == builds + 1
+
+            # a reloaded mapping holding as many codes is picked up too
+            transformer.atc_cache[atc_cache_key] = {"A01AB03": "Chlorhexidine"}
+            monkeypatch.setitem(transformer.atc_cache_loaded_at, atc_cache_key, 1.0)
+            _, reloaded_response = await test_annotator.asgi_client.request(method="get", url="/version")
+            assert spy_build_response_body.call_count == builds + 2
+        finally:
+            transformer.atc_cache.clear()
+        assert mock_file_read.call_count == file_reads
+
+    assert first_response.json == second_response.json
+    data_versions = {
+        response.json.pop("data_version") for response in (first_response, atc_response, reloaded_response)
+    }
+    assert len(data_versions) == 3
+    expected_metadata = {"version": "GITHUB_HASH_VERSION_ABC123", "query_backend": "biothings", "atc_codes": 0}
+    assert first_response.json == expected_metadata
+    assert atc_response.json == reloaded_response.json == {**expected_metadata, "atc_codes": 1}
+    assert test_annotator.ctx.build_metadata.version == "GITHUB_HASH_VERSION_ABC123"
 
 
 @pytest.mark.unit
@@ -567,6 +686,81 @@ async def test_query_backend_override_is_forwarded(
     assert response.headers["X-Query-Backend"] == "biothings"
 
 
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+@pytest.mark.parametrize("lazy_parsing", [True, False])
+async def test_trapi_post_lazy_parsing_only_decodes_nodes(test_annotator: sanic.Sanic, monkeypatch, lazy_parsing: bool):
+    monkeypatch.setitem(test_annotator.config, "TRAPI_LAZY_PARSING", lazy_parsing)
+    nodes = {"NCBIGene:1017": {"categories": ["biolink:Gene"]}}
+    trapi_body = {
+        "message": {
+            "query_graph": {"nodes": {"n0": {"ids": ["NCBIGene:1017"]}}, "edges": {}},
+            "knowledge_graph": {"nodes": nodes, "edges": {"e0": {"subject": "NCBIGene:1017", "object": "x"}}},
+            "results": [{"node_bindings": {"n0": [{"id": "NCBIGene:1017"}]}}],
+        }
+    }
+    mock_annotation = AsyncMock(return_value=nodes)
+
+    with patch.object(Annotator, "annotate_trapi", mock_annotation):
+        _, response = await test_annotator.asgi_client.request(method="post", url="/trapi/", json=trapi_body)
+
+    assert response.status_code == 200
+    assert response.json == nodes
+    expected_body = {"message": {"knowledge_graph": {"nodes": nodes}}} if lazy_parsing else trapi_body
+    assert mock_annotation.await_args.args == (expected_body,)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+@pytest.mark.parametrize("lazy_parsing", [True, False])
+@pytest.mark.parametrize(
+    "malformed_body",
+    [
+        b'{"message": {"knowledge_graph": {"nodes": {"NCBIGene:1017": {}}, "edges": {"e0": {"subject": ',
+        b'{"message":{"knowledge_graph":{"nodes":{"NCBIGene:1":{}},"edges":{"e":tru}},"results":[1 2 3]}}',
+    ],
+)
+async def test_trapi_post_malformed_body(
+    test_annotator: sanic.Sanic, monkeypatch, lazy_parsing: bool, malformed_body: bytes
+):
+    monkeypatch.setitem(test_annotator.config, "TRAPI_LAZY_PARSING", lazy_parsing)
+    mock_annotation = AsyncMock(return_value={})
+
+    with patch.object(Annotator, "annotate_trapi", mock_annotation):
+        _, response = await test_annotator.asgi_client.request(
+            method="post", url="/trapi/", content=malformed_body, headers={"content-type": "application/json"}
+        )
+
+    assert response.status_code == 400
+    mock_annotation.assert_not_awaited()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+async def test_trapi_post_response_splicing(test_annotator: sanic.Sanic, monkeypatch):
+    monkeypatch.setitem(test_annotator.config, "TRAPI_LAZY_PARSING", True)
+    monkeypatch.setitem(test_annotator.config, "TRAPI_RESPONSE_SPLICING", True)
+    nodes = {"NCBIGene:1017": {"categories": ["biolink:Gene"]}, "NCBIGene:1018": {"attributes": [{"x": 1}]}}
+    trapi_body = {"message": {"knowledge_graph": {"nodes": nodes, "edges": {}}}}
+    annotations = {"NCBIGene:1017": {"_id": "1017"}}
+    mock_annotation = AsyncMock(return_value=(nodes, annotations))
+
+    with patch.object(Annotator, "annotate_trapi_nodes", mock_annotation):
+        _, response = await test_annotator.asgi_client.request(
+            method="post", url="/trapi/", params={"append": "true"}, json=trapi_body
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json == {
+        "NCBIGene:1017": {
+            "categories": ["biolink:Gene"],
+            "attributes": [{"attribute_type_id": "biothings_annotations", "value": {"_id": "1017"}}],
+        },
+        "NCBIGene:1018": {"attributes": [{"x": 1}]},
+    }
+
+
 @pytest.mark.unit
 @pytest.mark.asyncio(loop_scope="module")
 async def test_query_backend_omission_uses_deployment_default(test_annotator: sanic.Sanic, monkeypatch):
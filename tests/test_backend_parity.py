@@ -265,11 +265,45 @@ async def test_annotate_curie_backend_parity_for_raw_single_result_with_extra(mo
             }
         ]
         assert registry[backend]["extra"].query_calls == []
+        # the extra annotation query is trimmed to the requested fields
         assert registry[backend]["extra"].querymany_calls == [
             {
                 "query_list": ["CHEMBL123"],
                 "scopes": "_id",
-                "fields": "all",
+                "fields": fields,
+            }
+        ]
+
+
+@pytest.mark.asyncio
+async def test_annotate_curie_list_backend_parity_for_projected_derived_field(monkeypatch):
+    transformer.atc_cache.clear()
+    registry = make_client_registry()
+    install_fake_query_clients(monkeypatch, registry)
+
+    curies = ["CHEMBL.COMPOUND:CHEMBL123"]
+    fields = "chembl.molecule_chembl_id,atc_classifications"
+    biothings_result = await run_with_backend(
+        "biothings", "annotate_curie_list", curies, fields=fields, include_extra=False
+    )
+    elasticsearch_result = await run_with_backend(
+        "elasticsearch", "annotate_curie_list", curies, fields=fields, include_extra=False
+    )
+
+    assert elasticsearch_result == biothings_result
+    chembl_hit = elasticsearch_result["CHEMBL.COMPOUND:CHEMBL123"][0]
+    # the fields atc_classifications is derived from are fetched, then pruned
+    assert chembl_hit["chembl"]["molecule_chembl_id"] == "CHEMBL123"
+    assert "atc_classifications" not in chembl_hit["chembl"]
+    assert "pharmgkb" not in chembl_hit
+    assert chembl_hit["atc_classifications"][0]["level5"] == {"code": "A01AB02", "name": "Hydrogen peroxide"}
+
+    for backend in ("biothings", "elasticsearch"):
+        assert registry[backend]["chem"].querymany_calls == [
+            {
+                "query_list": ["CHEMBL123"],
+                "scopes": ANNOTATOR_CLIENTS["chem"]["scopes"],
+                "fields": ["chembl.molecule_chembl_id", "chembl.atc_classifications", "pharmgkb.xrefs.atc"],
             }
         ]
 
@@ -385,19 +419,45 @@ async def test_annotate_curie_list_backend_parity_for_duplicate_and_unsupported_
 
     assert elasticsearch_result == biothings_result
     assert list(elasticsearch_result) == ["NCBIGene:1017", "UNKNOWN:1"]
-    assert len(elasticsearch_result["NCBIGene:1017"]) == 4
+    assert len(elasticsearch_result["NCBIGene:1017"]) == 2
     assert elasticsearch_result["UNKNOWN:1"] == {}
 
     for backend in ("biothings", "elasticsearch"):
         assert registry[backend]["gene"].querymany_calls == [
             {
-                "query_list": ["1017", "1017"],
+                "query_list": ["1017"],
                 "scopes": BIOLINK_PREFIX_to_BioThings["NCBIGene"]["scopes"],
                 "fields": ANNOTATOR_CLIENTS["gene"]["fields"],
             }
         ]
 
 
+@pytest.mark.asyncio
+async def test_annotate_curie_list_backend_parity_for_curies_sharing_a_query_id(monkeypatch):
+    transformer.atc_cache.clear()
+    registry = make_client_registry()
+    install_fake_query_clients(monkeypatch, registry)
+
+    curies = ["PUBCHEM.COMPOUND:2244", "DRUGBANK:2244", "PUBCHEM.COMPOUND:2244"]
+    biothings_result = await run_with_backend("biothings", "annotate_curie_list", curies, raw=True)
+    elasticsearch_result = await run_with_backend("elasticsearch", "annotate_curie_list", curies, raw=True)
+
+    assert elasticsearch_result == biothings_result
+    assert list(elasticsearch_result) == ["PUBCHEM.COMPOUND:2244", "DRUGBANK:2244"]
+    pubchem_hit = elasticsearch_result["PUBCHEM.COMPOUND:2244"][0]
+    drugbank_hit = elasticsearch_result["DRUGBANK:2244"][0]
+    assert pubchem_hit["_id"] == drugbank_hit["_id"] == "PUBCHEM2244"
+    # extra annotations are appended to each curie on its own
+    assert pubchem_hit["extra_label"] == "canonical PubChem extra annotation"
+    assert "extra_label" not in drugbank_hit
+
+    for backend in ("biothings", "elasticsearch"):
+        assert [call["query_list"] for call in registry[backend]["chem"].querymany_calls] == [["2244"]]
+        assert [call["query_list"] for call in registry[backend]["extra"].querymany_calls] == [
+            ["PUBCHEM.COMPOUND:2244", "DRUGBANK:2244"]
+        ]
+
+
 @pytest.mark.asyncio
 async def test_annotate_curie_backend_parity_for_single_notfound(monkeypatch):
     transformer.atc_cache.clear()
@@ -485,3 +545,35 @@ async def test_annotate_trapi_backend_parity_for_attribute_shape(monkeypatch):
             ],
         }
     ]
+
+
+@pytest.mark.asyncio
+async def test_annotate_trapi_backend_parity_with_limit(monkeypatch):
+    transformer.atc_cache.clear()
+    registry = make_client_registry()
+    install_fake_query_clients(monkeypatch, registry)
+
+    trapi_input = {
+        "message": {
+            "knowledge_graph": {
+                "nodes": {
+                    "NCBIGene:1017": {},
+                    "UNKNOWN:1": {"attributes": []},
+                    "PUBCHEM.COMPOUND:2244": {},
+                    "MONDO:0005148": {},
+                }
+            }
+        }
+    }
+
+    biothings_result = await run_with_backend("biothings", "annotate_trapi", deepcopy(trapi_input), limit=3)
+    elasticsearch_result = await run_with_backend("elasticsearch", "annotate_trapi", deepcopy(trapi_input), limit=3)
+
+    assert elasticsearch_result == biothings_result
+    assert list(elasticsearch_result) == ["NCBIGene:1017", "UNKNOWN:1", "PUBCHEM.COMPOUND:2244"]
+    assert elasticsearch_result["UNKNOWN:1"] == {"attributes": []}
+    for backend in ("biothings", "elasticsearch"):
+        assert registry[backend]["disease"].querymany_calls == []
+
+    negative_limit_result = await run_with_backend("biothings", "annotate_trapi", deepcopy(trapi_input), limit=-1)
+    assert negative_limit_result == {}
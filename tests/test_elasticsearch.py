@@ -3,7 +3,9 @@ Exercises the Elasticsearch annotator backend.
 """
 
 import json
+import logging
 import os
+import time
 
 import httpx
 import pytest
@@ -18,7 +20,13 @@ from biothings_annotator.annotator.settings import (
     QUERY_BACKEND_ENV,
     SUPPORTED_QUERY_BACKENDS,
 )
-from biothings_annotator.annotator.utils import get_elasticsearch_client, get_elasticsearch_connection
+from biothings_annotator.annotator.utils import (
+    get_elasticsearch_client,
+    get_elasticsearch_connection,
+    group_by_subfield,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def test_annotator_can_switch_query_backend_by_assignment(monkeypatch):
@@ -406,6 +414,41 @@ async def test_elasticsearch_querymany_batches_input_terms():
     ]
 
 
+@pytest.mark.asyncio
+async def test_elasticsearch_querymany_grouped_matches_regrouped_querymany():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        lines = [json.loads(line) for line in request.content.decode().splitlines()]
+        query_ids = [line["query"]["bool"]["should"][0]["ids"]["values"][0] for line in lines if "query" in line]
+        responses = []
+        for query_id in query_ids:
+            if query_id == "0":
+                responses.append({"hits": {"hits": []}})
+                continue
+            hits = [{"_id": query_id, "_source": {"name": f"node-{query_id}"}}]
+            if query_id == "2":
+                hits.append({"_id": "2b", "_source": {"name": "node-2b"}})
+            responses.append({"hits": {"hits": hits}})
+        return httpx.Response(200, json={"responses": responses})
+
+    transport = httpx.MockTransport(handler)
+    async with httpx.AsyncClient(transport=transport) as http_client:
+        client = ElasticsearchAnnotatorClient(
+            "http://localhost:9200",
+            "gene",
+            query_batch_size=2,
+            http_client=http_client,
+        )
+        query_list = ["1", "2", "0", "1"]
+        grouped = await client.querymany_grouped(query_list, scopes="_id", fields=["name"])
+        flattened = await client.querymany(query_list, scopes="_id", fields=["name"])
+
+    assert grouped == group_by_subfield(flattened, search_key="query")
+    assert list(grouped) == ["1", "2", "0"]
+    assert grouped["0"] == [{"query": "0", "notfound": True}]
+    assert [hit["_id"] for hit in grouped["1"]] == ["1", "1"]
+    assert [hit["_id"] for hit in grouped["2"]] == ["2", "2b"]
+
+
 @pytest.mark.asyncio
 async def test_elasticsearch_query_accepts_size_and_skip():
     requests = []
@@ -723,6 +766,29 @@ async def test_query_annotations_keeps_biothings_default(monkeypatch):
     ]
 
 
+@pytest.mark.asyncio
+async def test_query_annotations_prefers_grouped_querymany(monkeypatch):
+    annotator = Annotator()
+    annotator.query_backend = "elasticsearch"
+    grouped_hits = {"1017": [{"query": "1017", "_id": "1017", "symbol": "CDK2"}]}
+
+    class FakeGroupingClient:
+        async def querymany(self, query_list, scopes, fields):
+            raise AssertionError("the grouped querymany should be used")
+
+        async def querymany_grouped(self, query_list, scopes, fields):
+            return grouped_hits
+
+    monkeypatch.setattr(
+        "biothings_annotator.annotator.annotator.get_query_client",
+        lambda node_type, query_backend, api_host, elasticsearch_connection: FakeGroupingClient(),
+    )
+
+    result = await annotator.query_annotations("gene", ["1017"], fields=["symbol"])
+
+    assert result is grouped_hits
+
+
 @pytest.mark.unit
 @pytest.mark.asyncio
 async def test_append_extra_annotations_skips_missing_query_client(monkeypatch):
@@ -776,3 +842,133 @@ async def test_append_extra_annotations_skips_querymany_failure(monkeypatch):
     await annotator.append_extra_annotations(node_d)
 
     assert node_d == {"CHEMBL.COMPOUND:CHEMBL123": [{"query": "CHEMBL123", "_id": "CHEMBL123"}]}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_elasticsearch_stand_in_querymany_matches_scopes_and_fields(elasticsearch_stand_in):
+    client = elasticsearch_stand_in.client("gene")
+    result = await client.querymany_grouped(
+        ["1017", "ENSG00000146648", "0"],
+        scopes=ANNOTATOR_CLIENTS["gene"]["elasticsearch_scopes"],
+        fields=["symbol", "ensembl.gene"],
+    )
+
+    assert result == {
+        "1017": [
+            {"symbol": "CDK2", "ensembl": {"gene": "ENSG00000123374"}, "_id": "1017", "_score": 1.0, "query": "1017"},
+            # matched through the retired scope
+            {
+                "symbol": "Cdk2",
+                "ensembl": {"gene": "ENSMUSG00000025358"},
+                "_id": "12566",
+                "_score": 1.0,
+                "query": "1017",
+            },
+        ],
+        "ENSG00000146648": [
+            {
+                "symbol": "EGFR",
+                "ensembl": [{"gene": "ENSG00000146648"}, {"gene": "LRG_304"}],
+                "_id": "1956",
+                "_score": 1.0,
+                "query": "ENSG00000146648",
+            }
+        ],
+        "0": [{"query": "0", "notfound": True}],
+    }
+    assert elasticsearch_stand_in.requests[("POST", "_msearch")] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.parametrize("pit_status", [None, 405])
+async def test_elasticsearch_stand_in_fetch_all(elasticsearch_stand_in, pit_status):
+    if pit_status is not None:
+        elasticsearch_stand_in.inject_failure("_pit", status=pit_status)
+    client = elasticsearch_stand_in.client("annotator_extra")
+
+    atc_hits = await client.query("_exists_:atc.code", fields="atc.code,atc.name", fetch_all=True, size=3)
+    atc_codes = [hit["atc"]["code"] async for hit in atc_hits]
+
+    assert atc_codes == ["N", "N02", "N02B", "N02BA", "N02BA01", "N02BE", "N02BE01"]
+    # point in time searches are closed, the offset fallback pages through the index search
+    assert elasticsearch_stand_in.point_in_times == {}
+    if pit_status is None:
+        assert elasticsearch_stand_in.requests[("DELETE", "_pit")] == 1
+    else:
+        assert elasticsearch_stand_in.requests[("POST", "_search")] == 3
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_elasticsearch_stand_in_injected_failures(elasticsearch_stand_in):
+    client = elasticsearch_stand_in.client("chem")
+
+    elasticsearch_stand_in.inject_failure("_msearch", status=503)
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.querymany(["CHEMBL25"], scopes=ANNOTATOR_CLIENTS["chem"]["scopes"])
+
+    elasticsearch_stand_in.inject_failure("_msearch", status=None, query_ids=["CHEMBL112"])
+    with pytest.raises(RuntimeError, match="CHEMBL112"):
+        await client.querymany(["CHEMBL25", "CHEMBL112"], scopes=ANNOTATOR_CLIENTS["chem"]["scopes"])
+
+    # the injected failures are used up
+    result = await client.querymany(["CHEMBL112"], scopes=ANNOTATOR_CLIENTS["chem"]["scopes"], fields="chebi.name")
+    assert result == [
+        {"chebi": {"name": "paracetamol"}, "_id": "RZVAJINKPMORJF-UHFFFAOYSA-N", "_score": 1.0, "query": "CHEMBL112"}
+    ]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_annotator_elasticsearch_backend_against_stand_in(elasticsearch_stand_in_backend):
+    annotator = Annotator(query_backend="elasticsearch")
+    annotator.elasticsearch_connection = "stand_in"
+
+    node_d = await annotator.annotate_curie_list(
+        ["NCBIGene:1017", "CHEMBL.COMPOUND:CHEMBL25", "MONDO:0005148", "HP:0002315", "MONDO:0000000"]
+    )
+
+    assert node_d["NCBIGene:1017"][0]["symbol"] == "CDK2"
+    assert node_d["MONDO:0005148"][0]["mondo"]["label"] == "type 2 diabetes mellitus"
+    assert node_d["HP:0002315"][0]["name"] == "Headache"
+    assert node_d["MONDO:0000000"] == [{"query": "MONDO:0000000", "notfound": True}]
+
+    aspirin = node_d["CHEMBL.COMPOUND:CHEMBL25"][0]
+    atc_levels = {atc["level5"]["code"]: atc["level5"]["name"] for atc in aspirin["atc_classifications"]}
+    assert atc_levels == {"N02BA01": "Acetylsalicylic acid", "B01AC06": ""}
+    assert aspirin["clinical_trials"] == [{"nctid": "NCT00000001", "phase": "Phase 4"}]
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio
+@pytest.mark.parametrize("latency", [0.0, 0.005])
+@pytest.mark.parametrize("query_count, query_batch_size", [(1000, 1000), (10000, 1000), (10000, 250)])
+async def test_elasticsearch_stand_in_querymany_throughput(
+    elasticsearch_stand_in, latency, query_count, query_batch_size
+):
+    elasticsearch_stand_in.latency = latency
+    elasticsearch_stand_in.add_documents(
+        "gene",
+        (
+            {"_id": str(gene_id), "_source": {"entrezgene": gene_id, "symbol": f"GENE{gene_id}"}}
+            for gene_id in range(100000, 150000)
+        ),
+    )
+    client = elasticsearch_stand_in.client("gene", query_batch_size=query_batch_size)
+    query_list = [str(gene_id) for gene_id in range(100000, 100000 + query_count)]
+
+    start = time.perf_counter()
+    result = await client.querymany_grouped(query_list, scopes=["entrezgene"], fields=["symbol"])
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        "querymany of %s ids in batches of %s with %ss latency: %.3fs, %.0f ids/s",
+        query_count,
+        query_batch_size,
+        latency,
+        elapsed,
+        query_count / elapsed,
+    )
+    assert len(result) == query_count
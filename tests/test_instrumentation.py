@@ -0,0 +1,117 @@
+"""
+Tests the per-stage spans and timings of the annotations
+"""
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from biothings_annotator.annotator import annotator as annotator_module
+from biothings_annotator.annotator import instrumentation
+from biothings_annotator.annotator.annotator import Annotator
+from biothings_annotator.annotator.instrumentation import collect_stage_timings, current_stage_timings, stage
+from biothings_annotator.annotator.planner import AnnotationPlan
+
+
+@pytest.fixture(scope="function")
+def span_exporter(monkeypatch) -> InMemorySpanExporter:
+    """
+    Records the stage spans in memory instead of the globally installed tracer provider
+    """
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(instrumentation, "_tracer", provider.get_tracer(instrumentation.__name__))
+    yield exporter
+    provider.shutdown()
+
+
+@pytest.mark.unit
+def test_stage_timings_are_collected_within_the_block():
+    assert current_stage_timings() is None
+    with collect_stage_timings() as timings:
+        assert current_stage_timings() is timings
+        for _ in range(2):
+            with stage("transform"):
+                pass
+        with pytest.raises(ValueError):
+            with stage("query"):
+                raise ValueError("backend failure")
+    assert current_stage_timings() is None
+
+    with stage("transform"):
+        pass
+
+    stage_timings = timings.as_dict()
+    assert set(stage_timings) == {"transform", "query"}
+    assert stage_timings["transform"]["count"] == 2
+    assert stage_timings["query"]["count"] == 1
+    assert all(stage_timing["duration"] >= 0.0 for stage_timing in stage_timings.values())
+
+
+@pytest.mark.unit
+def test_stage_span_attributes(span_exporter: InMemorySpanExporter):
+    with stage("query", node_type="gene", batch_size=3, query_backend=None) as span:
+        span.set_attribute("hits", 2)
+
+    (query_span,) = span_exporter.get_finished_spans()
+    assert query_span.name == "annotator.query"
+    assert dict(query_span.attributes) == {"node_type": "gene", "batch_size": 3, "hits": 2}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_annotation_stages(stand_in_backend, span_exporter: InMemorySpanExporter):
+    annotator = Annotator()
+    curie_list = ["NCBIGene:1017", "NCBIGene:1018", "CHEBI:15365", "MONDO:0005148", "UNSUPPORTED:1"]
+    with collect_stage_timings() as timings:
+        annotated_nodes = await annotator.annotate_curie_list(curie_list)
+
+    assert set(annotated_nodes) == set(curie_list)
+    assert {"plan", "query", "backend_call", "transform", "extra"} <= set(timings.as_dict())
+    (plan_summary,) = timings.plan_summaries()
+    assert plan_summary["curies"] == len(curie_list)
+    assert "curie_cache_hits" in plan_summary
+    assert set(timings.events) <= {"atc_cache_hits", "atc_cache_misses"}
+    assert sum(timings.events.values()) >= 1
+
+    spans = {}
+    for finished_span in span_exporter.get_finished_spans():
+        spans.setdefault(finished_span.name, []).append(finished_span)
+    (plan_span,) = spans["annotator.plan"]
+    assert plan_span.attributes["curies"] == len(curie_list)
+    assert plan_span.attributes["unsupported"] == 1
+    query_spans = {query_span.attributes["node_type"]: query_span for query_span in spans["annotator.query"]}
+    assert set(query_spans) == {"gene", "chem", "disease"}
+    assert query_spans["gene"].attributes["batch_size"] == 2
+    assert query_spans["gene"].attributes["hits"] > 0
+
+
+@pytest.mark.unit
+def test_plans_are_summarized_on_demand(monkeypatch, caplog):
+    explained = []
+    explain = AnnotationPlan.explain
+    monkeypatch.setattr(AnnotationPlan, "explain", lambda plan: explained.append(plan) or explain(plan))
+    monkeypatch.setattr(annotator_module, "ANNOTATION_PLAN_LOG_COST", float("inf"))
+    caplog.set_level("INFO", logger=annotator_module.__name__)
+
+    with collect_stage_timings() as timings:
+        plan = Annotator("biothings").plan_annotation(["NCBIGene:1017", "NCBIGene:1018"], include_extra=False)
+    assert explained == []
+
+    (plan_summary,) = timings.plan_summaries()
+    assert explained == [plan]
+    assert plan_summary == {**explain(plan), "curie_cache_hits": timings.plans[0][1]}
+
+
+@pytest.mark.unit
+def test_trapi_attribute_stage(span_exporter: InMemorySpanExporter):
+    node_d = {"NCBIGene:1017": {"attributes": []}}
+    annotations = {"NCBIGene:1017": [{"_id": "1017"}]}
+    Annotator.place_trapi_annotations(node_d, annotations, append=True)
+
+    (attribute_span,) = span_exporter.get_finished_spans()
+    assert attribute_span.name == "annotator.trapi_attributes"
+    assert attribute_span.attributes["nodes"] == 1
+    assert node_d["NCBIGene:1017"]["attributes"][0]["value"] == [{"_id": "1017"}]
@@ -0,0 +1,115 @@
+"""
+Tests the load generator against the application and stand-in backend
+"""
+
+from pathlib import Path
+from typing import Union
+import json
+
+import httpx
+import pytest
+import sanic
+
+from biothings_annotator.application.cli.loadgen import LoadGeneratorCLI
+from biothings_annotator.application.loadgen import (
+    BATCH_CURIE_QUERY,
+    CURIE_QUERY,
+    TRAPI_QUERY,
+    LoadGenerator,
+    load_workload,
+    parse_mix,
+)
+
+LOG_FILE = "cleaned_annotator_logs.json"
+
+
+def failing_trapi_transport() -> httpx.MockTransport:
+    def _handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.startswith("/trapi"):
+            return httpx.Response(503, json={"message": "Service unavailable"})
+        return httpx.Response(200, json={})
+
+    return httpx.MockTransport(_handler)
+
+
+@pytest.mark.unit
+def test_load_workload(temporary_data_storage: Union[str, Path]):
+    workload = load_workload(temporary_data_storage.joinpath(LOG_FILE))
+
+    assert {query_kind: len(queries) for query_kind, queries in workload.items()} == {
+        CURIE_QUERY: 187,
+        BATCH_CURIE_QUERY: 183,
+        TRAPI_QUERY: 39,
+    }
+    assert all(endpoint.startswith("/curie/") for _, endpoint, _ in workload[CURIE_QUERY])
+    assert all(endpoint.startswith("/trapi") for _, endpoint, _ in workload[TRAPI_QUERY])
+
+    assert parse_mix("curie=0.6, trapi=0.4") == {CURIE_QUERY: 0.6, TRAPI_QUERY: 0.4}
+    for invalid_mix in ("curie", "status=1", "trapi=-1"):
+        with pytest.raises(ValueError):
+            parse_mix(invalid_mix)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+async def test_load_generator_against_application(
+    temporary_data_storage: Union[str, Path], test_annotator: sanic.Sanic, stand_in_backend
+):
+    # the sanic_testing client starts the application, the load is sent through an ASGI transport
+    await test_annotator.asgi_client.request(method="get", url="/status/live")
+    load_generator = LoadGenerator(
+        base_url="http://annotator",
+        workload=load_workload(temporary_data_storage.joinpath(LOG_FILE)),
+        mix={CURIE_QUERY: 1, BATCH_CURIE_QUERY: 1},
+        concurrency=4,
+        transport=httpx.ASGITransport(app=test_annotator),
+        seed=0,
+    )
+    report = await load_generator.run(requests=30)
+
+    assert report["mode"] == "closed"
+    assert report["requests"] == 30
+    assert report["error_rate"] == 0.0
+    assert set(report["kinds"]) == {CURIE_QUERY, BATCH_CURIE_QUERY}
+    assert sum(kind["requests"] for kind in report["kinds"].values()) == 30
+    latency = report["latency"]
+    assert 0 < latency["p50"] <= latency["p90"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+    assert stand_in_backend.querymany_calls > 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_load_generator_open_loop(temporary_data_storage: Union[str, Path]):
+    load_generator = LoadGenerator(
+        base_url="http://annotator",
+        workload=load_workload(temporary_data_storage.joinpath(LOG_FILE)),
+        mix={CURIE_QUERY: 1, TRAPI_QUERY: 1},
+        concurrency=2,
+        rps=200,
+        transport=failing_trapi_transport(),
+        seed=0,
+    )
+    report = await load_generator.run(duration=10, requests=40)
+
+    assert report["mode"] == "open"
+    assert report["requests"] == 40
+    assert report["elapsed"] >= 39 / 200
+    trapi_report = report["kinds"][TRAPI_QUERY]
+    assert trapi_report["error_rate"] == 1.0
+    assert trapi_report["errors"] == {"status:503": trapi_report["requests"]}
+    assert report["kinds"][CURIE_QUERY]["error_rate"] == 0.0
+    assert report["error_rate"] == trapi_report["requests"] / 40
+
+
+@pytest.mark.unit
+def test_load_generator_cli(temporary_data_storage: Union[str, Path], tmp_path: Path):
+    report_file = tmp_path / "report.json"
+    arguments = [str(temporary_data_storage.joinpath(LOG_FILE)), "--requests", "20", "--output", str(report_file)]
+
+    load_generator_cli = LoadGeneratorCLI()
+    load_generator_cli.parse([*arguments, "--mix", "curie=1"])
+    assert load_generator_cli.run(transport=failing_trapi_transport()) == 0
+    assert json.loads(report_file.read_text())["requests"] == 20
+
+    load_generator_cli.parse([*arguments, "--mix", "trapi=1", "--max-error-rate", "0.5"])
+    assert load_generator_cli.run(transport=failing_trapi_transport()) == 1
@@ -0,0 +1,143 @@
+"""
+Tests the metrics registry and the /metrics endpoint
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+import pytest
+import sanic
+
+from biothings_annotator.annotator.annotator import Annotator
+from biothings_annotator.annotator.metrics import (
+    BACKEND_REQUEST_SIZE,
+    MetricsRegistry,
+    merge_snapshots,
+    render_prometheus,
+)
+from biothings_annotator.application.metrics import (
+    HTTP_REQUESTS_IN_FLIGHT,
+    export_worker_snapshot,
+    read_worker_snapshots,
+    worker_snapshot,
+)
+
+
+@pytest.mark.unit
+def test_render_prometheus():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    in_flight = registry.gauge("in_flight", "In-flight requests")
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    requests.inc(route='say "hi"')
+    requests.inc(2, route='say "hi"')
+    in_flight.set(3)
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.observe(value, route="curie")
+
+    assert render_prometheus(registry.snapshot()).splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="say \\"hi\\""} 3',
+        "# HELP in_flight In-flight requests",
+        "# TYPE in_flight gauge",
+        "in_flight 3",
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="curie",le="0.1"} 2',
+        'latency_seconds_bucket{route="curie",le="1"} 3',
+        'latency_seconds_bucket{route="curie",le="+Inf"} 4',
+        'latency_seconds_sum{route="curie"} 2.65',
+        'latency_seconds_count{route="curie"} 4',
+    ]
+
+    with pytest.raises(ValueError):
+        requests.inc(method="GET")
+
+
+@pytest.mark.unit
+def test_merge_snapshots():
+    def snapshot(requests: int, in_flight: int, age: float, latencies):
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests").inc(requests)
+        registry.gauge("in_flight", "In-flight requests").set(in_flight)
+        registry.gauge("loaded_at", "Load time", merge_mode="min").set(age)
+        registry.gauge("size", "Cache size", merge_mode="max").set(age)
+        latency = registry.histogram("latency_seconds", "Latency", buckets=(1.0,))
+        for value in latencies:
+            latency.observe(value)
+        return json.loads(json.dumps(registry.snapshot()))
+
+    merged = merge_snapshots([snapshot(2, 1, 10.0, [0.5]), snapshot(3, 4, 5.0, [0.5, 3.0])])
+    samples = {name: family["samples"] for name, family in merged.items()}
+    assert samples == {
+        "requests_total": [[[], 5.0]],
+        "in_flight": [[[], 5.0]],
+        "loaded_at": [[[], 5.0]],
+        "size": [[[], 10.0]],
+        "latency_seconds": [[[], [[2, 1], 4.0]]],
+    }
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_backend_call_metrics(stand_in_backend):
+    BACKEND_REQUEST_SIZE.clear()
+    await Annotator().annotate_curie_list(["NCBIGene:1017", "NCBIGene:1018", "MONDO:0005148"], include_extra=False)
+
+    sizes = {label_values: sample for label_values, sample in BACKEND_REQUEST_SIZE.samples.items()}
+    assert set(sizes) == {("biothings", "gene"), ("biothings", "disease")}
+    assert sizes[("biothings", "gene")][1] == 2
+    assert sum(sizes[("biothings", "gene")][0]) == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+async def test_metrics_endpoint(test_annotator: sanic.Sanic):
+    await test_annotator.asgi_client.request(method="get", url="/status/live")
+    _, response = await test_annotator.asgi_client.request(method="get", url="/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    metrics = response.text.splitlines()
+    assert "# TYPE annotator_http_request_duration_seconds histogram" in metrics
+    liveness_count = (
+        'annotator_http_request_duration_seconds_count{route="liveness_endpoint",method="GET",status="200"}'
+    )
+    assert any(line.startswith(liveness_count) for line in metrics)
+    assert 'annotator_http_requests_in_flight{route="metrics_endpoint"} 1' in metrics
+    assert "annotator_workers 1" in metrics
+    assert "# TYPE annotator_curie_cache_hit_ratio gauge" in metrics
+    assert "# TYPE annotator_scheduler_queue_depth gauge" in metrics
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+async def test_metrics_endpoint_aggregates_workers(test_annotator: sanic.Sanic, tmp_path: Path, monkeypatch):
+    monkeypatch.setitem(test_annotator.config, "METRICS_DIRECTORY", str(tmp_path))
+    other_worker = worker_snapshot(test_annotator)
+    other_worker["pid"] = os.getpid() + 1
+    other_worker["metrics"][HTTP_REQUESTS_IN_FLIGHT.name]["samples"] = [[["trapi_endpoint"], 7.0]]
+    tmp_path.joinpath(f"{other_worker['pid']}.json").write_text(json.dumps(other_worker))
+    stopped_worker = {**other_worker, "pid": os.getpid() + 2, "written_at": time.time() - 3600}
+    tmp_path.joinpath(f"{stopped_worker['pid']}.json").write_text(json.dumps(stopped_worker))
+
+    _, response = await test_annotator.asgi_client.request(method="get", url="/metrics")
+
+    assert response.status_code == 200
+    metrics = response.text.splitlines()
+    assert "annotator_workers 2" in metrics
+    assert 'annotator_http_requests_in_flight{route="trapi_endpoint"} 7' in metrics
+    # the scrape only reads the snapshot files, the worker file is left to the exporter
+    assert not tmp_path.joinpath(f"{os.getpid()}.json").exists()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+async def test_export_worker_snapshot(test_annotator: sanic.Sanic, tmp_path: Path):
+    snapshot = await export_worker_snapshot(test_annotator, str(tmp_path))
+
+    assert [path.name for path in tmp_path.iterdir()] == [f"{os.getpid()}.json"]
+    assert read_worker_snapshots(str(tmp_path), max_age=60) == [json.loads(json.dumps(snapshot))]
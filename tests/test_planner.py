@@ -0,0 +1,142 @@
+"""
+Tests the planning and execution stages of the /curie and /trapi annotations
+"""
+
+import asyncio
+
+import pytest
+
+from biothings_annotator.annotator import annotator as annotator_module
+from biothings_annotator.annotator.annotator import Annotator
+from biothings_annotator.annotator.planner import build_annotation_plan, estimate_query_cost
+from biothings_annotator.annotator.resolver import CurieResolver
+from biothings_annotator.annotator.settings import ANNOTATOR_QUERY_BATCH_COST, ANNOTATOR_QUERY_CHUNK_SIZE
+
+
+@pytest.mark.unit
+def test_estimate_query_cost_counts_ids_and_backend_calls():
+    assert estimate_query_cost(0) == 0
+    assert estimate_query_cost(1) == 1 + ANNOTATOR_QUERY_BATCH_COST
+    assert estimate_query_cost(ANNOTATOR_QUERY_CHUNK_SIZE + 1) == ANNOTATOR_QUERY_CHUNK_SIZE + 1 + (
+        2 * ANNOTATOR_QUERY_BATCH_COST
+    )
+
+
+@pytest.mark.unit
+def test_plan_batches_scope_groups_and_extra_node_ids():
+    resolver = CurieResolver("biothings")
+    curies = ["NCBIGene:1017", "ENSEMBL:ENSG00000123374", "PUBCHEM.COMPOUND:2244", "DRUGBANK:2244", "UNKNOWN:1"]
+    plan = build_annotation_plan(resolver, curies, raw=True, fields="_id")
+
+    assert [(batch.node_type, batch.query_ids) for batch in plan.batches] == [
+        ("gene", ["1017"]),
+        ("gene", ["ENSG00000123374"]),
+        ("chem", ["2244"]),
+    ]
+    assert plan.unsupported == ["UNKNOWN:1"]
+    assert plan.extra_node_ids == ["PUBCHEM.COMPOUND:2244", "DRUGBANK:2244"]
+    assert plan.estimated_cost == 3 * estimate_query_cost(1) + estimate_query_cost(2)
+
+    summary = plan.explain()
+    assert (summary["curies"], summary["query_ids"], summary["unsupported"]) == (5, 3, 1)
+    assert summary["transform"] is False
+    assert summary["batches"][2] == {
+        "node_type": "chem",
+        "scopes": resolver.scopes(plan.batches[2].scope_group.scope_key),
+        "fields": ["_id"],
+        "query_ids": 1,
+        "curies": 2,
+        "cost": estimate_query_cost(1),
+    }
+
+    plan = build_annotation_plan(resolver, curies, include_extra=False)
+    assert plan.extra_node_ids == []
+    assert plan.estimated_cost == 3 * estimate_query_cost(1)
+
+
+class ConcurrencyRecordingClient:
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def querymany(self, query_list, scopes, fields):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.001)
+        self.running -= 1
+        return [{"query": query_id, "_id": query_id} for query_id in query_list]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_execute_plan_runs_batches_concurrently_and_fans_out_aliases(monkeypatch):
+    client = ConcurrencyRecordingClient()
+    monkeypatch.setattr(annotator_module, "get_query_client", lambda **kwargs: client)
+    atc_loads = []
+
+    async def load_atc_mapping(self):
+        atc_loads.append(client.running)
+        return {}
+
+    monkeypatch.setattr(Annotator, "_load_atc_mapping", load_atc_mapping)
+
+    annotator = Annotator("biothings")
+    curies = ["NCBIGene:1017", "ENSEMBL:ENSG00000123374", "PUBCHEM.COMPOUND:2244", "DRUGBANK:2244"]
+    plan = annotator.plan_annotation(curies, include_extra=False)
+    node_d = await annotator.execute_plan(plan)
+
+    assert client.max_running == 3
+    assert list(node_d) == curies
+    assert node_d["DRUGBANK:2244"] is node_d["PUBCHEM.COMPOUND:2244"]
+    # the ATC mapping is prewarmed while the backend queries run, the chem
+    # transform then finds it loaded
+    assert len(atc_loads) == 2
+    assert atc_loads[0] > 0
+
+
+class ExtraAnnotationClient:
+    def __init__(self, extra_hits):
+        self.extra_hits = extra_hits
+
+    async def querymany(self, query_list, scopes, fields):
+        if scopes == "_id":
+            return [
+                (
+                    {"query": node_id, "_id": node_id, **self.extra_hits[node_id]}
+                    if node_id in self.extra_hits
+                    else {"query": node_id, "notfound": True}
+                )
+                for node_id in query_list
+            ]
+        return [{"query": query_id, "_id": query_id, "names": [query_id]} for query_id in query_list]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_extra_annotations_do_not_leak_across_aliases(monkeypatch):
+    client = ExtraAnnotationClient({"DRUGBANK:2244": {"drugbank": {"id": "DB00945"}}})
+    monkeypatch.setattr(annotator_module, "get_query_client", lambda **kwargs: client)
+
+    annotator = Annotator("biothings")
+    curies = ["PUBCHEM.COMPOUND:2244", "DRUGBANK:2244"]
+    plan = annotator.plan_annotation(curies, raw=True)
+    node_d = await annotator.execute_plan(plan)
+    shared = node_d["PUBCHEM.COMPOUND:2244"]
+    await annotator.append_extra_annotations(node_d, node_id_subset=plan.extra_node_ids)
+
+    assert node_d["PUBCHEM.COMPOUND:2244"] is shared
+    assert "drugbank" not in shared[0]
+    assert node_d["DRUGBANK:2244"] == [{**shared[0], "drugbank": {"id": "DB00945"}}]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_expensive_plans_are_logged(monkeypatch, caplog):
+    monkeypatch.setattr(annotator_module, "ANNOTATION_PLAN_LOG_COST", 10)
+    annotator = Annotator("biothings")
+
+    with caplog.at_level("INFO", logger=annotator_module.__name__):
+        annotator.plan_annotation(["NCBIGene:1017"], include_extra=False)
+
+    assert "Expensive annotation plan" in caplog.text
+    assert f"'estimated_cost': {estimate_query_cost(1)}" in caplog.text
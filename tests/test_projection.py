@@ -0,0 +1,61 @@
+"""
+Tests the field projection of the annotation queries
+"""
+
+import pytest
+
+from biothings_annotator.annotator.projection import ALL_FIELDS, project_extra_fields, project_fields
+from biothings_annotator.annotator.settings import ANNOTATOR_CLIENTS
+
+
+@pytest.mark.unit
+def test_projection_defaults_and_all_fields():
+    assert project_fields("gene", None).source_fields == ANNOTATOR_CLIENTS["gene"]["fields"]
+    assert project_fields("gene", "all").source_fields == ALL_FIELDS
+    assert project_fields("gene", ["symbol", "*"]).source_fields == ALL_FIELDS
+    assert project_extra_fields(None) == ALL_FIELDS
+    assert project_extra_fields("") == ALL_FIELDS
+
+
+@pytest.mark.unit
+def test_projection_drops_duplicate_and_covered_fields():
+    projection = project_fields("gene", "go.BP, symbol,go,symbol")
+
+    assert projection.source_fields == ["symbol", "go"]
+    assert projection.pruned_fields == ()
+    assert project_extra_fields("go.BP, symbol,go,symbol") == ["symbol", "go"]
+
+
+@pytest.mark.unit
+def test_projection_expands_and_prunes_derived_fields():
+    projection = project_fields("chem", ["pharmgkb", "atc_classifications"])
+
+    assert projection.source_fields == ["pharmgkb", "chembl.atc_classifications"]
+    assert [pruned_field.dotfield for pruned_field in projection.pruned_fields] == ["chembl.atc_classifications"]
+    # raw annotations are not transformed, derived fields are passed through
+    assert project_fields("chem", ["atc_classifications"], raw=True).source_fields == ["atc_classifications"]
+
+    res_by_id = {
+        "CHEMBL25": [
+            {
+                "_id": "CHEMBL25",
+                "chembl": [{"atc_classifications": "N02BA01"}, {"atc_classifications": "B01AC06", "x": 1}],
+                "pharmgkb": {"xrefs": {"atc": "N02BA01"}},
+                "atc_classifications": [{"level1": {"code": "N", "name": ""}}],
+            },
+            {"query": "CHEMBL25", "notfound": True},
+        ]
+    }
+    projection.prune(res_by_id)
+
+    assert res_by_id == {
+        "CHEMBL25": [
+            {
+                "_id": "CHEMBL25",
+                "chembl": [{"x": 1}],
+                "pharmgkb": {"xrefs": {"atc": "N02BA01"}},
+                "atc_classifications": [{"level1": {"code": "N", "name": ""}}],
+            },
+            {"query": "CHEMBL25", "notfound": True},
+        ]
+    }
@@ -0,0 +1,211 @@
+"""
+Offline replay benchmark of the annotator service
+
+Replays the user queries of cleaned_annotator_logs.json through the Sanic
+application against the deterministic StandInBackend (see fixtures/backend.py)
+with an injected backend latency, so the service itself is measured without a
+live backend. Reports the throughput, the p50/p95/p99 request latencies and the
+time spent per annotation stage as JSON:
+
+> ANNOTATOR_BENCHMARK_RESULTS: path the results are written to, a temporary
+  file by default
+> ANNOTATOR_BENCHMARK_BASELINE: results of a previous run, the p95 latency of
+  every run must stay within ANNOTATOR_BENCHMARK_TOLERANCE (1.5 by default)
+  times the baseline one
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+import asyncio
+import collections
+import functools
+import json
+import logging
+import os
+import time
+
+import httpx
+import pytest
+import sanic
+
+from biothings_annotator.annotator.annotator import Annotator
+from biothings_annotator.application.loadgen import LoadQuery, load_logged_queries, percentile
+
+from fixtures.backend import StandInBackend
+
+logger = logging.getLogger(__name__)
+
+# annotator methods timed as the stages of an annotation
+ANNOTATION_STAGES = {
+    "plan": "plan_annotation",
+    "query": "_query_batch",
+    "transform": "transform",
+    "extra": "append_extra_annotations",
+}
+
+
+def summarize_durations(durations: List[float]) -> Dict[str, float]:
+    sorted_durations = sorted(durations)
+    return {
+        "count": len(sorted_durations),
+        "total": sum(sorted_durations),
+        "p50": percentile(sorted_durations, 50),
+        "p95": percentile(sorted_durations, 95),
+        "p99": percentile(sorted_durations, 99),
+    }
+
+
+def time_annotation_stages(monkeypatch) -> Dict[str, List[float]]:
+    """
+    Wraps the annotator stage methods to collect their durations by stage
+    """
+    stage_durations = collections.defaultdict(list)
+
+    def _timed(stage: str, method: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(method):
+
+            @functools.wraps(method)
+            async def _timed_coroutine(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                finally:
+                    stage_durations[stage].append(time.perf_counter() - start)
+
+            return _timed_coroutine
+
+        @functools.wraps(method)
+        def _timed_method(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stage_durations[stage].append(time.perf_counter() - start)
+
+        return _timed_method
+
+    for stage, method_name in ANNOTATION_STAGES.items():
+        monkeypatch.setattr(Annotator, method_name, _timed(stage, getattr(Annotator, method_name)))
+    return stage_durations
+
+
+async def replay(application: sanic.Sanic, replay_queries: List[LoadQuery], concurrency: int) -> Dict:
+    """
+    Replays the queries with at most concurrency requests in flight, returns the
+    request latencies, status codes and the wall clock duration of the replay
+
+    The sanic_testing client runs the server startup and shutdown around every
+    request, so it only starts the application here. The queries themselves are
+    sent through an ASGI transport that can hold concurrent requests
+    """
+    await application.asgi_client.request(method="get", url="/status/live")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    status_codes = collections.Counter()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=application), base_url="http://annotator") as client:
+
+        async def _replay_query(method: str, endpoint: str, body: Optional[Dict]):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.request(method=method, url=endpoint, json=body, timeout=None)
+                latencies.append(time.perf_counter() - start)
+                status_codes[response.status_code] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(_replay_query(*replay_query) for replay_query in replay_queries))
+        elapsed = time.perf_counter() - start
+    return {"latencies": latencies, "status_codes": status_codes, "elapsed": elapsed}
+
+
+async def run_replay_benchmark(
+    application: sanic.Sanic,
+    backend: StandInBackend,
+    monkeypatch,
+    replay_queries: List[LoadQuery],
+    latency: float,
+    concurrency: int,
+) -> Dict:
+    backend.set_latency(latency)
+    with monkeypatch.context() as stage_patch:
+        stage_durations = time_annotation_stages(stage_patch)
+        replay_result = await replay(application, replay_queries, concurrency)
+
+    return {
+        "requests": len(replay_queries),
+        "backend_latency": latency,
+        "concurrency": concurrency,
+        "elapsed": replay_result["elapsed"],
+        "throughput": len(replay_queries) / replay_result["elapsed"] if replay_result["elapsed"] else 0.0,
+        "latency": summarize_durations(replay_result["latencies"]),
+        "stages": {stage: summarize_durations(durations) for stage, durations in stage_durations.items()},
+        "status_codes": {str(status): count for status, count in sorted(replay_result["status_codes"].items())},
+        "backend_calls": backend.querymany_calls,
+        "backend_query_ids": backend.query_ids,
+    }
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio(loop_scope="module")
+@pytest.mark.parametrize("data_store", ["cleaned_annotator_logs.json"])
+async def test_replay_benchmark_runs_offline(
+    temporary_data_storage: Union[str, Path],
+    test_annotator: sanic.Sanic,
+    stand_in_backend: StandInBackend,
+    monkeypatch,
+    data_store: str,
+):
+    """
+    Smoke test of the replay harness over the first logged queries
+    """
+    replay_queries = load_logged_queries(temporary_data_storage.joinpath(data_store))[:20]
+    results = await run_replay_benchmark(
+        test_annotator, stand_in_backend, monkeypatch, replay_queries, latency=0.0, concurrency=4
+    )
+
+    assert results["requests"] == results["latency"]["count"] == 20
+    assert sum(results["status_codes"].values()) == 20
+    assert all(int(status) < 500 for status in results["status_codes"])
+    assert results["backend_calls"] > 0
+    assert {"plan", "query", "transform"} <= set(results["stages"])
+    assert results["latency"]["p50"] <= results["latency"]["p95"] <= results["latency"]["p99"]
+
+
+@pytest.mark.performance
+@pytest.mark.asyncio(loop_scope="module")
+@pytest.mark.parametrize("data_store", ["cleaned_annotator_logs.json"])
+@pytest.mark.parametrize("latency, concurrency", [(0.0, 1), (0.005, 8), (0.05, 32)])
+async def test_replay_benchmark(
+    temporary_data_storage: Union[str, Path],
+    tmp_path: Path,
+    test_annotator: sanic.Sanic,
+    stand_in_backend: StandInBackend,
+    monkeypatch,
+    data_store: str,
+    latency: float,
+    concurrency: int,
+):
+    """
+    Replays the whole annotation log and records the benchmark results
+    """
+    replay_queries = load_logged_queries(temporary_data_storage.joinpath(data_store))
+    results = await run_replay_benchmark(
+        test_annotator, stand_in_backend, monkeypatch, replay_queries, latency=latency, concurrency=concurrency
+    )
+    run_key = f"latency={latency},concurrency={concurrency}"
+    logger.info("Replay benchmark %s: %s", run_key, json.dumps(results, indent=2))
+
+    results_file = Path(os.environ.get("ANNOTATOR_BENCHMARK_RESULTS", tmp_path / "replay_benchmark.json"))
+    recorded_results = json.loads(results_file.read_text()) if results_file.is_file() else {}
+    recorded_results[run_key] = results
+    results_file.write_text(json.dumps(recorded_results, indent=2))
+
+    assert all(int(status) < 500 for status in results["status_codes"])
+
+    baseline_file = os.environ.get("ANNOTATOR_BENCHMARK_BASELINE", None)
+    if baseline_file is not None:
+        baseline = json.loads(Path(baseline_file).read_text()).get(run_key, None)
+        if baseline is not None:
+            tolerance = float(os.environ.get("ANNOTATOR_BENCHMARK_TOLERANCE", 1.5))
+            assert results["latency"]["p95"] <= baseline["latency"]["p95"] * tolerance
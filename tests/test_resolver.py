@@ -0,0 +1,100 @@
+"""
+Tests the compiled CURIE resolver
+"""
+
+import pytest
+
+from biothings_annotator import BIOLINK_PREFIX_to_BioThings, utils
+from biothings_annotator.annotator.exceptions import InvalidCurieError
+from biothings_annotator.annotator.resolver import CurieResolver, curie_cache_stats, get_resolver, unquote_curie
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("query_backend", ["biothings", "elasticsearch"])
+@pytest.mark.parametrize("curie_prefix", [*BIOLINK_PREFIX_to_BioThings.keys(), "UNKNOWN"])
+def test_resolve_matches_parse_curie(curie_prefix: str, query_backend: str):
+    """
+    Tests the resolver agrees with parse_curie on node type and query id
+    """
+    curie = f"{curie_prefix}:1017"
+    resolved = get_resolver(query_backend).resolve(curie)
+
+    assert resolved.curie == curie
+    assert resolved.prefix == curie_prefix
+    assert (resolved.node_type, resolved.query_id) == utils.parse_curie(curie)
+
+
+@pytest.mark.unit
+def test_resolve_rejects_curie_without_prefix():
+    with pytest.raises(InvalidCurieError):
+        get_resolver("biothings").resolve("1017")
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("query_backend", ["biothings", "elasticsearch"])
+def test_resolve_many_partitions_by_type_and_scope_group(query_backend: str):
+    resolver = CurieResolver(query_backend)
+    curies = [
+        "NCBIGene:1017",
+        "ENSEMBL:ENSG00000123374",
+        "NCBIGene:1018",
+        "PUBCHEM.COMPOUND:2244",
+        "NCBIGene:1017",
+        "DRUGBANK:DB00945",
+        "UNKNOWN:1",
+    ]
+    plans, unsupported = resolver.resolve_many(curies)
+
+    assert unsupported == ["UNKNOWN:1"]
+    assert list(plans) == ["gene", "chem"]
+
+    gene_groups = list(plans["gene"].scope_groups.values())
+    assert [list(scope_group.curies()) for scope_group in gene_groups] == [
+        ["NCBIGene:1017", "NCBIGene:1018"],
+        ["ENSEMBL:ENSG00000123374"],
+    ]
+    assert resolver.scopes(gene_groups[0].scope_key) == resolver.scopes_for_prefix("gene", "NCBIGene")
+    assert resolver.scopes(gene_groups[1].scope_key) == resolver.scopes_for_prefix("gene", "ENSEMBL")
+
+    # prefixes without specific scopes share the node type's default scope group
+    (chem_group,) = plans["chem"].scope_groups.values()
+    assert chem_group.query_ids == ["2244", "DB00945"]
+    assert resolver.scopes(chem_group.scope_key) == resolver.default_scopes("chem")
+
+
+@pytest.mark.unit
+def test_scope_group_collapses_curies_sharing_a_query_id():
+    resolver = CurieResolver("biothings")
+    plans, _ = resolver.resolve_many(["PUBCHEM.COMPOUND:2244", "DRUGBANK:2244", "PUBCHEM.COMPOUND:2244", "UNII:2244"])
+
+    (chem_group,) = plans["chem"].scope_groups.values()
+    assert chem_group.query_ids == ["2244"]
+    assert chem_group.node_ids == {"2244": "PUBCHEM.COMPOUND:2244"}
+    assert chem_group.aliases_of("2244") == ["DRUGBANK:2244", "UNII:2244"]
+    assert list(plans["chem"].curies()) == ["PUBCHEM.COMPOUND:2244", "DRUGBANK:2244", "UNII:2244"]
+    assert len(chem_group) == 3
+
+
+@pytest.mark.unit
+def test_resolution_is_memoized_in_a_bounded_cache():
+    resolver = CurieResolver("biothings", cache_size=2)
+
+    first = resolver.resolve("NCBIGene:1017")
+    assert resolver.resolve("NCBIGene:1017") is first
+    resolver.resolve("NCBIGene:1018")
+    resolver.resolve("NCBIGene:1019")
+
+    stats = resolver.cache_stats()
+    assert (stats["hits"], stats["misses"], stats["size"], stats["maxsize"]) == (1, 3, 2, 2)
+    assert stats["hit_rate"] == 0.25
+
+
+@pytest.mark.unit
+def test_unquote_curie_is_memoized():
+    hits_before = curie_cache_stats()["unquote"]["hits"]
+    assert unquote_curie("NCBIGene%3A4242424") == "NCBIGene:4242424"
+    assert unquote_curie("NCBIGene%3A4242424") == "NCBIGene:4242424"
+    assert curie_cache_stats()["unquote"]["hits"] == hits_before + 1
+
+    with pytest.raises(UnicodeError):
+        unquote_curie("NCBIGene%3A%FF")
@@ -0,0 +1,86 @@
+"""
+Tests the cost-aware fair scheduling of the annotator backend queries
+"""
+
+import asyncio
+
+import pytest
+
+from biothings_annotator.annotator import annotator as annotator_module
+from biothings_annotator.annotator.annotator import Annotator
+from biothings_annotator.annotator.scheduler import FairQueryScheduler, SchedulerFlow
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_small_flow_overtakes_queued_bulk_chunks():
+    scheduler = FairQueryScheduler(max_concurrency=1, chunk_size=10, batch_cost=1)
+    bulk_flow = SchedulerFlow()
+    small_flow = SchedulerFlow()
+    dispatch_order = []
+
+    async def run_chunk(flow_name: str, flow: SchedulerFlow, cost: float):
+        async with scheduler.slot(flow, cost):
+            dispatch_order.append(flow_name)
+            await asyncio.sleep(0)
+
+    # The bulk request occupies the only slot and queues its remaining chunks
+    await scheduler.acquire(bulk_flow, 11)
+    bulk_chunks = [asyncio.ensure_future(run_chunk("bulk", bulk_flow, 11)) for _ in range(3)]
+    await asyncio.sleep(0)
+    small_chunk = asyncio.ensure_future(run_chunk("small", small_flow, 2))
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth == 4
+
+    scheduler.release()
+    await asyncio.gather(*bulk_chunks, small_chunk)
+
+    assert dispatch_order == ["small", "bulk", "bulk", "bulk"]
+    assert scheduler.active == 0
+    assert scheduler.queue_depth == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    scheduler = FairQueryScheduler(max_concurrency=1, chunk_size=10, batch_cost=1)
+    flow = SchedulerFlow()
+
+    await scheduler.acquire(flow, 1)
+    waiter = asyncio.ensure_future(scheduler.acquire(flow, 1))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    scheduler.release()
+    assert scheduler.active == 0
+    assert scheduler.queue_depth == 0
+
+
+class ChunkRecordingClient:
+    def __init__(self):
+        self.querymany_calls = []
+
+    async def querymany(self, query_list, scopes, fields):
+        self.querymany_calls.append(list(query_list))
+        # Finish later chunks first to check the hits are merged in request order
+        await asyncio.sleep(0.001 * (10 - len(self.querymany_calls)))
+        return [{"query": query_id, "_id": query_id} for query_id in query_list]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_query_annotations_chunks_large_query_lists(monkeypatch):
+    client = ChunkRecordingClient()
+    monkeypatch.setattr(annotator_module, "get_query_client", lambda **kwargs: client)
+    scheduler = FairQueryScheduler(max_concurrency=2, chunk_size=3, batch_cost=1)
+    monkeypatch.setattr(annotator_module, "get_scheduler", lambda: scheduler)
+
+    query_list = [str(query_id) for query_id in range(8)]
+    grouped_response = await Annotator(query_backend="biothings").query_annotations("gene", query_list)
+
+    assert client.querymany_calls == [["0", "1", "2"], ["3", "4", "5"], ["6", "7"]]
+    assert list(grouped_response) == query_list
+    assert grouped_response["7"] == [{"query": "7", "_id": "7"}]
+    assert scheduler.active == 0
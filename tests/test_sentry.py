@@ -0,0 +1,106 @@
+"""
+Tests the sentry traces sampling
+"""
+
+from types import SimpleNamespace
+
+import pytest
+import sentry_sdk
+import sanic
+from sentry_sdk.transport import Transport
+
+from biothings_annotator.application.listeners.sentry import build_traces_sampler
+from biothings_annotator.application.middleware.sentry import report_sentry_request
+
+ROUTE_SAMPLE_RATES = {"^/status": 0.0, "^/curie/[^/]+$": 0.01, "^/curie/?$": 0.2}
+
+
+def _sampling_context(path: str, parent_sampled=None, **custom_sampling_context):
+    return {"transaction_context": {"name": path}, "parent_sampled": parent_sampled, **custom_sampling_context}
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "path, sample_rate",
+    [
+        ("/status/ready", 0.0),
+        ("/curie/NCBIGene:1017", 0.01),
+        ("/curie/", 0.2),
+        ("/curie", 0.2),
+        ("/trapi/", 0.05),
+    ],
+)
+def test_traces_sampler_by_route(path: str, sample_rate: float):
+    traces_sampler = build_traces_sampler(ROUTE_SAMPLE_RATES, 0.05, large_request_bytes=1000)
+    assert traces_sampler(_sampling_context(path)) == sample_rate
+
+
+@pytest.mark.unit
+def test_traces_sampler_keeps_parent_decision_and_samples_large_requests():
+    traces_sampler = build_traces_sampler(ROUTE_SAMPLE_RATES, 0.05, large_request_bytes=1000)
+    assert traces_sampler(_sampling_context("/status", parent_sampled=True)) is True
+    assert traces_sampler(_sampling_context("/curie/", parent_sampled=False)) is False
+
+    large_request = SimpleNamespace(path="/curie/", headers={"content-length": "1000"})
+    small_request = SimpleNamespace(path="/curie/", headers={"content-length": "999"})
+    assert traces_sampler(_sampling_context("/curie/", sanic_request=large_request)) is True
+    assert traces_sampler(_sampling_context("/curie/", sanic_request=small_request)) == 0.2
+
+
+class RecordingTransport(Transport):
+    """
+    Keeps the envelope items sent by the sentry client
+    """
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.items = []
+
+    def capture_envelope(self, envelope):
+        self.items.extend(envelope.items)
+
+    def sent(self, item_type: str):
+        return [item.payload.json for item in self.items if item.type == item_type]
+
+
+@pytest.fixture(scope="function")
+def sentry_transport() -> RecordingTransport:
+    transport = RecordingTransport()
+    sentry_sdk.init(
+        dsn="https://key@sentry.invalid/1",
+        transport=transport,
+        traces_sample_rate=1.0,
+        default_integrations=False,
+        auto_enabling_integrations=False,
+    )
+    yield transport
+    sentry_sdk.init(default_integrations=False, auto_enabling_integrations=False)
+
+
+@pytest.mark.unit
+def test_report_sentry_request(sentry_transport: RecordingTransport):
+    request = SimpleNamespace(method="POST", path="/trapi/", headers={"content-length": "2000"}, route=None)
+
+    with sentry_sdk.start_transaction(name="/trapi/", sampled=False):
+        event_id = report_sentry_request(request, "slow_request", 12.5)
+    with sentry_sdk.start_transaction(name="/curie/", sampled=True):
+        assert report_sentry_request(request, "large_request", 0.1) is None
+    sentry_sdk.flush()
+
+    # the unsampled transaction is dropped, the slow request is reported as an event
+    (event,) = sentry_transport.sent("event")
+    assert event["event_id"] == event_id
+    assert event["message"] == "Slow request: POST /trapi/"
+    assert event["tags"]["request_reason"] == "slow_request"
+    assert event["extra"]["duration"] == 12.5
+    assert event["extra"]["content_length"] == 2000
+
+    (transaction,) = sentry_transport.sent("transaction")
+    assert transaction["transaction"] == "/curie/"
+    assert transaction["tags"]["request_reason"] == "large_request"
+
+
+@pytest.mark.unit
+def test_sentry_configuration_is_loaded(test_annotator: sanic.Sanic):
+    assert test_annotator.config.SENTRY_CLIENT_KEY == ""
+    assert test_annotator.config.SENTRY_ROUTE_SAMPLE_RATES["^/curie/[^/]+$"] == 0.01
@@ -1,9 +1,15 @@
 """Tests for OpenTelemetry configuration and request filtering."""
 
+import os
 from types import SimpleNamespace
 
 import pytest
 from opentelemetry.instrumentation.utils import is_instrumentation_enabled
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import StatusCode
+from sanic.compat import Header
 
 from biothings_annotator.application import telemetry
 from biothings_annotator.application.telemetry import telemetry_settings
@@ -67,3 +73,56 @@ async def test_start_request_span_applies_exclusions_after_route_match(monkeypat
     assert not is_instrumentation_enabled()
     await telemetry._finish_request_span(request, SimpleNamespace(status=200))
     assert is_instrumentation_enabled()
+
+
+def test_excluded_urls_are_combined_into_one_pattern():
+    settings = {"excluded_urls": ["^/$", "^/status(/live|/ready)?$", "^/webapp"]}
+
+    pattern = telemetry._excluded_url_pattern(settings)
+
+    assert settings["excluded_url_pattern"] is pattern
+    assert telemetry._excluded_url_pattern(settings) is pattern
+    assert all(pattern.search(path) for path in ("/", "/status", "/status/ready", "/webapp/index.html"))
+    assert not any(pattern.search(path) for path in ("/trapi/", "/curie/NCBIGene:1017", "/status/other"))
+    assert telemetry._excluded_url_pattern({"excluded_urls": []}) is None
+
+
+@pytest.mark.parametrize("sample_rate, expected", [("0.25", 0.25), ("2", 1.0)])
+def test_configure_telemetry_sample_rate(monkeypatch, sample_rate, expected):
+    monkeypatch.setenv("OPENTELEMETRY_ENABLED", "true")
+    monkeypatch.setenv("OPENTELEMETRY_SAMPLE_RATE", sample_rate)
+    application = SimpleNamespace(ctx=SimpleNamespace(), register_middleware=lambda middleware, attach_to: None)
+
+    assert telemetry.configure_telemetry(application, {"OPENTELEMETRY_EXCLUDED_URLS": ["^/version$"]})
+    settings = application.ctx.opentelemetry_settings
+    assert settings["sample_rate"] == expected
+    assert settings["excluded_url_pattern"].search("/version")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("trace_flags, recorded", [("01", True), ("00", False)])
+async def test_request_span_continues_the_propagated_trace(monkeypatch, trace_flags, recorded):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(telemetry, "_tracer", provider.get_tracer(telemetry.__name__))
+    monkeypatch.setattr(telemetry, "_initialized_pid", os.getpid())
+
+    trace_id = "0af7651916cd43dd8448eb211c80319c"
+    request = _request("/trapi/", object())
+    request.method = "POST"
+    request.scheme = "http"
+    request.host = "annotator:9000"
+    request.headers = Header({"TraceParent": f"00-{trace_id}-b7ad6b7169203331-{trace_flags}"})
+
+    await telemetry._start_request_span(request)
+    assert request.ctx.opentelemetry_span.get_span_context().trace_id == int(trace_id, 16)
+    await telemetry._finish_request_span(request, SimpleNamespace(status=503))
+
+    finished_spans = exporter.get_finished_spans()
+    assert len(finished_spans) == int(recorded)
+    if recorded:
+        (request_span,) = finished_spans
+        assert request_span.name == "POST /trapi/"
+        assert request_span.attributes["http.response.status_code"] == 503
+        assert request_span.status.status_code == StatusCode.ERROR
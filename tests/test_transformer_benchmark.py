@@ -0,0 +1,293 @@
+"""
+Offline microbenchmarks of the annotation parsing and post-processing hot paths
+
+Measures ResponseTransformer.transform, _transform_atc_classifications,
+group_by_subfield, parse_curie and the Elasticsearch hit formatting on
+synthetic batches of 1k, 10k and 100k documents, along with the full and lazy
+(TRAPI_LAZY_PARSING) decoding of TRAPI bodies holding as many nodes, or as many
+edges next to a few nodes. Every benchmark reports the
+operations per second of its best run and the peak allocation traced by
+tracemalloc, as JSON:
+
+> ANNOTATOR_BENCHMARK_RESULTS: path the results are written to, a temporary
+  file by default. The file is shared with the replay benchmark
+> ANNOTATOR_BENCHMARK_REPEATS: timed runs of every benchmark, 5 by default
+> ANNOTATOR_BENCHMARK_BASELINE: results of a previous run, every benchmark
+  must keep its operations per second above 1 / ANNOTATOR_BENCHMARK_TOLERANCE
+  (1.5 by default) times the baseline ones, and its peak allocation below
+  ANNOTATOR_BENCHMARK_TOLERANCE times the baseline one
+"""
+
+from pathlib import Path
+from typing import Callable, Dict, List
+import functools
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+import pytest
+
+from biothings_annotator.annotator.elasticsearch import ElasticsearchAnnotatorClient
+from biothings_annotator.annotator.transformer import ResponseTransformer
+from biothings_annotator.annotator.trapi import locate_trapi_nodes
+from biothings_annotator.annotator.utils import group_by_subfield, parse_curie
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_SIZES = (1000, 10000, 100000)
+CURIE_PREFIXES = ("NCBIGene", "ENSEMBL", "CHEBI", "PUBCHEM.COMPOUND", "MONDO", "DOID", "HP", "UMLS", "UNKNOWN")
+ATC_CODES = ("L04AB02", "A10BA02", "N02BE01", "C09AA05", "J01CA04", "B01AC06", "R03AC02", "M01AE01")
+
+
+def build_atc_cache() -> Dict[str, str]:
+    atc_cache = {}
+    for atc_code in ATC_CODES:
+        for level, code in enumerate((atc_code[0], atc_code[:3], atc_code[:4], atc_code[:5], atc_code)):
+            atc_cache[code] = f"level {level + 1} of {atc_code}"
+    return atc_cache
+
+
+def build_chem_doc(index: int) -> Dict:
+    """
+    A chem hit carrying the ATC codes and drug indications the transformer rewrites.
+    One in five hits lists chembl as a list, as some MyChem documents do
+    """
+    chembl = {
+        "molecule_chembl_id": f"CHEMBL{index}",
+        "atc_classifications": [ATC_CODES[index % len(ATC_CODES)], ATC_CODES[(index + 3) % len(ATC_CODES)]],
+        "drug_indications": [{"mesh_id": f"D{index:06d}", "efo_id": f"EFO:{index}", "max_phase_for_ind": 3}],
+    }
+    return {
+        "query": str(index // 2),
+        "_id": f"CHEMBL{index}",
+        "_score": 1.0,
+        "chembl": [chembl, {"molecule_chembl_id": f"CHEMBL{index}.1"}] if index % 5 == 0 else chembl,
+        "pharmgkb": {"xrefs": {"atc": ATC_CODES[(index + 1) % len(ATC_CODES)]}},
+    }
+
+
+def build_chem_docs(size: int) -> List[Dict]:
+    return [build_chem_doc(index) for index in range(size)]
+
+
+def build_res_by_id(docs: List[Dict]) -> Dict[str, List[Dict]]:
+    # two hits per query id, as the annotator groups them before transforming
+    return group_by_subfield(docs, "query")
+
+
+def build_curies(size: int) -> List[str]:
+    return [f"{CURIE_PREFIXES[index % len(CURIE_PREFIXES)]}:{index}" for index in range(size)]
+
+
+def build_elasticsearch_response(size: int) -> Dict:
+    hits = [
+        {"_index": "mychem", "_id": f"CHEMBL{index}", "_score": 1.0, "_source": build_chem_doc(index)}
+        for index in range(size)
+    ]
+    return {"took": 3, "hits": {"total": {"value": size}, "max_score": 1.0, "hits": hits}}
+
+
+def build_trapi_body(node_count: int, edge_count: int) -> bytes:
+    nodes = {
+        f"NCBIGene:{index}": {"categories": ["biolink:Gene"], "name": f"gene {index}", "attributes": []}
+        for index in range(node_count)
+    }
+    edges = {
+        f"e{index}": {
+            "subject": f"NCBIGene:{index % node_count}",
+            "object": f"NCBIGene:{(index + 1) % node_count}",
+            "predicate": "biolink:related_to",
+            "sources": [{"resource_id": "infores:biothings", "resource_role": "primary_knowledge_source"}],
+            "attributes": [{"attribute_type_id": "biolink:score", "value": index / 7, "original": None}],
+        }
+        for index in range(edge_count)
+    }
+    return json.dumps({"message": {"knowledge_graph": {"nodes": nodes, "edges": edges}, "results": []}}).encode()
+
+
+def build_benchmarks(size: int) -> Dict[str, Callable[[], Callable[[], object]]]:
+    """
+    The benchmarked operations over a batch of size documents, keyed by name.
+    Each entry prepares the inputs of one run and returns the operation to time
+    over them. The transformer rewrites the documents it is given in place, so
+    its runs get freshly built documents; the other operations only read theirs
+    """
+    atc_cache = build_atc_cache()
+    docs = build_chem_docs(size)
+    curies = build_curies(size)
+    elasticsearch_response = build_elasticsearch_response(size)
+    atc_transformer = ResponseTransformer(res_by_id={}, node_type="chem", api_host="", atc_cache=atc_cache)
+    trapi_bodies = {"nodes": build_trapi_body(size, 10), "edges": build_trapi_body(50, size)}
+
+    def _transform():
+        transformer = ResponseTransformer(
+            res_by_id=build_res_by_id(build_chem_docs(size)), node_type="chem", api_host="", atc_cache=atc_cache
+        )
+        return transformer.transform
+
+    def _transform_atc_classifications():
+        run_docs = build_chem_docs(size)
+
+        def _run():
+            for doc in run_docs:
+                atc_transformer._transform_atc_classifications(doc)
+
+        return _run
+
+    def _group_by_subfield():
+        return lambda: group_by_subfield(docs, "query")
+
+    def _parse_curie():
+        def _run():
+            for curie in curies:
+                parse_curie(curie)
+
+        return _run
+
+    def _format_elasticsearch_hits():
+        return lambda: ElasticsearchAnnotatorClient._format_query_response(elasticsearch_response)
+
+    def _parse_trapi(body: bytes, parse: Callable[[bytes], object]) -> Callable[[], Callable[[], object]]:
+        return lambda: functools.partial(parse, body)
+
+    benchmarks = {
+        "transform": _transform,
+        "transform_atc_classifications": _transform_atc_classifications,
+        "group_by_subfield": _group_by_subfield,
+        "parse_curie": _parse_curie,
+        "format_elasticsearch_hits": _format_elasticsearch_hits,
+    }
+    for body_kind, body in trapi_bodies.items():
+        benchmarks[f"parse_trapi_{body_kind}_full"] = _parse_trapi(body, json.loads)
+        benchmarks[f"parse_trapi_{body_kind}_lazy"] = _parse_trapi(body, locate_trapi_nodes)
+    return benchmarks
+
+
+def measure(prepare: Callable[[], Callable[[], object]], operations: int, repeats: int) -> Dict:
+    """
+    Times repeats runs of the operation returned by prepare, each processing
+    operations documents, then traces the allocations of one more run. The
+    inputs of every run are prepared before its timer starts
+    """
+    durations = []
+    for _ in range(repeats):
+        operation = prepare()
+        start = time.perf_counter()
+        operation()
+        durations.append(time.perf_counter() - start)
+
+    operation = prepare()
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(durations)
+    return {
+        "operations": operations,
+        "repeats": repeats,
+        "best": best,
+        "mean": sum(durations) / len(durations),
+        "ops_per_second": operations / best if best else float("inf"),
+        "peak_allocation": peak,
+        "allocation_per_operation": peak / operations,
+    }
+
+
+def find_regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """
+    Describes the benchmarks of results slower or allocating more than their
+    baseline by more than tolerance, see the module docstring
+    """
+    regressions = []
+    for run_key, result in results.items():
+        baseline_result = baseline.get(run_key, None)
+        if baseline_result is None:
+            continue
+        if result["ops_per_second"] * tolerance < baseline_result["ops_per_second"]:
+            regressions.append(
+                f"{run_key}: {result['ops_per_second']:.0f} ops/s against {baseline_result['ops_per_second']:.0f}"
+            )
+        if result["peak_allocation"] > baseline_result["peak_allocation"] * tolerance:
+            regressions.append(
+                f"{run_key}: {result['peak_allocation']} bytes allocated against {baseline_result['peak_allocation']}"
+            )
+    return regressions
+
+
+def run_benchmarks(size: int, repeats: int) -> Dict[str, Dict]:
+    return {
+        f"transformer:{name}[{size}]": measure(prepare, size, repeats)
+        for name, prepare in build_benchmarks(size).items()
+    }
+
+
+@pytest.mark.unit
+def test_transformer_benchmarks_run_offline():
+    """
+    Smoke test of the benchmark harness over a small batch
+    """
+    results = run_benchmarks(100, repeats=1)
+
+    assert set(results) == {
+        "transformer:transform[100]",
+        "transformer:transform_atc_classifications[100]",
+        "transformer:group_by_subfield[100]",
+        "transformer:parse_curie[100]",
+        "transformer:format_elasticsearch_hits[100]",
+        "transformer:parse_trapi_nodes_full[100]",
+        "transformer:parse_trapi_nodes_lazy[100]",
+        "transformer:parse_trapi_edges_full[100]",
+        "transformer:parse_trapi_edges_lazy[100]",
+    }
+    assert all(result["ops_per_second"] > 0 for result in results.values())
+    assert all(result["peak_allocation"] > 0 for result in results.values())
+
+    # the transformer runs rewrite their documents, every run gets its own
+    prepare_transform = build_benchmarks(10)["transform"]
+    assert prepare_transform().__self__.res_by_id is not prepare_transform().__self__.res_by_id
+
+    doc = build_chem_doc(1)
+    atc_transformer = ResponseTransformer(res_by_id={}, node_type="chem", api_host="", atc_cache=build_atc_cache())
+    atc_transformer._transform_atc_classifications(doc)
+    assert len(doc["atc_classifications"]) == 3
+
+    slower = {
+        run_key: {**result, "ops_per_second": result["ops_per_second"] / 2} for run_key, result in results.items()
+    }
+    assert find_regressions(results, results, tolerance=1.5) == []
+    assert len(find_regressions(slower, results, tolerance=1.5)) == len(results)
+    assert find_regressions(slower, results, tolerance=2.5) == []
+
+
+@pytest.mark.performance
+@pytest.mark.parametrize("size", BENCHMARK_SIZES)
+def test_transformer_benchmark(tmp_path: Path, size: int):
+    """
+    Runs the transformer benchmarks on a batch of size documents and records the results
+    """
+    repeats = int(os.environ.get("ANNOTATOR_BENCHMARK_REPEATS", 5))
+    results = run_benchmarks(size, repeats)
+    for run_key, result in results.items():
+        logger.info(
+            "%s: %.0f ops/s, %.1f KiB peak allocation",
+            run_key,
+            result["ops_per_second"],
+            result["peak_allocation"] / 1024,
+        )
+
+    results_file = Path(os.environ.get("ANNOTATOR_BENCHMARK_RESULTS", tmp_path / "transformer_benchmark.json"))
+    recorded_results = json.loads(results_file.read_text()) if results_file.is_file() else {}
+    recorded_results.update(results)
+    results_file.write_text(json.dumps(recorded_results, indent=2))
+
+    baseline_file = os.environ.get("ANNOTATOR_BENCHMARK_BASELINE", None)
+    if baseline_file is not None:
+        baseline = json.loads(Path(baseline_file).read_text())
+        tolerance = float(os.environ.get("ANNOTATOR_BENCHMARK_TOLERANCE", 1.5))
+        regressions = find_regressions(results, baseline, tolerance)
+        assert not regressions, "Benchmark regressions:\n" + "\n".join(regressions)
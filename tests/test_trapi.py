@@ -50,6 +50,7 @@ import logging
 import pytest
 
 from biothings_annotator import Annotator, utils
+from biothings_annotator.annotator.trapi import extract_trapi_nodes, locate_trapi_nodes, splice_trapi_nodes
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -267,3 +268,129 @@ async def test_append_and_raw(temporary_data_storage: Union[str, Path], data_sto
                         assert identifier is not None
                         score = values.get("_score", None)
                         assert score is not None
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("data_store", ["trapi_request.json"])
+def test_extract_trapi_nodes_matches_full_decoding(temporary_data_storage: Union[str, Path], data_store: str):
+    """
+    Tests the lazy node extraction against json.loads, with the nodes listed
+    after large edges and results holding brackets and escapes in strings
+    """
+    trapi_file = temporary_data_storage.joinpath(data_store)
+    with open(str(trapi_file), "r", encoding="utf-8") as file_descriptor:
+        trapi_data = json.load(file_descriptor)
+
+    knowledge_graph = trapi_data["message"]["knowledge_graph"]
+    knowledge_graph["edges"] = {
+        f"e{index}": {"subject": "a", "object": "b", "note": 'odd "} ] { [\\" text\u00e9', "score": -1.5e-3}
+        for index in range(100)
+    }
+    trapi_data["message"] = {
+        "results": [{"node_bindings": {"n0": [{"id": "x", "attributes": []}]}, "nodes": None}],
+        "knowledge_graph": {"edges": knowledge_graph["edges"], "nodes": knowledge_graph["nodes"]},
+        "query_graph": {"nodes": {"n0": {}}},
+    }
+
+    for body in (json.dumps(trapi_data), json.dumps(trapi_data, indent=2, ensure_ascii=False)):
+        assert extract_trapi_nodes(body.encode("utf-8")) == trapi_data["message"]["knowledge_graph"]["nodes"]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"",
+        b"[]",
+        b'{"message": {}}',
+        b'{"message": {"knowledge_graph": null}}',
+        b'{"message": {"knowledge_graph": {"nodes": []}}}',
+        b'{"message": {"knowledge_graph": {"nodes": {"n0": }}}}',
+        b'{"message": {"query_graph": {"unterminated": "}}}',
+        b'{"message": {"knowledge_graph": {"nodes": {"MONDO:0005148": {}}, "edges": {"e0": [1, 2, 3',
+        b'{"message": {"knowledge_graph": {"nodes": {"MONDO:0005148": {}}, "edges": {}}',
+        b'{"message": {"knowledge_graph": {"nodes": {"MONDO:0005148": {}} "edges": {}}}',
+        b'{"message": {"knowledge_graph": {"nodes": {"MONDO:0005148": {}}}}} trailing',
+        b'{"message": {"knowledge_graph": {"nodes": {"MONDO:0005148": {}}, "nodes": {}}}}',
+        b'{"message": {"knowledge_graph": {"nodes": {}}}, "message": {}}',
+    ],
+)
+def test_extract_trapi_nodes_rejects_unsupported_bodies(body: bytes):
+    assert extract_trapi_nodes(body) is None
+
+
+@pytest.mark.unit
+def test_extract_trapi_nodes_scans_content_after_the_nodes():
+    body = (
+        b'{"query_graph": {"a": [], "b": {}, "c": [[], [{}]]}, "message": {"knowledge_graph": {"nodes": {"MONDO:0005148":'
+        b' {}}, "edges": {"e0": [1, "]", -0.5e-3, true, false, null, NaN, -Infinity, "\\u00e9\\"\xc3\xa9"]}},'
+        b' "results": [{"x": 1}, [2, {"y": [3]}]]}}\n'
+    )
+    assert extract_trapi_nodes(body) == json.loads(body)["message"]["knowledge_graph"]["nodes"]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "skipped_section",
+    [
+        b'"edges": {"e": tru}',
+        b'"edges": {"e": "x"}, "results": [1 2 3]',
+        b'"edges": {"e" "x"}',
+        b'"edges": {"e": "x",}',
+        b'"edges": [1, 2,]',
+        b'"edges": [01]',
+        b'"edges": [1.]',
+        b'"edges": [+1]',
+        b'"edges": {"e": [1}}',
+        b'"edges": {"e": "a\tb"}',
+        b'"edges": {"e": "\\x"}',
+        b'"edges": {"e": "\xff"}',
+        b'"edges": {1: "x"}',
+        b'"edges": {"e": undefined}',
+    ],
+)
+def test_extract_trapi_nodes_rejects_malformed_skipped_sections(skipped_section: bytes):
+    """
+    Tests bodies json.loads rejects for the sections skipped around the nodes
+    are not extracted, so they are decoded whole and rejected as before
+    """
+    for body in (
+        b'{"message": {"knowledge_graph": {"nodes": {"NCBIGene:1": {}}, %s}}}' % skipped_section,
+        b'{"message": {"knowledge_graph": {%s, "nodes": {"NCBIGene:1": {}}}}}' % skipped_section,
+    ):
+        with pytest.raises(ValueError):
+            json.loads(body)
+        assert extract_trapi_nodes(body) is None
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("append", [True, False])
+def test_splice_trapi_nodes_matches_placed_annotations(append: bool):
+    """
+    Tests the spliced response against the annotations placed into the decoded
+    nodes, for every shape of attributes the annotations can be placed in
+    """
+    body = (
+        b'{"message": {"knowledge_graph": {"nodes": {\n'
+        b'  "NCBIGene:1017": {"categories": ["biolink:Gene"], "attributes": [{"attribute_type_id": "x"}]},\n'
+        b'  "NCBIGene:1018": {"attributes": [ ]},\n'
+        b'  "NCBIGene:1019": {"attributes": null, "name": "a \\"}\\" name"},\n'
+        b'  "NCBIGene:\\u00e9": { },\n'
+        b'  "NCBIGene:1020": {"name": "not annotated"}\n'
+        b'}, "edges": {}}}}'
+    )
+    nodes, nodes_span = locate_trapi_nodes(body)
+    annotations = {node_id: {"_id": node_id, "symbol": "\u00e9"} for node_id in nodes if node_id != "NCBIGene:1020"}
+
+    response_body = splice_trapi_nodes(body, nodes_span, nodes, annotations, append)
+    assert json.loads(response_body) == Annotator.place_trapi_annotations(nodes, annotations, append=append)
+
+
+@pytest.mark.unit
+def test_splice_trapi_nodes_rejects_unplaceable_attributes():
+    body = b'{"message": {"knowledge_graph": {"nodes": {"NCBIGene:1017": {"attributes": {}}, "n1": []}}}}'
+    nodes, nodes_span = locate_trapi_nodes(body)
+
+    assert splice_trapi_nodes(body, nodes_span, ["NCBIGene:1017"], {"NCBIGene:1017": {}}, True) is None
+    assert splice_trapi_nodes(body, nodes_span, ["n1"], {"n1": {}}, False) is None
+    assert json.loads(splice_trapi_nodes(body, nodes_span, ["n1"], {}, False)) == {"n1": []}
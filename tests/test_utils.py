@@ -0,0 +1,43 @@
+"""
+Tests the annotator utility methods
+"""
+
+import pytest
+
+from biothings_annotator.annotator.utils import compile_dotfield, get_dotfield_value
+
+
+@pytest.mark.unit
+def test_get_dotfield_value_follows_the_path():
+    trapi_input = {"message": {"knowledge_graph": {"nodes": {"n0": {}}}}}
+
+    assert get_dotfield_value("message.knowledge_graph.nodes", trapi_input) == {"n0": {}}
+    assert get_dotfield_value("message", trapi_input) is trapi_input["message"]
+    with pytest.raises(KeyError):
+        get_dotfield_value("message.results", trapi_input)
+
+
+@pytest.mark.unit
+def test_compiled_dotfield_is_shared():
+    dotfield_path = compile_dotfield("chembl.drug_indications.mesh_id")
+
+    assert dotfield_path is compile_dotfield("chembl.drug_indications.mesh_id")
+    assert dotfield_path.keys == ("chembl", "drug_indications", "mesh_id")
+
+
+@pytest.mark.unit
+def test_dotfield_values_fan_out_lists():
+    doc = {
+        "chembl": [
+            {"atc_classifications": "L04AB02"},
+            {"atc_classifications": ["A01AB02", "B01AC06"]},
+            {"molecule_chembl_id": "CHEMBL25"},
+            "not a document",
+        ],
+        "pharmgkb": {"xrefs": {"atc": None}},
+    }
+
+    assert list(compile_dotfield("chembl.atc_classifications").values(doc)) == ["L04AB02", "A01AB02", "B01AC06"]
+    assert list(compile_dotfield("pharmgkb.xrefs.atc").values(doc)) == [None]
+    assert list(compile_dotfield("unii.ncit").values(doc)) == []
+    assert list(compile_dotfield("chembl").values([doc, {"chembl": {"x": 1}}])) == [*doc["chembl"], {"x": 1}]